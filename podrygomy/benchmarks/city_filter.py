@@ -0,0 +1,60 @@
+# Сравнение фильтра магазинов по городу:
+# старый вариант выгружал идентификаторы всех улиц города и передавал их в IN (...),
+# новый фильтрует через JOIN по street_id__city_id, витрина ShopListing - по своему столбцу city_id без JOIN.
+import argparse
+
+from benchmarks import common
+
+
+def seed(streets, shops_per_street):
+    from tutorials import listing
+    from tutorials.models import City, Shops, Street
+
+    city = City.objects.create(name='Big city')
+    City.objects.create(name='Small city')
+    Street.objects.bulk_create(Street(name=f'Street {number}', city_id=city) for number in range(streets))
+    street_ids = Street.objects.filter(city_id=city).values_list('id', flat=True)
+    Shops.objects.bulk_create(
+        Shops(name=f'Shop {number}', street_id_id=street_id, house=str(number), open_minute=8 * 60, close_minute=22 * 60)
+        for street_id in street_ids
+        for number in range(shops_per_street)
+    )
+    listing.rebuild()
+    return city
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--streets', type=int, default=20000)
+    parser.add_argument('--shops-per-street', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    common.setup()
+    from tutorials.models import ShopListing, Shops, Street
+
+    with common.test_database():
+        city = seed(args.streets, args.shops_per_street)
+        shops = Shops.objects.select_related('street_id__city_id')
+
+        def before():
+            streets = Street.objects.filter(city_id=city.id)
+            streets_id_list = [streets.id for streets in streets]
+            return list(shops.filter(street_id__in=streets_id_list))
+
+        def after():
+            return list(shops.filter(street_id__city_id=city.id))
+
+        def listing():
+            return list(ShopListing.objects.filter(city_id=city.id))
+
+        assert len(before()) == len(after()) == len(listing())
+        common.report(f'Shops by city ({args.streets} streets)', {
+            'IN (street ids)': common.measure(before, args.repeat),
+            'JOIN street_id__city_id': common.measure(after, args.repeat),
+            'ShopListing city_id': common.measure(listing, args.repeat),
+        })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+# Размер ответа GET /api/shop в обычном и колоночном формате (без сжатия и с gzip)
+# и время разбора ответа клиентом (json.loads и восстановление списка объектов из столбцов).
+import argparse
+import gzip
+import json
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.test import Client
+    from tutorials.columnar import decode_columns
+
+    with common.test_database():
+        seed(args.shops)
+        client = Client()
+        plain = client.get('/api/shop').content
+        columnar = client.get('/api/shop?format=columnar').content
+
+        results = {
+            'json': common.measure(lambda: json.loads(plain), args.repeat),
+            'columnar': common.measure(lambda: json.loads(columnar), args.repeat),
+            'columnar + decode': common.measure(lambda: decode_columns(json.loads(columnar)), args.repeat),
+        }
+        for name, content in (('json', plain), ('columnar', columnar), ('columnar + decode', columnar)):
+            results[name]['size_kb'] = round(len(content) / 1024, 1)
+            results[name]['gzip_kb'] = round(len(gzip.compress(content)) / 1024, 1)
+        common.report(f'GET /api/shop, parsing on the client ({args.shops} shops)', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# Общие утилиты для бенчмарков.
+# Бенчмарки запускаются из каталога podrygomy, например:
+#   SQL_ENGINE=django.db.backends.sqlite3 python -m benchmarks.city_filter
+# Для каждого запуска создается отдельная тестовая база, рабочая база не затрагивается.
+import contextlib
+import logging
+import os
+import statistics
+import time
+import tracemalloc
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'podrygomy.settings')
+    django.setup()
+    # Вывод логов в консоль на каждый запрос искажает замеры
+    logging.disable(logging.CRITICAL)
+
+
+@contextlib.contextmanager
+def test_database():
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+class QueryCounter:
+    # Считает запросы через execute_wrapper: CaptureQueriesContext теряет запросы,
+    # потому что журнал запросов очищается в начале каждого запроса тестового клиента
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextlib.contextmanager
+def count_queries():
+    from django.db import connection
+
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        yield counter
+
+
+# Ответы API кэшируются, для замера полной обработки запроса кэш сбрасывается перед каждым вызовом
+def clear_caches():
+    from django.core.cache import cache
+
+    cache.clear()
+
+
+def measure(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'best_ms': min(timings) * 1000,
+        'median_ms': statistics.median(timings) * 1000,
+        'peak_kb': peak / 1024,
+    }
+
+
+def report(title, results):
+    print(title)
+    for name, result in results.items():
+        line = '  {:<24} best {best_ms:10.2f} ms   median {median_ms:10.2f} ms   peak {peak_kb:12.1f} KiB'
+        extra = ''.join(f'   {key} {value}' for key, value in result.items()
+                        if key not in ('best_ms', 'median_ms', 'peak_kb'))
+        print(line.format(name, **result) + extra)
@@ -0,0 +1,78 @@
+# Сравнение двух результатов benchmarks/suite.py (--output), например до и после изменения:
+#   python -m benchmarks.compare before.json after.json --threshold 10
+# Для каждого режима и эндпоинта выводится изменение медианы, p95, пропускной способности, запросов к БД и памяти.
+# Ухудшение больше --threshold процентов (или рост числа запросов) помечается "!", с --fail в этом случае
+# команда завершается с кодом 1 - так сравнение можно запускать в CI.
+import argparse
+import json
+import sys
+
+# Показатель и True, если рост значения - это ухудшение
+METRICS = (
+    ('median_ms', True),
+    ('p95_ms', True),
+    ('throughput_rps', False),
+    ('queries', True),
+    ('peak_kb', True),
+)
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before, after, threshold):
+    regressions = []
+    lines = []
+    for mode, endpoints in after['results'].items():
+        lines.append(mode)
+        for name, result in endpoints.items():
+            previous = before['results'].get(mode, {}).get(name)
+            if previous is None:
+                lines.append(f'  {name:<14} new')
+                continue
+            cells = []
+            for metric, higher_is_worse in METRICS:
+                if metric not in result or metric not in previous:
+                    continue
+                percent = change(previous[metric], result[metric])
+                worse = percent is not None and (percent if higher_is_worse else -percent) > threshold
+                if metric == 'queries':
+                    worse = (result[metric] or 0) > (previous[metric] or 0)
+                mark = '!' if worse else ' '
+                if worse:
+                    regressions.append((mode, name, metric))
+                shown = '     n/a' if percent is None else f'{percent:+7.1f}%'
+                cells.append(f'{metric} {previous[metric]} -> {result[metric]} ({shown}){mark}')
+            lines.append(f'  {name:<14} ' + '   '.join(cells))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10, help='regression threshold in percent')
+    parser.add_argument('--fail', action='store_true', help='exit with status 1 if there are regressions')
+    args = parser.parse_args()
+
+    with open(args.before) as file:
+        before = json.load(file)
+    with open(args.after) as file:
+        after = json.load(file)
+
+    print(f'{before["meta"]["commit"]} ({before["meta"]["database"]}) -> '
+          f'{after["meta"]["commit"]} ({after["meta"]["database"]})')
+    if before['meta']['params'] != after['meta']['params']:
+        print('Warning: runs used different parameters')
+    lines, regressions = compare(before, after, args.threshold)
+    print('\n'.join(lines))
+    print(f'{len(regressions)} regressions over {args.threshold:g}%')
+    if regressions and args.fail:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
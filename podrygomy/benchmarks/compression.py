@@ -0,0 +1,48 @@
+# Размер и время ответа GET /api/shop без сжатия, с gzip и с brotli (если установлен) через тестовый клиент.
+# transfer_ms - оценка времени передачи тела по каналу --mbit Мбит/с, total_ms - обработка плюс передача.
+import argparse
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mbit', type=float, default=100)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.test import Client
+    from tutorials import middleware
+
+    encodings = ['identity', 'gzip']
+    if middleware.brotli is not None:
+        encodings.append('br')
+
+    with common.test_database():
+        seed(args.shops)
+        client = Client()
+
+        for query in ('', '?stream=1'):
+            results = {}
+            for encoding in encodings:
+                def get(encoding=encoding):
+                    common.clear_caches()
+                    response = client.get('/api/shop' + query, HTTP_ACCEPT_ENCODING=encoding)
+                    if response.streaming:
+                        return sum(len(chunk) for chunk in response.streaming_content)
+                    return len(response.content)
+
+                result = common.measure(get, args.repeat)
+                size = get()
+                result['size_kb'] = round(size / 1024, 1)
+                result['transfer_ms'] = round(size * 8 / (args.mbit * 1000), 1)
+                result['total_ms'] = round(result['best_ms'] + result['transfer_ms'], 1)
+                results[encoding] = result
+            common.report(f'GET /api/shop{query} ({args.shops} shops, {args.mbit:g} Mbit/s)', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Задержка запроса в зависимости от настройки соединений с БД:
+#   fresh      - CONN_MAX_AGE = 0, новое соединение на каждый запрос
+#   persistent - CONN_MAX_AGE = 60, соединение потока живет между запросами
+#   pool       - SQL_POOL_SIZE, соединение возвращается в пул процесса (tutorials/pool.py)
+# Каждый режим запускается в отдельном процессе: настройки БД читаются из окружения при импорте settings.
+# Запросы подаются в WSGIHandler, как в benchmarks/load_test.py: тестовый клиент Django не закрывает соединения
+# в конце запроса. Кэш ответов обходится уникальным параметром, иначе запрос не обращается к БД.
+# Стоит запускать на PostgreSQL, где открытие соединения - это сетевое подключение и аутентификация:
+#   SQL_ENGINE=django.db.backends.postgresql python -m benchmarks.connections
+# На SQLite (файловая база) открытие соединения дешевле, и разница между режимами меньше.
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import common
+from benchmarks.load_test import wsgi_get
+from benchmarks.streaming import seed
+
+MODES = {
+    'fresh': {'SQL_CONN_MAX_AGE': '0', 'SQL_POOL_SIZE': '0'},
+    'persistent': {'SQL_CONN_MAX_AGE': '60', 'SQL_POOL_SIZE': '0'},
+    'pool': {'SQL_POOL_SIZE': '4'},
+}
+
+
+def run_mode(mode, args):
+    common.setup()
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.db import connection
+    from django.db.backends.signals import connection_created
+
+    if connection.vendor == 'sqlite':
+        # Соединения с базой в памяти Django не закрывает, поэтому тестовая база - файл
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'connections.sqlite3')
+
+    # connection_created отправляется и при выдаче соединения из пула, открытые соединения различаются по объекту
+    opened = set()
+    connection_created.connect(lambda sender, connection, **kwargs: opened.add(connection.connection))
+    handler = WSGIHandler()
+    numbers = iter(range(10 ** 9))
+
+    def request():
+        status, _ = wsgi_get(handler, '/api/city', f'n={next(numbers)}')
+        assert status.startswith('200'), status
+
+    with common.test_database():
+        seed(args.shops, streets=10)
+        connection.close()
+        opened.clear()
+        result = common.measure(request, repeat=args.requests)
+        result['connections'] = len(opened)
+        common.report(f'{mode} ({connection.settings_dict["ENGINE"]})', {'GET /api/city': result})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--mode', choices=MODES, help='run a single mode in this process')
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args)
+        return
+
+    print(f'{args.requests} GET /api/city requests, per-request latency')
+    for mode, env in MODES.items():
+        subprocess.run([sys.executable, '-m', 'benchmarks.connections', '--mode', mode,
+                        '--shops', str(args.shops), '--requests', str(args.requests)],
+                       env=dict(os.environ, **env), check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# Генератор тестовых данных: N городов, M улиц и K магазинов.
+# Данные воспроизводимы: при одинаковых параметрах и --seed получается одна и та же база.
+# Города получают разные часовые пояса, улицы и магазины распределяются по городам неравномерно
+# (как в жизни - в больших городах больше улиц), часы работы магазинов включают круглосуточные,
+# ночные (после полуночи) и нерабочие окна.
+# Отдельный запуск заполняет рабочую базу из настроек:
+#   python -m benchmarks.data --cities 50 --streets 5000 --shops 200000
+import argparse
+import random
+
+from benchmarks import common
+
+TIMEZONES = ('Europe/Samara', 'Europe/Moscow', 'Europe/Kaliningrad', 'Asia/Yekaterinburg', 'Asia/Novosibirsk',
+             'Asia/Vladivostok')
+
+# (открытие, закрытие) в часах и доля магазинов с такими часами работы
+HOURS = (((8, 22), 50), ((9, 18), 20), ((0, 24), 10), ((22, 2), 10), ((10, 10), 5), ((7, 23), 5))
+
+BATCH_SIZE = 10000
+
+
+def generate(cities, streets, shops, seed=0, batch_size=BATCH_SIZE):
+    from tutorials import listing
+    from tutorials.models import City, Shops, Street, opening_window
+
+    rng = random.Random(seed)
+    City.objects.bulk_create(City(name=f'City {number}', timezone=TIMEZONES[number % len(TIMEZONES)])
+                             for number in range(cities))
+    city_ids = list(City.objects.order_by('id').values_list('id', flat=True))
+    # Вес города убывает с номером: первый город самый большой
+    weights = [1 / (number + 1) for number in range(len(city_ids))]
+
+    for start in range(0, streets, batch_size):
+        Street.objects.bulk_create(Street(name=f'Street {number}', city_id_id=city_id)
+                                   for number, city_id in zip(range(start, min(start + batch_size, streets)),
+                                                              rng.choices(city_ids, weights, k=batch_size)))
+    street_ids = list(Street.objects.order_by('id').values_list('id', flat=True))
+
+    windows = [opening_window(open_hour * 60, close_hour * 60) for (open_hour, close_hour), _ in HOURS]
+    shares = [share for _, share in HOURS]
+    for start in range(0, shops, batch_size):
+        count = min(start + batch_size, shops) - start
+        Shops.objects.bulk_create(
+            # Название не длиннее 10 символов (Shops.name)
+            Shops(name=f'S{number}', street_id_id=street_id, house=str(rng.randint(1, 200)),
+                  open_minute=window[0], close_minute=window[1])
+            for number, street_id, window in zip(range(start, start + count), rng.choices(street_ids, k=count),
+                                                 rng.choices(windows, shares, k=count))
+        )
+    # bulk_create не отправляет сигналы, витрина ShopListing собирается один раз после вставки
+    listing.rebuild()
+    return {'cities': cities, 'streets': streets, 'shops': shops, 'seed': seed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cities', type=int, default=20)
+    parser.add_argument('--streets', type=int, default=2000)
+    parser.add_argument('--shops', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.db import transaction
+
+    with transaction.atomic():
+        generate(args.cities, args.streets, args.shops, args.seed)
+    print(f'Created {args.cities} cities, {args.streets} streets and {args.shops} shops')
+
+
+if __name__ == '__main__':
+    main()
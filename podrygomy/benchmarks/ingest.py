@@ -0,0 +1,63 @@
+# Загрузка магазинов: по одному POST /api/shop на магазин против одного POST со списком.
+# Помимо времени выводится число запросов к БД, для POST по одному - с кэшем поиска города и улицы и без него.
+import argparse
+
+from benchmarks import common
+
+
+def shops(count, cities, streets):
+    return [{'name': f'Shop {number}', 'street_id': f'Street {number % streets}', 'city': f'City {number % cities}',
+             'house': str(number), 'open_time': 8, 'close_time': 22}
+            for number in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=2000)
+    parser.add_argument('--cities', type=int, default=10)
+    parser.add_argument('--streets', type=int, default=100)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.conf import settings
+    from django.test import Client
+    from tutorials import lookups
+    from tutorials.models import City, Shops, Street
+
+    items = shops(args.shops, args.cities, args.streets)
+    client = Client()
+
+    def clean():
+        Shops.objects.all().delete()
+        Street.objects.all().delete()
+        City.objects.all().delete()
+
+    def one_by_one():
+        for item in items:
+            client.post('/api/shop', item, content_type='application/json')
+
+    def bulk():
+        client.post('/api/shop', items, content_type='application/json')
+
+    with common.test_database():
+        results = {}
+        scenarios = (('POST per shop, no cache', one_by_one, 0),
+                     ('POST per shop', one_by_one, settings.LOOKUP_CACHE_SIZE),
+                     ('bulk POST', bulk, settings.LOOKUP_CACHE_SIZE))
+        for name, func, cache_size in scenarios:
+            lookups.city_cache.maxsize = lookups.street_cache.maxsize = cache_size
+            clean()
+            lookups.clear_lookup_caches()
+            with common.count_queries() as queries:
+                func()
+            results[name] = {'queries': queries.count}
+            for cache_name, lookup_cache in (('city', lookups.city_cache), ('street', lookups.street_cache)):
+                results[name].update((f'{cache_name}_{key}', value) for key, value in lookup_cache.stats().items())
+            clean()
+            lookups.clear_lookup_caches()
+            results[name].update(common.measure(lambda: (func(), clean(), lookups.clear_lookup_caches()), repeat=1))
+        common.report(f'Ingest of {args.shops} shops', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+# Скорость кодирования списка магазинов в JSON (10 000 и 100 000 строк):
+# JsonResponse со стандартным json против кодировщиков из renderers.py.
+import argparse
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.http.response import JsonResponse
+    from tutorials import renderers
+    from tutorials.models import City, ShopListing
+    from tutorials.readers import shop_reader
+
+    with common.test_database():
+        seed(max(args.sizes))
+        now = {timezone_name: 12 * 60 for timezone_name in City.objects.values_list('timezone', flat=True)}
+        all_rows = shop_reader.rows(ShopListing.objects.annotate_open(now))
+
+        encoders = {'JsonResponse': lambda rows: JsonResponse(rows, safe=False).content,
+                    'json': renderers.StdlibJSONRenderer().dumps}
+        if renderers.orjson is not None:
+            encoders['orjson'] = renderers.OrjsonRenderer().dumps
+
+        for size in args.sizes:
+            rows = all_rows[:size]
+            results = {}
+            for name, encode in encoders.items():
+                result = common.measure(lambda: encode(rows), args.repeat)
+                megabytes = len(encode(rows)) / 1024 / 1024
+                result['size_mb'] = round(megabytes, 2)
+                result['mb_per_s'] = round(megabytes / result['best_ms'] * 1000, 1)
+                results[name] = result
+            common.report(f'JSON encoding ({size} shops)', results)
+
+
+if __name__ == '__main__':
+    main()
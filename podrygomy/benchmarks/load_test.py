@@ -0,0 +1,125 @@
+# Нагрузочный тест: пропускная способность и задержки при параллельных GET-запросах
+# к синхронным представлениям под WSGI и к асинхронным (tutorials/async_views.py) под ASGI.
+# Запросы подаются прямо в WSGIHandler и ASGIHandler Django, без HTTP-сервера:
+# под WSGI --concurrency потоков, как у многопоточного сервера, под ASGI столько же одновременных задач
+# в одном цикле событий, как у uvicorn с одним процессом.
+# БД - из настроек (SQL_ENGINE и др.), для сравнения с реальной нагрузкой стоит запускать на PostgreSQL:
+#   SQL_ENGINE=django.db.backends.postgresql python -m benchmarks.load_test
+# С --cold к каждому запросу добавляется уникальный параметр, и кэш ответов не срабатывает.
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import statistics
+import time
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+URLS = ('/api/city', '/api/street?city_id=1', '/api/shop?open=1', '/api/shop?limit=100')
+
+
+def wsgi_get(handler, path, query):
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+               'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'HTTP_HOST': 'localhost',
+               'wsgi.input': io.BytesIO(), 'wsgi.url_scheme': 'http'}
+    statuses = []
+    response = handler(environ, lambda status, headers: statuses.append(status))
+    try:
+        size = sum(len(chunk) for chunk in response)
+    finally:
+        response.close()
+    return statuses[0], size
+
+
+async def asgi_get(application, path, query):
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+             'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+             'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80)}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    size = sum(len(message.get('body', b'')) for message in messages if message['type'] == 'http.response.body')
+    return messages[0]['status'], size
+
+
+def requests(total, cold):
+    for number in range(total):
+        path, _, query = URLS[number % len(URLS)].partition('?')
+        if cold:
+            query += f'&n={number}'
+        yield path, query
+
+
+def run_wsgi(total, concurrency, cold):
+    from django.core.handlers.wsgi import WSGIHandler
+
+    handler = WSGIHandler()
+
+    def timed(path, query):
+        started = time.perf_counter()
+        wsgi_get(handler, path, query)
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(lambda item: timed(*item), requests(total, cold)))
+    return time.perf_counter() - started, latencies
+
+
+def run_asgi(total, concurrency, cold):
+    from django.core.handlers.asgi import ASGIHandler
+
+    application = ASGIHandler()
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed(path, query):
+            async with semaphore:
+                started = time.perf_counter()
+                await asgi_get(application, path, query)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(timed(path, query) for path, query in requests(total, cold)))
+        return time.perf_counter() - started, latencies
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--cold', action='store_true', help='bypass the response cache')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.test.utils import override_settings
+
+    with common.test_database():
+        seed(args.shops)
+        print(f'{args.requests} GET requests over {", ".join(URLS)} ({args.shops} shops, '
+              f'{"cold" if args.cold else "warm"} response cache)')
+        for concurrency in args.concurrency:
+            for mode, urlconf, run in (('WSGI', 'podrygomy.urls', run_wsgi),
+                                       ('ASGI', 'podrygomy.async_urls', run_asgi)):
+                common.clear_caches()
+                with override_settings(ROOT_URLCONF=urlconf):
+                    elapsed, latencies = run(args.requests, concurrency, args.cold)
+                latencies = sorted(latencies)
+                print('  {:<4} concurrency {:>3}   {:8.1f} req/s   p50 {:8.2f} ms   p95 {:8.2f} ms'.format(
+                    mode, concurrency, len(latencies) / elapsed, statistics.median(latencies) * 1000,
+                    latencies[int(len(latencies) * 0.95) - 1] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+# Накладные расходы MetricsMiddleware (tutorials/metrics.py): время запросов через тестовый клиент
+# с замерами и без них. Маленький список городов - худший случай, когда сам запрос почти ничего не стоит;
+# --cold обходит кэш ответов, чтобы запросы к БД проходили через обертку, которая их считает.
+import argparse
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+URLS = ('/api/city', '/api/shop?limit=100', '/api/shop')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--cold', action='store_true', help='bypass the response cache')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.conf import settings
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    without_metrics = [name for name in settings.MIDDLEWARE if name != 'tutorials.middleware.MetricsMiddleware']
+
+    with common.test_database():
+        seed(args.shops)
+        for url in URLS:
+            results = {}
+            for name, middleware in (('without metrics', without_metrics), ('with metrics', settings.MIDDLEWARE)):
+                with override_settings(MIDDLEWARE=middleware):
+                    client = Client()
+
+                    def get():
+                        if args.cold:
+                            common.clear_caches()
+                        client.get(url)
+
+                    get()
+                    results[name] = common.measure(get, args.repeat)
+            common.report(f'GET {url} ({args.shops} shops, {"cold" if args.cold else "warm"} cache)', results)
+
+
+if __name__ == '__main__':
+    main()
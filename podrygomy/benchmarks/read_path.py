@@ -0,0 +1,44 @@
+# Пропускная способность чтения списков (строк в секунду), запрос к БД и сборка списка словарей:
+# сериализаторы DRF (ShopsSerializer, StreetSerializer) против чтения через values_list (readers.py,
+# магазины - из витрины ShopListing).
+import argparse
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=50000)
+    parser.add_argument('--streets', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    common.setup()
+    from tutorials.models import City, ShopListing, Shops, Street
+    from tutorials.readers import shop_reader, street_reader
+    from tutorials.serializers import ShopsSerializer, StreetSerializer
+
+    with common.test_database():
+        seed(args.shops, streets=args.streets)
+        now = {timezone_name: 12 * 60 for timezone_name in City.objects.values_list('timezone', flat=True)}
+        shops = Shops.objects.annotate_open(now)
+        listing = ShopListing.objects.annotate_open(now)
+        streets = Street.objects.all()
+
+        results = {
+            'shops: ShopsSerializer': common.measure(
+                lambda: ShopsSerializer(shops.select_related('street_id__city_id'), many=True).data, args.repeat),
+            'shops: shop_reader': common.measure(lambda: shop_reader.rows(listing), args.repeat),
+            'streets: StreetSerializer': common.measure(
+                lambda: StreetSerializer(streets.select_related('city_id'), many=True).data, args.repeat),
+            'streets: street_reader': common.measure(lambda: street_reader.rows(streets), args.repeat),
+        }
+        for name, result in results.items():
+            rows = args.shops if name.startswith('shops') else args.streets
+            result['rows_per_s'] = int(rows / result['best_ms'] * 1000)
+        common.report(f'Read path ({args.shops} shops, {args.streets} streets)', results)
+
+
+if __name__ == '__main__':
+    main()
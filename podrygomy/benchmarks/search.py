@@ -0,0 +1,67 @@
+# Поиск магазинов по названию (GET /api/shop?q=, tutorials/search.py) на таблицах разного размера.
+# Для каждого размера - время поиска с началом названия, с опечаткой и без результатов, и для сравнения
+# полный перебор: чтение всех названий и фильтр в Python, как раньше делал клиент.
+# Время поиска должно расти медленнее размера таблицы (колонка growth - во сколько раз выросло время
+# при переходе от предыдущего размера). Ответы не берутся из кэша: к каждому запросу добавляется уникальный параметр.
+# На SQLite отдельно показано построение индекса в памяти (при первом поиске и раз в SEARCH_INDEX_MAX_AGE секунд):
+#   SQL_ENGINE=django.db.backends.sqlite3 python -m benchmarks.search --sizes 10000 100000
+import argparse
+import itertools
+
+from benchmarks import common
+from benchmarks.data import generate
+
+# Название замера и запрос; магазины в benchmarks/data.py называются S0, S1, ...
+QUERIES = (
+    ('prefix', 'S1234'),
+    ('typo', 'S12x34'),
+    ('no match', 'Magnit'),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test import Client
+    from tutorials import search
+    from tutorials.models import ShopListing
+
+    numbers = itertools.count()
+    previous = {}
+    with common.test_database():
+        client = Client()
+        for size in args.sizes:
+            call_command('flush', interactive=False, verbosity=0)
+            generate(cities=10, streets=max(size // 50, 10), shops=size)
+
+            def get(query):
+                response = client.get('/api/shop', {'q': query, 'n': next(numbers)})
+                assert response.status_code == 200, response.content
+
+            results = {}
+            if connection.vendor != 'postgresql':
+                search.clear_indexes()
+                results['index build'] = common.measure(
+                    lambda: search.NameIndex(ShopListing.objects.values_list('id', 'name').iterator()), 3)
+            get(QUERIES[0][1])
+            for name, query in QUERIES:
+                results[name] = common.measure(lambda: get(query), args.repeat)
+            results['full scan'] = common.measure(
+                lambda: [name for name in ShopListing.objects.values_list('name', flat=True) if 'S1234' in name],
+                args.repeat)
+
+            for name, result in results.items():
+                if name in previous:
+                    result['growth'] = round(result['median_ms'] / previous[name], 1)
+                previous[name] = result['median_ms']
+            common.report(f'Search in {size} shops ({connection.vendor})', results)
+
+
+if __name__ == '__main__':
+    main()
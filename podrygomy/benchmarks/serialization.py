@@ -0,0 +1,37 @@
+# Пропускная способность сериализации списка магазинов (строк в секунду):
+# флаг open, посчитанный в Python для каждой строки, против флага из SQL (annotate_open).
+import argparse
+import datetime
+
+from benchmarks import common
+from benchmarks.streaming import seed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    common.setup()
+    from tutorials.models import Shops
+    from tutorials.serializers import ShopsSerializer
+
+    with common.test_database():
+        seed(args.shops)
+        # Объекты загружаются заранее, замеряется только сериализация
+        shops = list(Shops.objects.select_related('street_id__city_id'))
+        annotated = list(Shops.objects.select_related('street_id__city_id')
+                         .annotate_open(datetime.datetime.now().hour * 60))
+
+        results = {
+            'open per row in Python': common.measure(lambda: ShopsSerializer(shops, many=True).data, args.repeat),
+            'open from SQL': common.measure(lambda: ShopsSerializer(annotated, many=True).data, args.repeat),
+        }
+        for result in results.values():
+            result['rows_per_s'] = int(args.shops / result['best_ms'] * 1000)
+        common.report(f'ShopsSerializer(many=True) ({args.shops} shops)', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Пиковая память и время выдачи всех магазинов: обычный JsonResponse против ?stream=1.
+# Обычный ответ держит в памяти все объекты и весь JSON, потоковый - только одну порцию.
+import argparse
+
+from benchmarks import common
+
+
+def seed(shops, streets=1000, batch_size=10000):
+    from tutorials import listing
+    from tutorials.models import City, Shops, Street
+
+    city = City.objects.create(name='City')
+    Street.objects.bulk_create(Street(name=f'Street {number}', city_id=city) for number in range(streets))
+    street_ids = list(Street.objects.values_list('id', flat=True))
+    for start in range(0, shops, batch_size):
+        Shops.objects.bulk_create(
+            Shops(name=f'Shop {number}', street_id_id=street_ids[number % len(street_ids)], house=str(number % 100),
+                  open_minute=8 * 60, close_minute=22 * 60)
+            for number in range(start, min(start + batch_size, shops))
+        )
+    # bulk_create не отправляет сигналы, витрина ShopListing собирается один раз после вставки
+    listing.rebuild()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shops', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--skip-plain', action='store_true', help='measure only the streaming response')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.test import Client
+
+    with common.test_database():
+        seed(args.shops)
+        client = Client()
+
+        def plain():
+            common.clear_caches()
+            return len(client.get('/api/shop').content)
+
+        def streamed():
+            common.clear_caches()
+            return sum(len(chunk) for chunk in client.get('/api/shop?stream=1').streaming_content)
+
+        results = {}
+        if not args.skip_plain:
+            results['JsonResponse'] = common.measure(plain, args.repeat)
+        results['stream=1'] = common.measure(streamed, args.repeat)
+        common.report(f'GET /api/shop ({args.shops} shops)', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+# Набор замеров API на сгенерированных данных (benchmarks/data.py): по каждому эндпоинту задержка
+# (best, median, p95), пропускная способность, число запросов к БД, пиковая память и размер ответа.
+# Два режима:
+#   client - тестовый клиент Django, запросы по одному в этом же процессе; память и запросы к БД считаются
+#            по одному запросу;
+#   server - локальный HTTP-сервер Django (тот же, что у runserver) в этом процессе и --concurrency
+#            потоков-клиентов; запросы к БД - среднее на запрос по метрикам tutorials/metrics.py.
+# По умолчанию к каждому запросу добавляется уникальный параметр, и кэш ответов не срабатывает (--warm - срабатывает).
+# Промежуточные значения (версии таблиц, часовые пояса городов) остаются в кэше, как у работающего сервера.
+# Результаты сохраняются в JSON (--output) и сравниваются между коммитами benchmarks/compare.py:
+#   SQL_ENGINE=django.db.backends.sqlite3 python -m benchmarks.suite --output before.json
+#   SQL_ENGINE=django.db.backends.sqlite3 python -m benchmarks.suite --output after.json
+#   python -m benchmarks.compare before.json after.json
+# Работает без сети, на SQLite (тестовая база создается файлом) или на локальном PostgreSQL.
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+
+from benchmarks import common
+from benchmarks.data import generate
+
+# Название эндпоинта и адрес, {city_id} - первый (самый большой) город
+ENDPOINTS = (
+    ('city', '/api/city'),
+    ('street', '/api/street?city_id={city_id}'),
+    ('shop', '/api/shop'),
+    ('shop_open', '/api/shop?open=1'),
+    ('shop_city', '/api/shop?city={city_id}'),
+    ('shop_page', '/api/shop?limit=100'),
+    ('shop_columnar', '/api/shop?format=columnar'),
+    ('shop_stream', '/api/shop?stream=1'),
+)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, int(round(len(values) * fraction)) - 1)]
+
+
+def summary(latencies, elapsed):
+    return {
+        'requests': len(latencies),
+        'best_ms': round(min(latencies) * 1000, 3),
+        'median_ms': round(statistics.median(latencies) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+    }
+
+
+# Номера для уникальных адресов, общие для обоих режимов: ответы, закэшированные в одном режиме,
+# не должны попадаться в другом
+_numbers = itertools.count()
+
+
+# Адрес очередного запроса: с --warm всегда один и тот же, иначе с уникальным параметром
+def addresses(url, warm):
+    while True:
+        yield url if warm else '%s%sn=%s' % (url, '&' if '?' in url else '?', next(_numbers))
+
+
+def run_client(urls, repeat, warm):
+    from django.test import Client
+
+    client = Client()
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
+
+    results = {}
+    for name, url in urls:
+        requests = addresses(url, warm)
+        get(next(requests))
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            request_started = time.perf_counter()
+            get(next(requests))
+            latencies.append(time.perf_counter() - request_started)
+        result = summary(latencies, time.perf_counter() - started)
+
+        with common.count_queries() as counter:
+            size = get(next(requests))
+        tracemalloc.start()
+        try:
+            get(next(requests))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result.update(queries=counter.count, peak_kb=round(peak / 1024, 1), size_kb=round(size / 1024, 1))
+        results[name] = result
+    return results
+
+
+class LiveServer:
+    def __init__(self):
+        from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+        self.httpd.set_app(get_internal_wsgi_application())
+        self.url = 'http://127.0.0.1:%s' % self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run_server(urls, repeat, concurrency, warm):
+    from tutorials import metrics
+
+    results = {}
+    with LiveServer() as server:
+        def get(url):
+            started = time.perf_counter()
+            with urllib.request.urlopen(server.url + url) as response:
+                size = len(response.read())
+            return time.perf_counter() - started, size
+
+        for name, url in urls:
+            requests = addresses(url, warm)
+            get(next(requests))
+            metrics.clear()
+            started = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                timings = list(executor.map(get, [next(requests) for _ in range(repeat)]))
+            result = summary([latency for latency, _ in timings], time.perf_counter() - started)
+            # Гистограммы ведутся по маршруту без параметров запроса, здесь в них только запросы этого эндпоинта
+            route = url.lstrip('/').partition('?')[0]
+            queries = metrics.db_queries.get((route, 'GET'))
+            result.update(queries=round(queries[1] / queries[2], 1) if queries else None,
+                          size_kb=round(timings[-1][1] / 1024, 1))
+            results[name] = result
+    return results
+
+
+def metadata(args, connection):
+    import django
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'params': {key: value for key, value in vars(args).items() if key != 'output'},
+    }
+
+
+def print_results(title, results):
+    print(title)
+    for name, result in results.items():
+        line = ('  {:<14} median {median_ms:9.2f} ms   p95 {p95_ms:9.2f} ms   {throughput_rps:8.1f} req/s'
+                '   queries {queries}   size {size_kb} KiB')
+        if 'peak_kb' in result:
+            line += '   peak {peak_kb} KiB'
+        print(line.format(name, **result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cities', type=int, default=20)
+    parser.add_argument('--streets', type=int, default=2000)
+    parser.add_argument('--shops', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--modes', nargs='+', choices=('client', 'server'), default=['client', 'server'])
+    parser.add_argument('--endpoints', nargs='+', choices=[name for name, _ in ENDPOINTS])
+    parser.add_argument('--warm', action='store_true', help='keep the response cache between requests')
+    parser.add_argument('--output', help='write results to this JSON file')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.db import connection
+
+    if connection.vendor == 'sqlite':
+        # Базу в памяти нельзя открыть из потоков сервера, тестовая база - файл
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'suite.sqlite3')
+
+    with common.test_database():
+        started = time.perf_counter()
+        generate(args.cities, args.streets, args.shops, args.seed)
+        print(f'Generated {args.cities} cities, {args.streets} streets, {args.shops} shops '
+              f'in {time.perf_counter() - started:.1f} s ({connection.vendor})')
+
+        from tutorials.models import City
+        city_id = City.objects.order_by('id').values_list('id', flat=True).first()
+        urls = [(name, url.format(city_id=city_id)) for name, url in ENDPOINTS
+                if args.endpoints is None or name in args.endpoints]
+
+        output = {'meta': metadata(args, connection), 'results': {}}
+        cache = 'warm' if args.warm else 'cold'
+        if 'client' in args.modes:
+            results = output['results']['client'] = run_client(urls, args.repeat, args.warm)
+            print_results(f'Test client, {args.repeat} requests per endpoint, {cache} cache', results)
+        if 'server' in args.modes:
+            results = output['results']['server'] = run_server(urls, args.repeat, args.concurrency, args.warm)
+            print_results(f'Local server, {args.repeat} requests per endpoint, concurrency {args.concurrency}, '
+                          f'{cache} cache', results)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(output, file, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'podrygomy.settings')
+# Под ASGI API обслуживают асинхронные представления (tutorials/async_views.py), ASYNC_VIEWS=0 возвращает синхронные
+os.environ.setdefault('ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -0,0 +1,18 @@
+"""URL Configuration for the ASGI mode
+
+Same as podrygomy/urls.py, but the API is served by the async views from tutorials/async_views.py.
+Selected in settings by ASYNC_VIEWS=1, which podrygomy/asgi.py sets by default.
+"""
+from django.conf import settings
+from django.contrib import admin
+from django.urls import path, include
+
+from tutorials.metrics import metrics_view
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('tutorials.async_urls')),
+]
+
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('metrics', metrics_view))
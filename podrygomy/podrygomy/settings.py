@@ -37,12 +37,18 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    # Lookup trigram_similar и TrigramSimilarity для поиска по названию на PostgreSQL (tutorials/search.py)
+    'django.contrib.postgres',
     'rest_framework',
     'tutorials',
 ]
 
 MIDDLEWARE = [
+    # Замеры запросов для Server-Timing и /metrics, первым - чтобы время включало остальные middleware
+    'tutorials.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Стоит перед остальными middleware, чтобы сжимать уже окончательный ответ
+    'tutorials.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,7 +57,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'podrygomy.urls'
+# При запуске под ASGI (podrygomy/asgi.py) API обслуживают асинхронные представления tutorials/async_views.py
+ROOT_URLCONF = 'podrygomy.async_urls' if os.environ.get("ASYNC_VIEWS") == "1" else 'podrygomy.urls'
 
 TEMPLATES = [
     {
@@ -85,9 +92,40 @@ def get_env_database_name():
         return value
 
 
+# Бэкенды с пулом соединений внутри процесса (tutorials/backends/) для SQL_POOL_SIZE > 0
+POOLED_ENGINES = {
+    "django.db.backends.postgresql": "tutorials.backends.postgresql",
+    "django.db.backends.sqlite3": "tutorials.backends.sqlite3",
+}
+
+# Сколько свободных соединений с БД процесс держит открытыми. 0 - пул выключен
+SQL_POOL_SIZE = int(os.environ.get("SQL_POOL_SIZE", 0))
+
+
+def get_env_database_engine():
+    engine = os.environ.get("SQL_ENGINE", "django.db.backends.postgresql")
+    if SQL_POOL_SIZE > 0:
+        return POOLED_ENGINES.get(engine, engine)
+    return engine
+
+
+# Время жизни соединения с БД в секундах: 0 (по умолчанию) - новое соединение на каждый запрос, none - без ограничения.
+# С пулом соединение возвращается в пул в конце каждого запроса, поэтому CONN_MAX_AGE равен 0.
+# Под ASGI (ASYNC_VIEWS=1) асинхронный ORM выполняет запросы в разных потоках, а постоянное соединение
+# повторно используется только в том же потоке - такие соединения копились бы по одному на поток.
+# Поэтому под ASGI CONN_MAX_AGE всегда 0, повторно использовать соединения там можно только через пул
+def get_env_conn_max_age():
+    if SQL_POOL_SIZE > 0 or os.environ.get("ASYNC_VIEWS") == "1":
+        return 0
+    value = os.environ.get("SQL_CONN_MAX_AGE", "0")
+    if value.lower() == "none":
+        return None
+    return int(value)
+
+
 DATABASES = {
     "default": {
-        "ENGINE": os.environ.get("SQL_ENGINE", "django.db.backends.postgresql"),
+        "ENGINE": get_env_database_engine(),
         # "NAME": os.environ.get("SQL_DATABASE", "shop"),
 
         "NAME": get_env_database_name(),
@@ -96,9 +134,50 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "postgres"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "15432"),
+        "CONN_MAX_AGE": get_env_conn_max_age(),
+        # Проверка соединения перед повторным использованием (в начале запроса или при выдаче из пула)
+        "CONN_HEALTH_CHECKS": os.environ.get("SQL_CONN_HEALTH_CHECKS", "1") == "1",
+        "POOL_SIZE": SQL_POOL_SIZE,
+    }
+}
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# По умолчанию кэш в памяти процесса. При нескольких процессах нужен общий кэш (Redis, Memcached),
+# иначе запись в одном процессе не сбросит ответы, закэшированные в другом (см. manage.py check --deploy).
+# Время жизни записей (секунды) ограничивает и время, которое другой процесс с локальным кэшем может
+# отдавать устаревшие ответы: вместе с записями истекают и версии таблиц (tutorials/caching.py).
+CACHE_TIMEOUT = int(os.environ.get("CACHE_TIMEOUT", 60))
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+        "TIMEOUT": CACHE_TIMEOUT,
     }
 }
 
+# Индекс поиска по названиям в памяти процесса (tutorials/search.py, не PostgreSQL) строится заново, если
+# старше этого числа секунд: так в него попадают записи других процессов и запись в обход сигналов
+SEARCH_INDEX_MAX_AGE = int(os.environ.get("SEARCH_INDEX_MAX_AGE", 60))
+
+# Кодировщик JSON для списков (tutorials/renderers.py): auto - orjson, если установлен, иначе стандартный json;
+# orjson; json
+JSON_RENDERER = os.environ.get("JSON_RENDERER", "auto")
+
+# Ответы /api/ меньше этого размера (в байтах) не сжимаются (tutorials/middleware.py)
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", 1024))
+
+# Замеры запросов: заголовок Server-Timing и метрики Prometheus по /metrics (tutorials/metrics.py)
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+# Сети (через запятую), из которых доступен /metrics; с остальных адресов он отвечает 404.
+# Адрес берется из REMOTE_ADDR, поэтому за обратным прокси /metrics нужно закрыть и на прокси
+METRICS_ALLOWED_NETWORKS = [network.strip() for network in
+                            os.environ.get("METRICS_ALLOWED_NETWORKS", "127.0.0.0/8,::1/128").split(",")
+                            if network.strip()]
+
+# Размер in-process LRU-кэшей поиска города и улицы по названию (0 - кэш выключен)
+LOOKUP_CACHE_SIZE = int(os.environ.get("LOOKUP_CACHE_SIZE", 10000))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -145,6 +224,12 @@ CORS_ORIGIN_WHITELIST = (
     'http://localhost:8081',
 )
 
+# Профиль логирования: development - все сообщения начиная с DEBUG, production - начиная с WARNING.
+# LOG_LEVEL задает уровень явно. Сообщения выводятся в консоль из отдельного потока (tutorials/log.py),
+# поэтому запись в консоль не задерживает запрос.
+LOG_PROFILE = os.environ.get("LOG_PROFILE", "development")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING" if LOG_PROFILE == "production" else "DEBUG")
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -160,12 +245,12 @@ LOGGING = {
     },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'tutorials.log.QueueStreamHandler',
             'formatter': 'verbose'
         },
     },
     'root': {
         'handlers': ['console'],
-        'level': 'DEBUG',
+        'level': LOG_LEVEL,
     },
 }
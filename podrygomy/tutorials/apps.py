@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class TutorialsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tutorials'
+
+    def ready(self):
+        # Подключаем обработчики сигналов моделей и проверки настроек (manage.py check --deploy)
+        from . import checks, signals
+
+        # Счетчик запросов к БД для метрик (tutorials/metrics.py)
+        from django.db.backends.signals import connection_created
+        from .metrics import install_db_wrapper
+        connection_created.connect(install_db_wrapper)
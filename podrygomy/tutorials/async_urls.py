@@ -0,0 +1,9 @@
+from django.urls import path
+from .async_views import *
+
+# Те же адреса, что и в urls.py, с асинхронными представлениями (для запуска под ASGI)
+urlpatterns = [
+    path('city', cities),
+    path('street', streets_by_city_id),
+    path('shop', create_shop)
+]
@@ -0,0 +1,128 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import views
+from .caching import cached_response
+from .columnar import RENDERER_CLASSES, ColumnarRenderer, columnar_response, wants_columnar
+from .filters import acurrent_minutes, aopening_bucket, shops_queryset, streets_queryset
+from .models import *
+from .pagination import apaginate
+from .readers import city_reader, shop_reader, street_reader
+from .renderers import json_response
+from .search import search_response
+import logging
+
+_logger = logging.getLogger(__name__)
+
+STREAM_NOT_SUPPORTED = 'stream=1 ne podderzhivaetsya pod ASGI, ispolzuite limit i after'
+
+
+# Асинхронные версии представлений views.py для запуска под ASGI (см. podrygomy/asgi.py).
+# GET-запросы читают БД через асинхронный API ORM и не занимают поток на все время запроса.
+# Ответы совпадают с ответами views.py, включая пагинацию, колоночный формат, кэш и ETag.
+# Параметр stream=1 у /api/shop не поддерживается и отвечает 400: в Django 4.1 потоковый ответ под ASGI
+# читается в цикле событий, где обращения к БД запрещены, а отдать список целиком вместо потока значило бы
+# молча собрать в памяти весь ответ, от чего stream=1 и защищает.
+# Запись (POST) по-прежнему идет через сериализаторы DRF, которые работают только синхронно,
+# поэтому такие запросы передаются представлениям views.py в отдельный поток.
+# Туда же передаются GET-запросы, для которых DRF выбрал бы другой формат, чем JSON или колоночный (_own_format).
+
+
+# Как и для представлений DRF (api_view), CsrfViewMiddleware не проверяет запросы: тело запроса читает DRF,
+# и он сам проверяет CSRF при сессионной аутентификации.
+# django.views.decorators.csrf.csrf_exempt в Django 4.1 оборачивает представление в синхронную функцию,
+# поэтому отметка ставится напрямую.
+def _csrf_exempt(view):
+    view.csrf_exempt = True
+    return view
+
+
+# Формат ответа выбирается так же, как в DRF, по ?format= и Accept среди renderer_classes представления.
+# Сами асинхронные представления отдают только JSON и колоночный формат. Если DRF выбрал бы другой
+# (браузерный API) или ответил бы ошибкой (404 на неизвестный format, 406 на неподходящий Accept),
+# возвращает False, и запрос передается представлению views.py - ответ будет тем же, что у него
+def _own_format(request, renderer_classes):
+    negotiator = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS()
+    try:
+        renderer, _ = negotiator.select_renderer(Request(request), [cls() for cls in renderer_classes])
+    except (Http404, exceptions.NotAcceptable):
+        return False
+    if renderer.format not in ('json', ColumnarRenderer.format):
+        return False
+    # wants_columnar (columnar.py) читает выбранный формат отсюда, как у представлений DRF
+    request.accepted_renderer = renderer
+    return True
+
+
+@_csrf_exempt
+@cached_response('city')
+async def cities(request):
+    _logger.debug("Async request %s /api/city received", request.method)
+    if request.method != 'GET' or not _own_format(request, api_settings.DEFAULT_RENDERER_CLASSES):
+        return await sync_to_async(views.cities)(request)
+
+    var_cities = City.objects.all()
+    page = await apaginate(request, var_cities, city_reader)
+    if page is not None:
+        return page
+
+    rows = city_reader.to_rows(await city_reader.atuples(var_cities))
+    if not rows:
+        _logger.warning("No cities were found in the database. 404 response is returned")
+        return json_response('NET GORODOV', status=status.HTTP_404_NOT_FOUND)
+
+    _logger.debug("Found %s cities", len(rows))
+    return json_response(rows)
+
+
+@_csrf_exempt
+@cached_response('street', 'city')
+async def streets_by_city_id(request):
+    _logger.debug("Async request %s /api/street received", request.method)
+    if request.method != 'GET' or not _own_format(request, RENDERER_CLASSES):
+        return await sync_to_async(views.streets_by_city_id)(request)
+
+    var_city_id = request.GET.get('city_id')
+    _logger.debug("Parameter city_id %s received", var_city_id)
+    streets, error = streets_queryset(request.GET)
+    if error is not None:
+        _logger.warning("Parameter city_id %s not number. 400 response is returned", var_city_id)
+        return json_response(error, status=status.HTTP_400_BAD_REQUEST)
+    if 'q' in request.GET:
+        return await sync_to_async(search_response)(request, request.GET, streets, street_reader, 'street',
+                                                    Street.objects.all())
+    page = await apaginate(request, streets, street_reader)
+    if page is not None:
+        return page
+
+    streets = await street_reader.atuples(streets)
+    if wants_columnar(request):
+        return columnar_response(street_reader.to_columns(streets))
+    return json_response(street_reader.to_rows(streets))
+
+
+@_csrf_exempt
+@cached_response('shop', 'street', 'city', bucket=aopening_bucket)
+async def create_shop(request):
+    _logger.debug("Async request %s /api/shop received", request.method)
+    if request.method != 'GET' or not _own_format(request, RENDERER_CLASSES):
+        return await sync_to_async(views.create_shop)(request)
+
+    all_shops = shops_queryset(request.GET, await acurrent_minutes(request))
+    # Поиск по названию обращается к БД синхронно (индекс в памяти строится через ORM), см. search.py
+    if 'q' in request.GET:
+        return await sync_to_async(search_response)(request, request.GET, all_shops, shop_reader, 'shop',
+                                                    ShopListing.objects.all())
+    page = await apaginate(request, all_shops, shop_reader)
+    if page is not None:
+        return page
+
+    if wants_columnar(request):
+        return columnar_response(shop_reader.to_columns(await shop_reader.atuples(all_shops)))
+    if request.GET.get('stream') == '1':
+        _logger.warning("Streaming is not supported by async views. 400 response is returned")
+        return json_response(STREAM_NOT_SUPPORTED, status=status.HTTP_400_BAD_REQUEST)
+    return json_response(shop_reader.to_rows(await shop_reader.atuples(all_shops)))
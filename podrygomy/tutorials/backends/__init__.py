@@ -0,0 +1,2 @@
+# Бэкенды БД с пулом соединений (tutorials/pool.py). Включаются переменной окружения SQL_POOL_SIZE,
+# см. DATABASES в podrygomy/settings.py
@@ -0,0 +1,8 @@
+from django.db.backends.postgresql import base
+
+from tutorials.pool import PooledDatabaseWrapperMixin
+
+
+# PostgreSQL с пулом соединений внутри процесса (tutorials/pool.py), ENGINE = "tutorials.backends.postgresql"
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
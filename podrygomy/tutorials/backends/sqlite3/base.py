@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+
+from tutorials.pool import PooledDatabaseWrapperMixin
+
+
+# SQLite с пулом соединений внутри процесса (tutorials/pool.py), ENGINE = "tutorials.backends.sqlite3".
+# Нужен для проверки пула без PostgreSQL: соединения с базой в памяти Django не закрывает, и пул для них не работает.
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
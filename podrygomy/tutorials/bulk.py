@@ -0,0 +1,105 @@
+from django.db import transaction
+
+from .caching import bump_version
+from .listing import add_shops
+from .search import index_names
+from .models import *
+from .serializers import ShopsSerializer
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Размер пачки для INSERT и для списков IN (...) при поиске городов и улиц
+BATCH_SIZE = 1000
+
+
+# Массовое создание магазинов из списка json-объектов того же формата, что и POST /api/shop.
+# Возвращает (созданные магазины, None) или (None, ошибки по индексу элемента).
+# Если хотя бы один элемент не прошел валидацию, в базу ничего не пишется.
+def create_shops(items):
+    errors = {}
+    validated = []
+    for index, item in enumerate(items):
+        serializer = ShopsSerializer(data=item)
+        if serializer.is_valid():
+            validated.append(serializer.validated_data)
+        else:
+            errors[index] = serializer.errors
+    if errors:
+        _logger.warning("%s of %s shops are not valid", len(errors), len(items))
+        return None, errors
+
+    _logger.debug("Start bulk creating %s shops", len(validated))
+    with transaction.atomic():
+        cities = _resolve_cities({data['city'] for data in validated})
+        streets = _resolve_streets({(cities[data['city']], data['street_id']['name']) for data in validated})
+
+        shops = []
+        for data in validated:
+            data = dict(data)
+            city = cities[data.pop('city')]
+            street = streets[(city.id, data.pop('street_id')['name'])]
+            shops.append(Shops(street_id=street, **data))
+        Shops.objects.bulk_create(shops, batch_size=BATCH_SIZE)
+        # bulk_create не отправляет сигналы post_save - строки витрины, индекс поиска
+        # и версии таблиц для кэша ответов меняем сами
+        add_shops(shops)
+        index_names('shop', [(shop.id, shop.name) for shop in shops])
+        index_names('street', [(street.id, street.name) for street in streets.values()])
+        for table in ('city', 'street', 'shop'):
+            bump_version(table)
+    return shops, None
+
+
+# Города ищутся одним запросом на пачку названий, недостающие создаются одним INSERT.
+# ignore_conflicts пропускает города, которые параллельно успел создать другой запрос,
+# поэтому после вставки города перечитываются.
+def _resolve_cities(names):
+    cities = _fetch_cities(names)
+    missing = names - cities.keys()
+    if missing:
+        _logger.debug("Creating %s cities", len(missing))
+        City.objects.bulk_create([City(name=name) for name in missing], batch_size=BATCH_SIZE, ignore_conflicts=True)
+        cities.update(_fetch_cities(missing))
+    return cities
+
+
+def _fetch_cities(names):
+    cities = {}
+    for batch in _batches(names):
+        cities.update((city.name, city) for city in City.objects.filter(name__in=batch))
+    return cities
+
+
+# Ключ улицы - (идентификатор города, название), уникальность пары обеспечена ограничением в БД
+def _resolve_streets(keys):
+    cities = {city.id: city for city, _ in keys}
+    keys = {(city.id, name) for city, name in keys}
+    streets = _fetch_streets(keys, cities)
+    missing = keys - streets.keys()
+    if missing:
+        _logger.debug("Creating %s streets", len(missing))
+        Street.objects.bulk_create([Street(city_id=cities[city_id], name=name) for city_id, name in missing],
+                                   batch_size=BATCH_SIZE, ignore_conflicts=True)
+        streets.update(_fetch_streets(missing, cities))
+    return streets
+
+
+def _fetch_streets(keys, cities):
+    streets = {}
+    for batch in _batches(keys):
+        # Выбираем по городам и названиям, лишние сочетания отбрасываем по ключу
+        query = Street.objects.filter(city_id__in={city_id for city_id, _ in batch},
+                                      name__in={name for _, name in batch})
+        for street in query:
+            key = (street.city_id_id, street.name)
+            if key in keys:
+                street.city_id = cities[street.city_id_id]
+                streets[key] = street
+    return streets
+
+
+def _batches(values):
+    values = list(values)
+    for start in range(0, len(values), BATCH_SIZE):
+        yield values[start:start + BATCH_SIZE]
@@ -0,0 +1,177 @@
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template.response import SimpleTemplateResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+import asyncio
+import functools
+import hashlib
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Кэш из настроек CACHES, по умолчанию локальная память процесса
+CACHE_ALIAS = 'default'
+VERSION_KEY = 'tutorials:version:%s'
+RESPONSE_KEY = 'tutorials:response:%s'
+VALUE_KEY = 'tutorials:value:%s:%s'
+
+
+# Версия таблицы - счетчик в кэше, который увеличивается при каждой записи в таблицу.
+# Версии входят в ключ ответа, поэтому после записи старые ответы просто перестают находиться.
+# Все записи живут TIMEOUT из CACHES (settings.CACHE_TIMEOUT): с локальным кэшем в каждом процессе
+# запись в одном процессе не меняет версии в других, и они отдают старые ответы не дольше этого времени.
+# Если счетчика нет (кэш очищен, вытеснил его или время жизни истекло), он заводится заново
+# от текущего времени в наносекундах, чтобы не совпасть ни с одной из прежних версий.
+def get_versions(tables):
+    cache = caches[CACHE_ALIAS]
+    keys = [VERSION_KEY % table for table in tables]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns())
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(tables):
+    cache = caches[CACHE_ALIAS]
+    keys = [VERSION_KEY % table for table in tables]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns())
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+# Значение, посчитанное по таблицам tables, кэшируется до следующей записи в них
+def versioned_value(name, tables, compute):
+    cache = caches[CACHE_ALIAS]
+    key = VALUE_KEY % (name, ':'.join(str(version) for version in get_versions(tables)))
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value)
+    return value
+
+
+# То же для асинхронных представлений, compute - корутина
+async def aversioned_value(name, tables, compute):
+    cache = caches[CACHE_ALIAS]
+    key = VALUE_KEY % (name, ':'.join(str(version) for version in await aget_versions(tables)))
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value)
+    return value
+
+
+# Версия увеличивается сразу и еще раз после коммита: ответ, прочитанный между записью и коммитом,
+# содержит старые данные и не должен остаться под новой версией
+def bump_version(table):
+    _bump(table)
+    transaction.on_commit(lambda: _bump(table))
+
+
+def _bump(table):
+    cache = caches[CACHE_ALIAS]
+    try:
+        cache.incr(VERSION_KEY % table)
+    except ValueError:
+        cache.set(VERSION_KEY % table, time.time_ns())
+
+
+# Кэширует успешные GET-ответы представления с учетом версий таблиц, из которых они собраны.
+# Ключ ответа служит и ETag: при совпадении If-None-Match сразу возвращается 304 без обращения к БД.
+# Потоковые ответы и ответы DRF (ошибки) не кэшируются.
+# bucket(request) - дополнительная часть ключа для ответов, зависящих от времени:
+# с новым значением ключ меняется сам.
+# Для асинхронного представления (async_views.py) bucket тоже должен быть корутиной.
+def cached_response(*tables, bucket=None):
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            return _async_cached_view(view, tables, bucket)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+
+            key = _response_key(request, get_versions(tables), bucket(request) if bucket is not None else None)
+            etag = '"%s"' % key
+            if _etag_matches(request, etag):
+                return _not_modified(etag)
+
+            cache = caches[CACHE_ALIAS]
+            cached = cache.get(RESPONSE_KEY % key)
+            if cached is not None:
+                _logger.debug("Response for %s found in cache", request)
+                response = HttpResponse(cached[1], content_type=cached[0])
+            else:
+                response = view(request, *args, **kwargs)
+                if not _cacheable(response):
+                    return response
+                cache.set(RESPONSE_KEY % key, (response['Content-Type'], response.content))
+            return _tagged(response, etag)
+        return wrapper
+    return decorator
+
+
+def _async_cached_view(view, tables, bucket):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await view(request, *args, **kwargs)
+
+        key = _response_key(request, await aget_versions(tables), await bucket(request) if bucket is not None else None)
+        etag = '"%s"' % key
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+
+        cache = caches[CACHE_ALIAS]
+        cached = await cache.aget(RESPONSE_KEY % key)
+        if cached is not None:
+            _logger.debug("Response for %s found in cache", request)
+            response = HttpResponse(cached[1], content_type=cached[0])
+        else:
+            response = await view(request, *args, **kwargs)
+            if not _cacheable(response):
+                return response
+            await cache.aset(RESPONSE_KEY % key, (response['Content-Type'], response.content))
+        return _tagged(response, etag)
+    return wrapper
+
+
+def _response_key(request, versions, bucket):
+    # Формат ответа может выбираться заголовком Accept (см. columnar.py)
+    source = '%s|%s|%s|%s' % (request.get_full_path(), ':'.join(str(version) for version in versions), bucket,
+                              request.headers.get('Accept', ''))
+    return hashlib.md5(source.encode()).hexdigest()
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.streaming and not isinstance(response, SimpleTemplateResponse)
+
+
+def _not_modified(etag):
+    _logger.debug("ETag %s matches. 304 response is returned", etag)
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+def _tagged(response, etag):
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def _etag_matches(request, etag):
+    if_none_match = request.headers.get('If-None-Match')
+    if not if_none_match:
+        return False
+    # Слабые ETag (W/"...") после сжатия ответа сравниваются по значению
+    return any(tag == '*' or tag.replace('W/', '', 1) == etag for tag in parse_etags(if_none_match))
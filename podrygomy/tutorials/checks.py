@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .caching import CACHE_ALIAS
+
+# Кэши, которые живут в памяти одного процесса
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+# Кэш ответов и версии таблиц (caching.py) должны быть общими для всех процессов сервера,
+# иначе после записи остальные процессы отдают старые ответы до истечения CACHE_TIMEOUT.
+# Проверка выполняется командой manage.py check --deploy
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    backend = settings.CACHES[CACHE_ALIAS]['BACKEND']
+    if backend not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [Warning(
+        'Response cache uses %s, which is local to each process.' % backend,
+        hint='With more than one worker set CACHE_BACKEND and CACHE_LOCATION to a shared cache '
+             '(Redis, Memcached), otherwise workers serve stale lists for up to CACHE_TIMEOUT seconds.',
+        id='tutorials.W001',
+    )]
@@ -0,0 +1,52 @@
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+from .renderers import get_renderer, json_response
+
+# Колоночный формат списков /api/shop и /api/street для клиентов, которые забирают списки целиком.
+# Включается параметром ?format=columnar или заголовком Accept: application/vnd.shops.columnar+json.
+# Вместо массива объектов отдается объект с массивом значений на каждый ключ,
+# названия улиц и городов передаются один раз в dictionaries, а в столбцах остаются их номера:
+# {"count": 2,
+#  "columns": {"id": [1, 2], "name": ["Shop 1", "Shop 2"], "street_id": [0, 0], "house": ["1", "2"],
+#              "city_name": [0, 0], "open": [1, 0]},
+#  "dictionaries": {"street_id": ["Street"], "city_name": ["Gorod"]}}
+MEDIA_TYPE = 'application/vnd.shops.columnar+json'
+
+
+# Рендерер нужен DRF для выбора формата по ?format= и Accept. Списки представления кодируют сами,
+# через рендерер проходят только ответы DRF (ошибки, созданные объекты) - они отдаются обычным JSON.
+class ColumnarRenderer(BaseRenderer):
+    media_type = MEDIA_TYPE
+    format = 'columnar'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return get_renderer().dumps(data)
+
+
+# Рендереры представлений, которые поддерживают колоночный формат
+RENDERER_CLASSES = list(api_settings.DEFAULT_RENDERER_CLASSES) + [ColumnarRenderer]
+
+
+# Для представлений DRF формат уже выбран по ?format= и Accept. Асинхронные представления (async_views.py)
+# работают без DRF, для них параметр и заголовок проверяются здесь.
+def wants_columnar(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is not None:
+        return renderer.format == ColumnarRenderer.format
+    return request.GET.get('format') == ColumnarRenderer.format or MEDIA_TYPE in request.headers.get('Accept', '')
+
+
+def columnar_response(data):
+    return json_response(data, content_type=MEDIA_TYPE)
+
+
+# Обратное преобразование в список объектов, как в обычном JSON-ответе
+def decode_columns(data):
+    columns = dict(data['columns'])
+    for key, values in data['dictionaries'].items():
+        columns[key] = [values[number] for number in columns[key]]
+    return [dict(zip(columns, row)) for row in zip(*columns.values())]
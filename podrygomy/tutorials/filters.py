@@ -0,0 +1,93 @@
+from .caching import aversioned_value, versioned_value
+from .models import *
+import bisect
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+# Фильтры списков по параметрам GET-запроса и текущее время по часовым поясам городов.
+# Общие для синхронных (views.py) и асинхронных (async_views.py) представлений, поэтому ответы у них совпадают.
+# params - request.query_params (DRF) или request.GET.
+
+
+# Улицы города city_id. При поиске по названию (q) город можно не указывать - поиск идет по всем улицам.
+# Возвращает (queryset, None) или (None, сообщение об ошибке)
+def streets_queryset(params):
+    var_city_id = params.get('city_id')
+    if var_city_id is None and 'q' in params:
+        return Street.objects.all(), None
+    if var_city_id is None or not var_city_id.isdigit():
+        return None, 'kakoi gorod to?'
+    # Название города street_reader читает тем же запросом через JOIN
+    return Street.objects.filter(city_id=var_city_id), None
+
+
+# Магазины по фильтрам street, city и open из параметров запроса
+def shops_queryset(params, now):
+    var_street_id = params.get('street')
+    var_city_id = params.get('city')
+    var_open = params.get('open')
+    _logger.debug("Shops filter: city %s, street %s, open %s, minutes now %s", var_city_id, var_street_id, var_open, now)
+    # Названия улицы и города и часовой пояс хранятся в витрине ShopListing, список читается из одной таблицы,
+    # флаг open считается в том же запросе. Без сортировки порядок строк витрины зависит от индекса,
+    # который выберет БД, поэтому список, как и раньше, идет по id
+    all_shops = ShopListing.objects.annotate_open(now).order_by('id')
+    if var_city_id is not None and var_city_id.isdigit():
+        all_shops = all_shops.filter(city_id=var_city_id)
+
+    if var_street_id is not None and var_street_id.isdigit():
+        all_shops = all_shops.filter(street_id=var_street_id)
+
+    if var_open is not None and var_open.isdigit():
+        if int(var_open) in (0, 1):
+            all_shops = all_shops.filter_open(now, int(var_open) == 1)
+    return all_shops
+
+
+# Флаг open и фильтр open зависят от текущего времени суток в часовом поясе города.
+# Время определяется один раз на запрос для каждого пояса, который есть у городов: его используют ключ кэша,
+# фильтр open и флаг open, и ответ не может разойтись с самим собой на границе минуты.
+# Список поясов пересчитывается только после записи в таблицу городов.
+def current_minutes(request):
+    if not hasattr(request, 'current_minutes'):
+        timezones = versioned_value('city_timezones', ('city',), _city_timezones)
+        request.current_minutes = local_minutes(timezones)
+    return request.current_minutes
+
+
+async def acurrent_minutes(request):
+    if not hasattr(request, 'current_minutes'):
+        timezones = await aversioned_value('city_timezones', ('city',), _acity_timezones)
+        request.current_minutes = local_minutes(timezones)
+    return request.current_minutes
+
+
+def _city_timezones():
+    return sorted(City.objects.values_list('timezone', flat=True).distinct())
+
+
+async def _acity_timezones():
+    return sorted([timezone_name async for timezone_name in
+                   City.objects.values_list('timezone', flat=True).distinct()])
+
+
+def local_minutes(timezones):
+    return {timezone_name: local_minute(timezone_name) for timezone_name in timezones}
+
+
+# Между соседними минутами, в которые открывается или закрывается какой-либо магазин, ответ не меняется.
+# Номера таких промежутков для каждого пояса входят в ключ кэша (bucket в caching.cached_response),
+# границы пересчитываются только после записи в таблицу магазинов.
+def opening_bucket(request):
+    boundaries = versioned_value('opening_boundaries', ('shop',), Shops.objects.opening_boundaries)
+    return bucket(boundaries, current_minutes(request))
+
+
+async def aopening_bucket(request):
+    boundaries = await aversioned_value('opening_boundaries', ('shop',), Shops.objects.aopening_boundaries)
+    return bucket(boundaries, await acurrent_minutes(request))
+
+
+def bucket(boundaries, minutes):
+    return tuple(bisect.bisect_right(boundaries, minute) for _, minute in sorted(minutes.items()))
@@ -0,0 +1,104 @@
+from django.db import transaction
+
+from . import search
+from .caching import bump_version
+from .models import *
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Размер пачки для INSERT при пересборке и массовом создании
+BATCH_SIZE = 1000
+
+# Столбцы витрины ShopListing и те же значения в нормализованных таблицах
+FIELDS = ('id', 'name', 'house', 'street_id', 'street_name', 'city_id', 'city_name', 'timezone',
+          'open_minute', 'close_minute')
+SOURCE_LOOKUPS = ('id', 'name', 'house', 'street_id', 'street_id__name', 'street_id__city_id',
+                  'street_id__city_id__name', 'street_id__city_id__timezone', 'open_minute', 'close_minute')
+
+
+# Поддержка витрины ShopListing (models.py) в соответствии с Shops, Street и City.
+# Строка магазина собирается из уже загруженных улицы и города, поэтому добавление магазина через
+# сериализаторы - это один INSERT. Изменение названия улицы или города меняет все строки одним UPDATE.
+
+def listing_row(shop):
+    street = shop.street_id
+    city = street.city_id
+    return ShopListing(id=shop.id, name=shop.name, house=shop.house, street_id=street.id, street_name=street.name,
+                       city_id=city.id, city_name=city.name, timezone=city.timezone,
+                       open_minute=shop.open_minute, close_minute=shop.close_minute)
+
+
+def add_shops(shops):
+    ShopListing.objects.bulk_create([listing_row(shop) for shop in shops], batch_size=BATCH_SIZE)
+
+
+def save_shop(shop, created):
+    if created:
+        listing_row(shop).save(force_insert=True)
+    else:
+        listing_row(shop).save()
+
+
+def delete_shop(shop):
+    ShopListing.objects.filter(id=shop.id).delete()
+
+
+def update_street(street):
+    city = street.city_id
+    ShopListing.objects.filter(street_id=street.id).update(street_name=street.name, city_id=city.id,
+                                                           city_name=city.name, timezone=city.timezone)
+
+
+def update_city(city):
+    ShopListing.objects.filter(city_id=city.id).update(city_name=city.name, timezone=city.timezone)
+
+
+def _source_rows(chunk_size=BATCH_SIZE):
+    return Shops.objects.order_by('id').values_list(*SOURCE_LOOKUPS).iterator(chunk_size=chunk_size)
+
+
+# Пересобирает витрину из нормализованных таблиц в одной транзакции, возвращает число строк.
+# Пока транзакция не завершена, запросы видят прежнюю витрину.
+def rebuild(batch_size=BATCH_SIZE):
+    count = 0
+    with transaction.atomic():
+        ShopListing.objects.all().delete()
+        batch = []
+        for row in _source_rows(batch_size):
+            batch.append(ShopListing(**dict(zip(FIELDS, row))))
+            if len(batch) == batch_size:
+                ShopListing.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        ShopListing.objects.bulk_create(batch)
+        count += len(batch)
+        # Закэшированные ответы GET /api/shop и индекс поиска могли быть собраны из старой витрины
+        bump_version('shop')
+        transaction.on_commit(lambda: search.clear_indexes('shop'))
+    _logger.info("Shop listing rebuilt with %s rows", count)
+    return count
+
+
+# Сверка витрины с нормализованными таблицами. Обе стороны читаются по порядку id порциями,
+# поэтому память не зависит от размера таблиц. Возвращает словарь со списками id:
+# missing - магазина нет в витрине, extra - в витрине лишняя строка, different - значения расходятся.
+def check(chunk_size=BATCH_SIZE):
+    result = {'missing': [], 'extra': [], 'different': []}
+    source = _source_rows(chunk_size)
+    listing = ShopListing.objects.order_by('id').values_list(*FIELDS).iterator(chunk_size=chunk_size)
+    expected = next(source, None)
+    actual = next(listing, None)
+    while expected is not None or actual is not None:
+        if actual is None or (expected is not None and expected[0] < actual[0]):
+            result['missing'].append(expected[0])
+            expected = next(source, None)
+        elif expected is None or actual[0] < expected[0]:
+            result['extra'].append(actual[0])
+            actual = next(listing, None)
+        else:
+            if expected != actual:
+                result['different'].append(expected[0])
+            expected = next(source, None)
+            actual = next(listing, None)
+    return result
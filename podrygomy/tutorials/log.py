@@ -0,0 +1,54 @@
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+
+
+# Вывод логов в консоль без ожидания ввода-вывода в потоке запроса.
+# Запрос только форматирует сообщение и кладет его в очередь, в поток вывода (stderr) пишет
+# отдельный поток QueueListener. Подключается в LOGGING (podrygomy/settings.py) вместо StreamHandler.
+# Поток запускается при первом сообщении и заново после fork (несколько процессов сервера),
+# при выходе из процесса (logging.shutdown вызывает flush и close) оставшиеся в очереди сообщения дописываются.
+class QueueStreamHandler(logging.handlers.QueueHandler):
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self._target = logging.StreamHandler(stream or sys.stderr)
+        # Сообщение уже отформатировано в prepare() форматтером этого обработчика
+        self._target.setFormatter(logging.Formatter('%(message)s'))
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # После fork очередь и поток родителя не используются
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self._target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    # Дожидается вывода всех сообщений из очереди
+    def flush(self):
+        with self._start_lock:
+            listener = self._listener
+            if listener is None or self._pid != os.getpid():
+                return
+            listener.stop()
+            listener.start()
+
+    def close(self):
+        with self._start_lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._pid = None
+        super().close()
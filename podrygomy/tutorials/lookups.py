@@ -0,0 +1,105 @@
+from collections import OrderedDict
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import *
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+# Ограниченный по размеру потокобезопасный LRU-кэш со счетчиками попаданий и промахов
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    # Удаляет все записи, для которых predicate(key, value) истинно
+    def discard(self, predicate):
+        with self._lock:
+            for key in [key for key, value in self._data.items() if predicate(key, value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+
+# Название города -> (id, часовой пояс) и (id города, название улицы) -> id.
+# Справочники городов и улиц почти не меняются, поэтому повторный POST с теми же городом и улицей
+# обходится без запросов к ним. Записи сбрасываются сигналами post_save/post_delete (см. signals.py).
+# Изменения, сделанные другими процессами, в этот кэш не попадают.
+city_cache = LRUCache(settings.LOOKUP_CACHE_SIZE)
+street_cache = LRUCache(settings.LOOKUP_CACHE_SIZE)
+
+
+def clear_lookup_caches():
+    city_cache.clear()
+    street_cache.clear()
+
+
+# Поиск города и улицы по естественному ключу с созданием при отсутствии.
+# Без кэша это один SELECT и, если объекта нет, один INSERT.
+# Если параллельный запрос успел создать такой же объект, INSERT падает на ограничении уникальности
+# (City.name, Street(city_id, name)), и get_or_create перечитывает уже созданную запись.
+def get_or_create_city(name):
+    cached = city_cache.get(name)
+    if cached is not None:
+        city_id, timezone = cached
+        return City(id=city_id, name=name, timezone=timezone)
+
+    city, created = City.objects.get_or_create(name=name)
+    if created:
+        _logger.debug("City %s not found in data base and was created", name)
+    _remember(city_cache, name, (city.id, city.timezone))
+    return city
+
+
+def get_or_create_street(name, city):
+    street_id = street_cache.get((city.id, name))
+    if street_id is not None:
+        return Street(id=street_id, name=name, city_id=city)
+
+    street, created = Street.objects.get_or_create(name=name, city_id=city)
+    if created:
+        _logger.debug("Street %s not found in data base and was created in city %s", name, city.id)
+    # Город уже загружен - подставляем его, чтобы сериализатор не запрашивал его повторно
+    street.city_id = city
+    _remember(street_cache, (city.id, name), street.id)
+    return street
+
+
+# В кэш попадают только закоммиченные записи: если транзакция откатится, id в кэше не останется
+def _remember(cache, key, value):
+    transaction.on_commit(lambda: cache.put(key, value))
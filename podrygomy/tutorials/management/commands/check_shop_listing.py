@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tutorials import listing
+
+# Сколько идентификаторов каждого вида расхождений выводить
+SHOWN_IDS = 20
+
+
+# Сверка витрины ShopListing с Shops, Street и City, при расхождениях завершается с ошибкой:
+#   python manage.py check_shop_listing
+class Command(BaseCommand):
+    help = 'Compare the ShopListing read model with shops, streets and cities'
+
+    def handle(self, *args, **options):
+        result = listing.check()
+        problems = {kind: ids for kind, ids in result.items() if ids}
+        if not problems:
+            self.stdout.write(self.style.SUCCESS('Shop listing is consistent'))
+            return
+        for kind, ids in problems.items():
+            shown = ', '.join(str(shop_id) for shop_id in ids[:SHOWN_IDS])
+            more = f' and {len(ids) - SHOWN_IDS} more' if len(ids) > SHOWN_IDS else ''
+            self.stderr.write(f'{kind}: {len(ids)} shops ({shown}{more})')
+        raise CommandError('Shop listing differs from the normalized tables, run rebuild_shop_listing')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tutorials import listing
+
+
+# Пересборка витрины ShopListing из Shops, Street и City:
+#   python manage.py rebuild_shop_listing
+class Command(BaseCommand):
+    help = 'Rebuild the ShopListing read model from shops, streets and cities'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=listing.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        count = listing.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Shop listing rebuilt: {count} shops'))
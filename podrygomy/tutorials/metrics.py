@@ -0,0 +1,242 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import ipaddress
+import threading
+import time
+
+from django.conf import settings
+from django.http import Http404
+from django.http.response import HttpResponse
+
+# Метрики запросов внутри процесса (заполняет tutorials.middleware.MetricsMiddleware).
+# На каждый запрос считаются время обработки, число и время запросов к БД, время сериализации и размер ответа.
+# Значения складываются в гистограммы по маршруту (api/shop и т. п.) и методу и отдаются по /metrics
+# в текстовом формате Prometheus. Каждый процесс сервера считает свои запросы, Prometheus суммирует их сам.
+
+# Границы корзин гистограмм
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, description, buckets, labels):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Счетчики по корзинам (последняя - +Inf), сумма, количество
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    # (счетчики по корзинам, сумма, количество) или None, если наблюдений не было
+    def get(self, label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            return None if series is None else (list(series[0]), series[1], series[2])
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def samples(self):
+        with self._lock:
+            series = sorted((labels, list(counts), total, count)
+                            for labels, (counts, total, count) in self._series.items())
+        for label_values, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield '_bucket', label_values + (_format_value(bound),), ('le',), cumulative
+            yield '_sum', label_values, (), total
+            yield '_count', label_values, (), count
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield '', label_values, (), value
+
+
+_LABELS = ('endpoint', 'method')
+
+# Метод запроса приходит от клиента, поэтому в метку попадает только один из известных методов, остальные - other.
+# Иначе каждый выдуманный метод заводил бы свои ряды во всех гистограммах
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+OTHER_METHOD = 'other'
+
+requests_total = Counter('shops_requests_total', 'Requests by endpoint, method and status', _LABELS + ('status',))
+request_duration = Histogram('shops_request_duration_seconds', 'Wall time of the request',
+                             DURATION_BUCKETS, _LABELS)
+db_queries = Histogram('shops_db_queries', 'Database queries per request', QUERY_BUCKETS, _LABELS)
+db_duration = Histogram('shops_db_duration_seconds', 'Time spent in database queries per request',
+                        DURATION_BUCKETS, _LABELS)
+serialize_duration = Histogram('shops_serialize_duration_seconds', 'Time spent building and encoding responses',
+                               DURATION_BUCKETS, _LABELS)
+response_size = Histogram('shops_response_size_bytes', 'Response body size as sent', SIZE_BUCKETS, _LABELS)
+
+registry = (requests_total, request_duration, db_queries, db_duration, serialize_duration, response_size)
+
+
+def clear():
+    for metric in registry:
+        metric.clear()
+
+
+def render_prometheus():
+    lines = []
+    for metric in registry:
+        lines.append(f'# HELP {metric.name} {metric.description}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for suffix, label_values, extra_labels, value in metric.samples():
+            labels = ','.join(f'{name}="{_escape(value)}"'
+                              for name, value in zip(metric.labels + extra_labels, label_values))
+            lines.append(f'{metric.name}{suffix}{{{labels}}} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+# Метрики раскрывают задержки, число запросов к БД и ошибки по каждому эндпоинту,
+# поэтому отдаются только внутренним адресам из METRICS_ALLOWED_NETWORKS (по умолчанию localhost)
+def metrics_view(request):
+    if not _is_allowed(request.META.get('REMOTE_ADDR')):
+        raise Http404()
+    return HttpResponse(render_prometheus(), content_type=CONTENT_TYPE)
+
+
+@functools.lru_cache(maxsize=None)
+def _allowed_networks(networks):
+    return tuple(ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+def _is_allowed(address):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in _allowed_networks(tuple(settings.METRICS_ALLOWED_NETWORKS)))
+
+
+# Замеры текущего запроса. Хранятся в contextvars: асинхронные представления обращаются к БД
+# через sync_to_async в другом потоке, а контекст передается туда вместе с вызовом.
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.size = 0
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        return 'app;dur=%.2f, db;dur=%.2f;desc="%d queries", serialize;dur=%.2f' % (
+            self.elapsed() * 1000, self.db_time * 1000, self.queries, self.serialize_time * 1000)
+
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+def current():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def collect(request_metrics):
+    token = _current.set(request_metrics)
+    try:
+        yield request_metrics
+    finally:
+        _current.reset(token)
+
+
+# Время сериализации: построение строк ответа и кодирование JSON
+@contextlib.contextmanager
+def serializing():
+    request_metrics = _current.get()
+    if request_metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.serialize_time += time.perf_counter() - started
+
+
+# Обертка запросов к БД (connection.execute_wrappers), подключается к каждому соединению в apps.py
+def db_wrapper(execute, sql, params, many, context):
+    request_metrics = _current.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.queries += 1
+        request_metrics.db_time += time.perf_counter() - started
+
+
+def install_db_wrapper(sender, connection, **kwargs):
+    # execute_wrappers переживает переподключение, обертка добавляется один раз
+    if db_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, db_wrapper)
+
+
+def record(endpoint, method, status, request_metrics):
+    labels = (endpoint, method if method in METHODS else OTHER_METHOD)
+    requests_total.inc(labels + (str(status),))
+    request_duration.observe(labels, request_metrics.elapsed())
+    db_queries.observe(labels, request_metrics.queries)
+    db_duration.observe(labels, request_metrics.db_time)
+    serialize_duration.observe(labels, request_metrics.serialize_time)
+    response_size.observe(labels, request_metrics.size)
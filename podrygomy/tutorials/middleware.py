@@ -0,0 +1,175 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+import logging
+import time
+
+from . import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+_logger = logging.getLogger(__name__)
+
+# Сжимаются только ответы API
+PATH_PREFIX = '/api/'
+# Уровень сжатия brotli: максимальный (11) слишком медленный для ответов, которые собираются на каждый запрос
+BROTLI_QUALITY = 5
+
+
+# Сжатие ответов /api/ по заголовку Accept-Encoding: brotli (br), если установлен пакет brotli и клиент его
+# принимает, иначе gzip. Ответы меньше COMPRESSION_MIN_SIZE байт не сжимаются - выигрыш меньше накладных расходов.
+# Потоковые ответы (stream=1) сжимаются по частям: каждая часть сжимается и сразу отправляется клиенту.
+# Устроено как django.middleware.gzip.GZipMiddleware: заголовок Vary: Accept-Encoding, сильный ETag
+# становится слабым (W/"..."), поэтому If-None-Match продолжает работать и для сжатых ответов.
+# Под ASGI MiddlewareMixin выполняет process_response в отдельном потоке. Сжатие не обращается к БД,
+# поэтому асинхронный вызов переопределен и обходится без переключения потока.
+class CompressionMiddleware(MiddlewareMixin):
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if not request.path.startswith(PATH_PREFIX) or response.status_code != 200:
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = _choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            compress = _brotli_sequence if encoding == 'br' else compress_sequence
+            response.streaming_content = compress(response.streaming_content)
+            # Размер сжатого ответа заранее неизвестен
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                content = brotli.compress(response.content, quality=BROTLI_QUALITY)
+            else:
+                content = compress_string(response.content)
+            if len(content) >= len(response.content):
+                return response
+            _logger.debug("Response compressed with %s: %s -> %s bytes", encoding, len(response.content), len(content))
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+# Кодировки из Accept-Encoding с ненулевым q, например "gzip, br;q=0.8, identity;q=0"
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _choose_encoding(header):
+    accepted = _accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def _brotli_sequence(sequence):
+    compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+    for item in sequence:
+        data = compressor.process(item) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+# Замеры запросов: время обработки, число и время запросов к БД, время сериализации и размер ответа.
+# Итог запроса отдается в заголовке Server-Timing и складывается в гистограммы tutorials/metrics.py (/metrics).
+# Стоит первым в MIDDLEWARE: время включает все остальные middleware, а размер - уже сжатый ответ.
+# Запросы к БД считает обертка metrics.db_wrapper, время сериализации - metrics.serializing() в представлениях
+# и рендеринг ответов DRF (между process_template_response и post-render callback).
+# Запросы без маршрута (404 от резолвера) в гистограммы не попадают, чтобы не плодить метки.
+# Выключается настройкой METRICS_ENABLED.
+class MetricsMiddleware(MiddlewareMixin):
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self._is_coroutine:
+            return self.__acall__(request)
+        with metrics.collect(metrics.RequestMetrics()) as request_metrics:
+            response = self.get_response(request)
+        return self._finish(request, response, request_metrics)
+
+    async def __acall__(self, request):
+        with metrics.collect(metrics.RequestMetrics()) as request_metrics:
+            response = await self.get_response(request)
+        return self._finish(request, response, request_metrics)
+
+    def process_template_response(self, request, response):
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                request_metrics.serialize_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _finish(self, request, response, request_metrics):
+        response.headers['Server-Timing'] = request_metrics.server_timing()
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        endpoint = match.route
+
+        def record():
+            metrics.record(endpoint, request.method, response.status_code, request_metrics)
+
+        if response.streaming:
+            response.streaming_content = _measured_stream(response.streaming_content, request_metrics, record)
+        else:
+            request_metrics.size = len(response.content)
+            record()
+        return response
+
+
+# Потоковый ответ читается после выхода из middleware: запросы к БД, которые выполняются при чтении,
+# относятся к тому же запросу, а замер записывается, когда ответ отдан целиком или клиент отключился
+def _measured_stream(content, request_metrics, record):
+    try:
+        iterator = iter(content)
+        while True:
+            with metrics.collect(request_metrics):
+                chunk = next(iterator, None)
+            if chunk is None:
+                break
+            request_metrics.size += len(chunk)
+            yield chunk
+    finally:
+        record()
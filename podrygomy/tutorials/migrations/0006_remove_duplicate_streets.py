@@ -0,0 +1,30 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:04
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def remove_duplicate_streets(apps, schema_editor):
+    # Перед добавлением уникальности (город, название) сливаем дубли улиц:
+    # магазины переносятся на улицу с наименьшим идентификатором, остальные удаляются
+    Street = apps.get_model('tutorials', 'Street')
+    Shops = apps.get_model('tutorials', 'Shops')
+    duplicates = (Street.objects.values('city_id', 'name')
+                  .annotate(keep_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for duplicate in duplicates:
+        streets = Street.objects.filter(city_id=duplicate['city_id'], name=duplicate['name'])
+        extra = streets.exclude(id=duplicate['keep_id'])
+        Shops.objects.filter(street_id__in=extra).update(street_id=duplicate['keep_id'])
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0005_remove_shops_address_id_shops_house_shops_street_id_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_streets, migrations.RunPython.noop),
+    ]
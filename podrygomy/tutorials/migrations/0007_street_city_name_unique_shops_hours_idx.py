@@ -0,0 +1,25 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0006_remove_duplicate_streets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shops',
+            index=models.Index(fields=['street_id', 'open_time', 'close_time'], name='shops_street_hours_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shops',
+            index=models.Index(fields=['open_time', 'close_time'], name='shops_hours_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='street',
+            constraint=models.UniqueConstraint(fields=('city_id', 'name'), name='street_city_name_unique'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0007_street_city_name_unique_shops_hours_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shops',
+            name='open_minute',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shops',
+            name='close_minute',
+            field=models.IntegerField(default=0),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:12
+
+from django.db import migrations
+
+MINUTES_IN_DAY = 24 * 60
+BATCH_SIZE = 1000
+
+
+# Часы открытия и закрытия переводятся в окно в минутах (см. opening_window в models.py).
+# Часы вне 0..24 ограничиваются этим диапазоном: магазин с open_time=-1 и close_time=30 и раньше считался открытым
+# круглые сутки. Окна с open_time > close_time раньше всегда считались закрытыми, теперь это работа после полуночи.
+def opening_window(open_time, close_time):
+    open_time = min(max(open_time, 0), 24) * 60
+    close_time = min(max(close_time, 0), 24) * 60
+    if close_time < open_time:
+        close_time += MINUTES_IN_DAY
+    if open_time >= MINUTES_IN_DAY:
+        open_time -= MINUTES_IN_DAY
+        close_time -= MINUTES_IN_DAY
+    return open_time, close_time
+
+
+def fill_opening_window(apps, schema_editor):
+    Shops = apps.get_model('tutorials', 'Shops')
+    batch = []
+    for shop in Shops.objects.only('open_time', 'close_time').iterator(chunk_size=BATCH_SIZE):
+        shop.open_minute, shop.close_minute = opening_window(shop.open_time, shop.close_time)
+        batch.append(shop)
+        if len(batch) == BATCH_SIZE:
+            Shops.objects.bulk_update(batch, ['open_minute', 'close_minute'])
+            batch = []
+    Shops.objects.bulk_update(batch, ['open_minute', 'close_minute'])
+
+
+# Обратно переводятся только целые часы, время закрытия после полуночи уходит в следующие сутки
+def fill_opening_hours(apps, schema_editor):
+    Shops = apps.get_model('tutorials', 'Shops')
+    batch = []
+    for shop in Shops.objects.only('open_minute', 'close_minute').iterator(chunk_size=BATCH_SIZE):
+        shop.open_time = shop.open_minute // 60
+        shop.close_time = (shop.close_minute % MINUTES_IN_DAY or shop.close_minute) // 60
+        batch.append(shop)
+        if len(batch) == BATCH_SIZE:
+            Shops.objects.bulk_update(batch, ['open_time', 'close_time'])
+            batch = []
+    Shops.objects.bulk_update(batch, ['open_time', 'close_time'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0008_shops_open_minute_close_minute'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_opening_window, fill_opening_hours),
+    ]
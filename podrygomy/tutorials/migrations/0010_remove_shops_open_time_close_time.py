@@ -0,0 +1,63 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0009_fill_shops_opening_window'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='shops',
+            name='shops_street_hours_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='shops',
+            name='shops_hours_idx',
+        ),
+        # Значение по умолчанию нужно только для отката миграции: поля создаются заново и заполняются в 0009
+        migrations.AlterField(
+            model_name='shops',
+            name='close_time',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='shops',
+            name='open_time',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RemoveField(
+            model_name='shops',
+            name='close_time',
+        ),
+        migrations.RemoveField(
+            model_name='shops',
+            name='open_time',
+        ),
+        migrations.AddIndex(
+            model_name='shops',
+            index=models.Index(fields=['street_id', 'open_minute', 'close_minute'], name='shops_street_minutes_idx'),
+        ),
+        migrations.AlterField(
+            model_name='shops',
+            name='street_id',
+            field=models.ForeignKey(db_index=False, default='0', on_delete=django.db.models.deletion.RESTRICT, to='tutorials.street'),
+        ),
+        migrations.AddIndex(
+            model_name='shops',
+            index=models.Index(fields=['open_minute', 'close_minute'], name='shops_minutes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shops',
+            index=models.Index(fields=['close_minute'], name='shops_close_minute_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='shops',
+            constraint=models.CheckConstraint(check=models.Q(('close_minute__gte', models.F('open_minute')), ('close_minute__lte', django.db.models.expressions.CombinedExpression(models.F('open_minute'), '+', models.Value(1440))), ('open_minute__gte', 0), ('open_minute__lt', 1440)), name='shops_opening_window'),
+        ),
+    ]
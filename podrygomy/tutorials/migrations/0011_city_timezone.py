@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0010_remove_shops_open_time_close_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='city',
+            name='timezone',
+            field=models.CharField(default='Europe/Samara', max_length=64),
+        ),
+    ]
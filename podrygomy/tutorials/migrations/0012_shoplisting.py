@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:43
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+FIELDS = ('id', 'name', 'house', 'street_id', 'street_name', 'city_id', 'city_name', 'timezone',
+          'open_minute', 'close_minute')
+SOURCE_LOOKUPS = ('id', 'name', 'house', 'street_id', 'street_id__name', 'street_id__city_id',
+                  'street_id__city_id__name', 'street_id__city_id__timezone', 'open_minute', 'close_minute')
+
+
+# Витрина заполняется из существующих магазинов, дальше ее поддерживает tutorials/listing.py
+def fill_listing(apps, schema_editor):
+    Shops = apps.get_model('tutorials', 'Shops')
+    ShopListing = apps.get_model('tutorials', 'ShopListing')
+    batch = []
+    for row in Shops.objects.order_by('id').values_list(*SOURCE_LOOKUPS).iterator(chunk_size=BATCH_SIZE):
+        batch.append(ShopListing(**dict(zip(FIELDS, row))))
+        if len(batch) == BATCH_SIZE:
+            ShopListing.objects.bulk_create(batch)
+            batch = []
+    ShopListing.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0011_city_timezone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopListing',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=10)),
+                ('house', models.CharField(max_length=10)),
+                ('street_id', models.BigIntegerField()),
+                ('street_name', models.CharField(max_length=30)),
+                ('city_id', models.BigIntegerField()),
+                ('city_name', models.CharField(max_length=30)),
+                ('timezone', models.CharField(max_length=64)),
+                ('open_minute', models.IntegerField()),
+                ('close_minute', models.IntegerField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='shoplisting',
+            index=models.Index(fields=['street_id', 'open_minute', 'close_minute'], name='listing_street_minutes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoplisting',
+            index=models.Index(fields=['city_id', 'open_minute', 'close_minute'], name='listing_city_minutes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoplisting',
+            index=models.Index(fields=['timezone', 'open_minute', 'close_minute'], name='listing_tz_minutes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoplisting',
+            index=models.Index(fields=['close_minute'], name='listing_close_minute_idx'),
+        ),
+        migrations.RunPython(fill_listing, migrations.RunPython.noop),
+    ]
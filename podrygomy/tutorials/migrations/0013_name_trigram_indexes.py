@@ -0,0 +1,39 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Поиск по названию (tutorials/search.py) на PostgreSQL: расширение pg_trgm и GIN-индексы по триграммам
+# названий магазинов (в витрине ShopListing, из которой читается GET /api/shop) и улиц.
+# Индексы обслуживают и сходство (оператор %), и совпадение с началом (ILIKE 'q%').
+# На других БД миграция ничего не делает (TrigramExtension тоже пропускает их) - там поиск идет по индексу
+# в памяти процесса.
+# Создание расширения требует прав владельца базы (или CREATE EXTENSION pg_trgm, выполненного администратором заранее).
+INDEXES = (
+    ('listing_name_trgm_idx', 'tutorials_shoplisting'),
+    ('street_name_trgm_idx', 'tutorials_street'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in INDEXES:
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (name gin_trgm_ops)')
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tutorials', '0012_shoplisting'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -1,9 +1,20 @@
+import datetime
+
+from django.conf import settings
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
+
+try:
+    import zoneinfo
+except ImportError:
+    from backports import zoneinfo
 
 
 class City(models.Model):
     id = models.BigAutoField(auto_created=True, primary_key=True)
     name = models.CharField(max_length=30, blank=False, unique=True, null=False)
+    # Часовой пояс города (имя из базы IANA), по нему определяется, открыт ли магазин сейчас
+    timezone = models.CharField(max_length=64, blank=False, null=False, default=settings.TIME_ZONE)
 
 
 class Street(models.Model):
@@ -11,11 +22,153 @@ class Street(models.Model):
     name = models.CharField(max_length=30, blank=False, null=False)
     city_id = models.ForeignKey(City, on_delete=models.RESTRICT, blank=False, null=False)
 
+    class Meta:
+        constraints = [
+            # Улица ищется по паре (город, название) - уникальность заодно дает индекс под этот поиск
+            models.UniqueConstraint(fields=['city_id', 'name'], name='street_city_name_unique'),
+        ]
+
+
+MINUTES_IN_DAY = 24 * 60
+
+
+# Окно работы магазина хранится в минутах от начала суток: open_minute от 0 до 1439 и close_minute от open_minute
+# до open_minute + 1440. Если магазин закрывается после полуночи, close_minute больше 1440 (22:00-02:00 -> 1320-1560).
+# Переводит время открытия и закрытия (минуты от 0 до 1440) в такое окно.
+# Одинаковое время открытия и закрытия означает, что магазин не работает.
+def opening_window(open_time, close_time):
+    if close_time < open_time:
+        close_time += MINUTES_IN_DAY
+    if open_time >= MINUTES_IN_DAY:
+        open_time -= MINUTES_IN_DAY
+        close_time -= MINUTES_IN_DAY
+    return open_time, close_time
+
+
+# Текущая минута суток в часовом поясе timezone_name
+def local_minute(timezone_name):
+    now = datetime.datetime.now(zoneinfo.ZoneInfo(timezone_name))
+    return now.hour * 60 + now.minute
+
+
+class ShopsQuerySet(models.QuerySet):
+    # Магазин открыт в минуту now (от 0 до 1439), если now попадает в окно [open_minute, close_minute)
+    # в текущих сутках или окно, начавшееся вчера, еще не закончилось (close_minute > now + 1440).
+    # Оба условия - диапазоны по индексируемым столбцам.
+    # Путь к часовому поясу города магазина (у витрины ShopListing пояс хранится в самой строке)
+    timezone_lookup = 'street_id__city_id__timezone'
+
+    @staticmethod
+    def open_condition(now):
+        return Q(open_minute__lte=now, close_minute__gt=now) | Q(close_minute__gt=now + MINUTES_IN_DAY)
+
+    # Обратное условие без NOT, чтобы фильтр закрытых магазинов тоже мог идти по индексу
+    @staticmethod
+    def closed_condition(now):
+        return Q(open_minute__gt=now, close_minute__lte=now + MINUTES_IN_DAY) | Q(close_minute__lte=now)
+
+    # now - минута суток, общая для всех городов, или словарь {часовой пояс: минута суток в этом поясе}
+    # со всеми поясами, которые есть у городов. Для нескольких поясов условие собирается в одно выражение
+    # (пояс = A AND условие для минуты A) OR (пояс = B AND условие для минуты B) ...,
+    # поэтому запрос по всем городам остается одним запросом, и каждая ветка может идти по индексу.
+    @classmethod
+    def _per_timezone(cls, condition, now):
+        if not isinstance(now, dict):
+            return condition(now)
+        if len(now) == 1:
+            return condition(*now.values())
+        if not now:
+            return Q(pk__in=[])
+        result = Q()
+        for timezone_name, minute in sorted(now.items()):
+            result |= Q(**{cls.timezone_lookup: timezone_name}) & condition(minute)
+        return result
+
+    def filter_open(self, now, is_open):
+        condition = self.open_condition if is_open else self.closed_condition
+        return self.filter(self._per_timezone(condition, now))
+
+    # Флаг открытия is_open (1 или 0) считается в SQL одним выражением на весь запрос
+    def annotate_open(self, now):
+        return self.annotate(is_open=Case(When(self._per_timezone(self.open_condition, now), then=Value(1)),
+                                          default=Value(0), output_field=models.IntegerField()))
+
+    # Минуты суток, в которые у какого-либо магазина меняется состояние открыт/закрыт.
+    # Между соседними границами результат фильтра и флаги open не меняются.
+    def opening_boundaries(self):
+        return self._boundaries(self.values_list('open_minute', 'close_minute').distinct())
+
+    async def aopening_boundaries(self):
+        return self._boundaries([window async for window in self.values_list('open_minute', 'close_minute').distinct()])
+
+    @staticmethod
+    def _boundaries(windows):
+        boundaries = set()
+        for open_minute, close_minute in windows:
+            boundaries.add(open_minute)
+            boundaries.add(close_minute % MINUTES_IN_DAY)
+        return sorted(boundaries)
+
 
 class Shops(models.Model):
     id = models.BigAutoField(auto_created=True, primary_key=True)
     name = models.CharField(max_length=10, blank=False, null=False)
-    street_id = models.ForeignKey(Street, on_delete=models.RESTRICT, blank=False, null=False, default='0')
+    # Отдельный индекс по street_id не нужен: его заменяет составной индекс shops_street_minutes_idx
+    street_id = models.ForeignKey(Street, on_delete=models.RESTRICT, blank=False, null=False, default='0',
+                                  db_index=False)
     house = models.CharField(max_length=10, default='0')
-    open_time = models.IntegerField(blank=False, null=False)
-    close_time = models.IntegerField(blank=False, null=False)
+    open_minute = models.IntegerField(blank=False, null=False)
+    close_minute = models.IntegerField(blank=False, null=False)
+
+    objects = ShopsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Фильтр магазинов улицы по времени работы
+            models.Index(fields=['street_id', 'open_minute', 'close_minute'], name='shops_street_minutes_idx'),
+            # Фильтр открытых/закрытых магазинов без привязки к улице
+            models.Index(fields=['open_minute', 'close_minute'], name='shops_minutes_idx'),
+            # Магазины, которые работают после полуночи
+            models.Index(fields=['close_minute'], name='shops_close_minute_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=Q(open_minute__gte=0, open_minute__lt=MINUTES_IN_DAY,
+                                           close_minute__gte=F('open_minute'),
+                                           close_minute__lte=F('open_minute') + MINUTES_IN_DAY),
+                                   name='shops_opening_window'),
+        ]
+
+    def is_open_at(self, now):
+        return self.open_minute <= now < self.close_minute or self.close_minute > now + MINUTES_IN_DAY
+
+
+class ShopListingQuerySet(ShopsQuerySet):
+    timezone_lookup = 'timezone'
+
+
+# Витрина для чтения списка магазинов (GET /api/shop): магазин вместе с названиями улицы и города
+# и часовым поясом города, чтобы список читался из одной таблицы без JOIN с Street и City.
+# id совпадает с Shops.id. Строки обновляются при записи (signals.py, bulk.py), модуль listing.py
+# пересобирает витрину (команда rebuild_shop_listing) и сверяет ее с Shops, Street и City (check_shop_listing).
+class ShopListing(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    name = models.CharField(max_length=10)
+    house = models.CharField(max_length=10)
+    street_id = models.BigIntegerField()
+    street_name = models.CharField(max_length=30)
+    city_id = models.BigIntegerField()
+    city_name = models.CharField(max_length=30)
+    timezone = models.CharField(max_length=64)
+    open_minute = models.IntegerField()
+    close_minute = models.IntegerField()
+
+    objects = ShopListingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Те же фильтры, что и у индексов Shops, плюс фильтр по городу без JOIN
+            models.Index(fields=['street_id', 'open_minute', 'close_minute'], name='listing_street_minutes_idx'),
+            models.Index(fields=['city_id', 'open_minute', 'close_minute'], name='listing_city_minutes_idx'),
+            models.Index(fields=['timezone', 'open_minute', 'close_minute'], name='listing_tz_minutes_idx'),
+            models.Index(fields=['close_minute'], name='listing_close_minute_idx'),
+        ]
@@ -0,0 +1,74 @@
+from rest_framework import status
+from rest_framework.response import Response
+import logging
+
+from .columnar import columnar_response, wants_columnar
+from .renderers import json_response
+
+_logger = logging.getLogger(__name__)
+
+# Максимальный размер страницы, который может запросить клиент
+MAX_LIMIT = 1000
+
+
+# Курсорная (keyset) пагинация по id.
+# Включается параметром limit, параметр after - id последнего объекта предыдущей страницы.
+# Страница выбирается условием id > after с сортировкой по id, поэтому ее стоимость не зависит от размера таблицы.
+# Строки страницы читаются через reader (см. readers.py), в колоночном формате results - объект из columnar.py.
+# Если limit не передан, возвращает None и представление отдает весь список как раньше.
+def paginate(request, queryset, reader):
+    limit, page_queryset, error = _page(request.query_params, queryset)
+    if error is not None:
+        return Response(error, status=status.HTTP_400_BAD_REQUEST)
+    if page_queryset is None:
+        return None
+    return _page_response(request, reader, reader.tuples(page_queryset), limit)
+
+
+# То же для асинхронных представлений (async_views.py): страница читается через асинхронный ORM
+async def apaginate(request, queryset, reader):
+    limit, page_queryset, error = _page(request.GET, queryset)
+    if error is not None:
+        return json_response(error, status=status.HTTP_400_BAD_REQUEST)
+    if page_queryset is None:
+        return None
+    return _page_response(request, reader, await reader.atuples(page_queryset), limit)
+
+
+# Возвращает (limit, queryset страницы, сообщение об ошибке)
+def _page(params, queryset):
+    var_limit = params.get('limit')
+    var_after = params.get('after')
+    if var_limit is None:
+        return None, None, None
+
+    _logger.debug("Pagination with limit %s after %s", var_limit, var_after)
+    limit = parse_number(var_limit)
+    if limit is None or not 0 < limit <= MAX_LIMIT:
+        _logger.warning("Parameter limit %s is not valid. 400 response is returned", var_limit)
+        return None, None, f'limit dolzhen byt ot 1 do {MAX_LIMIT}'
+    after = parse_number(var_after) if var_after is not None else None
+    if var_after is not None and after is None:
+        _logger.warning("Parameter after %s not number. 400 response is returned", var_after)
+        return None, None, 'after dolzhen byt chislom'
+
+    queryset = queryset.order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    # Берем на один объект больше, чтобы понять, есть ли следующая страница
+    return limit, queryset[:limit + 1], None
+
+
+# Неотрицательное целое из параметра запроса или None, если это не число.
+# str.isdigit() пропускает и другие цифры Юникода (например, '²'), которые int() не разбирает
+def parse_number(value):
+    if not value.isascii() or not value.isdigit():
+        return None
+    return int(value)
+
+
+def _page_response(request, reader, page, limit):
+    next_cursor = page[limit - 1][reader.keys.index('id')] if len(page) > limit else None
+    if wants_columnar(request):
+        return columnar_response({'results': reader.to_columns(page[:limit]), 'next': next_cursor})
+    return json_response({'results': reader.to_rows(page[:limit]), 'next': next_cursor})
@@ -0,0 +1,117 @@
+import collections
+import threading
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Размер пула по умолчанию, если в настройках БД не задан POOL_SIZE
+DEFAULT_POOL_SIZE = 10
+
+
+# Пул открытых соединений с БД внутри процесса.
+# Django закрывает соединение в конце запроса (CONN_MAX_AGE = 0), а бэкенды tutorials/backends/ вместо закрытия
+# возвращают его в пул, и следующий запрос любого потока забирает уже открытое соединение.
+# size - сколько свободных соединений держится открытыми, лишние закрываются.
+# Одновременно занятых соединений может быть больше: если свободных нет, открывается новое.
+class ConnectionPool:
+    def __init__(self, size):
+        self.size = size
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._idle)
+
+    def acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return None
+
+    # False, если пул заполнен и соединение нужно закрыть
+    def release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                return True
+        return False
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for connection in idle:
+            _close_quietly(connection)
+
+
+# Пулы по параметрам подключения: у тестовой базы другое имя, и ее соединения попадают в отдельный пул
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, size):
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(size)
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        _logger.debug("Pooled connection was already closed", exc_info=True)
+
+
+def _ping(connection):
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+# Подмешивается к DatabaseWrapper бэкенда Django (см. tutorials/backends/).
+# При CONN_HEALTH_CHECKS соединение из пула перед выдачей проверяется запросом SELECT 1,
+# разорванные соединения закрываются и заменяются новыми.
+# Перед возвратом в пул незавершенная транзакция откатывается. Соединения, закрываемые внутри atomic-блока
+# или после ошибки, из-за которой они стали непригодны, в пул не возвращаются.
+class PooledDatabaseWrapperMixin:
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        # Пул выбирается при каждом подключении: тестовый раннер меняет имя базы у того же DatabaseWrapper
+        key = (self.vendor, repr(sorted(conn_params.items())))
+        self.pool = get_pool(key, self.settings_dict.get('POOL_SIZE', DEFAULT_POOL_SIZE))
+        while True:
+            connection = self.pool.acquire()
+            if connection is None:
+                _logger.debug("Opening a new %s connection for the pool", self.vendor)
+                return super().get_new_connection(conn_params)
+            if not self.settings_dict['CONN_HEALTH_CHECKS'] or _ping(connection):
+                return connection
+            _logger.warning("Pooled %s connection failed the health check and was discarded", self.vendor)
+            _close_quietly(connection)
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+            return super()._close()
+        try:
+            self.connection.rollback()
+        except Exception:
+            return super()._close()
+        if not self.pool.release(self.connection):
+            return super()._close()
@@ -0,0 +1,80 @@
+import logging
+
+from .metrics import serializing
+
+_logger = logging.getLogger(__name__)
+
+
+# Чтение списков для GET-запросов без сериализаторов DRF.
+# ModelSerializer(many=True) на каждую строку создает объект модели и обходит поля сериализатора,
+# на больших списках это основная часть времени ответа. Здесь строки читаются через values_list()
+# сразу нужными столбцами и превращаются в словари с теми же ключами и в том же порядке, что и у сериализатора,
+# поэтому JSON ответа совпадает байт в байт.
+# fields - пары (ключ в JSON, путь поля для values_list). Значения отдаются как есть из БД,
+# поэтому подходят только поля, которые сериализатор выводит без преобразования (числа и строки).
+# Сериализаторы DRF по-прежнему используются для записи и проверки данных.
+# dictionary - ключи столбцов, которые в колоночном формате (см. columnar.py) кодируются словарем:
+# значения, повторяющиеся из строки в строку, передаются один раз, а в столбце остаются их номера.
+class ValuesReader:
+    def __init__(self, *fields, dictionary=()):
+        self.keys = tuple(key for key, _ in fields)
+        self.lookups = tuple(lookup for _, lookup in fields)
+        self.dictionary = tuple(dictionary)
+
+    def tuples(self, queryset):
+        return list(queryset.values_list(*self.lookups))
+
+    # Для асинхронных представлений
+    async def atuples(self, queryset):
+        return [row async for row in queryset.values_list(*self.lookups)]
+
+    def rows(self, queryset):
+        return self.to_rows(self.tuples(queryset))
+
+    def columns(self, queryset):
+        return self.to_columns(self.tuples(queryset))
+
+    def to_rows(self, tuples):
+        keys = self.keys
+        with serializing():
+            return [dict(zip(keys, row)) for row in tuples]
+
+    # Колоночное представление: по массиву значений на каждый ключ, значения столбцов из dictionary
+    # заменены номерами в списке dictionaries[ключ]
+    def to_columns(self, tuples):
+        with serializing():
+            values = list(zip(*tuples)) if tuples else [()] * len(self.keys)
+            columns = {key: list(column) for key, column in zip(self.keys, values)}
+            dictionaries = {}
+            for key in self.dictionary:
+                index = {}
+                columns[key] = [index.setdefault(value, len(index)) for value in columns[key]]
+                dictionaries[key] = list(index)
+        return {'count': len(tuples), 'columns': columns, 'dictionaries': dictionaries}
+
+    # Построчное чтение порциями по chunk_size, для потоковой выдачи
+    def iterator(self, queryset, chunk_size):
+        keys = self.keys
+        for row in queryset.values_list(*self.lookups).iterator(chunk_size=chunk_size):
+            yield dict(zip(keys, row))
+
+
+# Поля и их порядок совпадают с CitySerializer, StreetSerializer и ShopsSerializer
+city_reader = ValuesReader(('id', 'id'),
+                           ('name', 'name'),
+                           ('timezone', 'timezone'))
+
+street_reader = ValuesReader(('id', 'id'),
+                             ('name', 'name'),
+                             ('city_id', 'city_id__name'),
+                             dictionary=('city_id',))
+
+# Магазины читаются из витрины ShopListing без JOIN, флаг open берется из аннотации is_open
+# (ShopListing.objects.annotate_open)
+shop_reader = ValuesReader(('id', 'id'),
+                           ('name', 'name'),
+                           ('street_id', 'street_name'),
+                           ('house', 'house'),
+                           ('city_name', 'city_name'),
+                           ('open', 'is_open'),
+                           dictionary=('street_id', 'city_name'))
@@ -0,0 +1,298 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, models, transaction
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.db.models.functions import Lower
+from rest_framework import status
+import bisect
+import collections
+import itertools
+import logging
+import math
+import re
+import threading
+import time
+
+from .columnar import columnar_response, wants_columnar
+from .pagination import MAX_LIMIT, parse_number
+from .renderers import json_response
+
+_logger = logging.getLogger(__name__)
+
+# Поиск по названию (параметр q у GET /api/shop и GET /api/street): совпадение с началом названия
+# без учета регистра или похожее название (сходство по триграммам, как в расширении pg_trgm).
+# Результаты упорядочены по релевантности: сначала названия, начинающиеся с q, затем остальные по убыванию
+# сходства, при равенстве - по названию и id. Выдача постраничная: limit (по умолчанию SEARCH_LIMIT) и offset,
+# next - offset следующей страницы.
+# На PostgreSQL поиск идет в SQL по GIN-индексам pg_trgm (миграция 0013), на остальных БД - по индексу
+# в памяти процесса (NameIndex), который строится при первом поиске и дальше меняется при записи в таблицу.
+
+# Порог сходства, как pg_trgm.similarity_threshold по умолчанию
+SIMILARITY_THRESHOLD = 0.3
+# Размер страницы, если limit не передан
+SEARCH_LIMIT = 20
+# Названия улиц и магазинов не длиннее 30 символов, более длинный запрос ничего не найдет
+MAX_QUERY_LENGTH = 30
+# Глубже этого offset выдача не листается: страница с большим offset на остальных БД требует проверить
+# в БД все найденные до нее id, и ее стоимость растет вместе с offset
+MAX_OFFSET = 10000
+# Сколько найденных id проверяется одним запросом к БД (фильтры city, street, open) на остальных БД
+CHUNK_SIZE = 500
+# Релевантность совпадения с началом названия - больше любого сходства
+PREFIX_RANK = 2.0
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+# Начало названия без учета регистра через ILIKE: в отличие от istartswith (UPPER(...) LIKE ...),
+# такое условие тоже идет по GIN-индексу pg_trgm. Как lookup не регистрируется - используется только
+# выражением в _ranked_queryset, поэтому у полей моделей не появляется лишних lookup
+class PrefixILike(models.Lookup):
+    # Запрос - строка, которая экранируется в get_db_prep_lookup. Без этого при левой части F('name')
+    # Django обернул бы ее в Value, и экранирование с '%' в конце не выполнилось бы
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [connection.ops.prep_for_like_query(value) + '%']
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '%s ILIKE %s' % (lhs, rhs), lhs_params + rhs_params
+
+
+# Триграммы, как их считает pg_trgm: текст в нижнем регистре делится на слова из букв и цифр,
+# каждое слово дополняется двумя пробелами в начале и одним в конце
+def trigrams(text):
+    result = set()
+    for word in _WORD.findall(text.lower()):
+        word = '  %s ' % word
+        result.update(word[index:index + 3] for index in range(len(word) - 2))
+    return result
+
+
+def similarity(first, second):
+    if not first or not second:
+        return 0.0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+# Индекс названий в памяти процесса для БД без pg_trgm.
+# Для совпадений с началом - список (название в нижнем регистре, id), отсортированный для bisect.
+# Для похожих названий - множества id по каждой триграмме. Кандидаты собираются только по самым редким
+# триграммам запроса: название со сходством не ниже порога обязано содержать хотя бы одну из
+# m - ceil(порог * m) + 1 триграмм запроса (m - число триграмм запроса), поэтому поиск точный,
+# а частые триграммы вроде "  s" не заставляют перебирать всю таблицу.
+# Индекс меняется по одному названию (add, remove) при записи в таблицу, поэтому чтение и изменение
+# идут под блокировкой; совпадения с началом читаются порциями от последнего прочитанного ключа,
+# и изменения между порциями не сдвигают обход.
+class NameIndex:
+    def __init__(self, rows):
+        self.names = {}
+        self.postings = collections.defaultdict(set)
+        self.sorted = []
+        self.lock = threading.RLock()
+        for row_id, name in rows:
+            self._add_trigrams(row_id, name)
+        self.sorted = sorted((name.lower(), row_id) for row_id, name in self.names.items())
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add_trigrams(self, row_id, name):
+        self.names[row_id] = name
+        for trigram in trigrams(name):
+            self.postings[trigram].add(row_id)
+
+    def add(self, row_id, name):
+        with self.lock:
+            if self.names.get(row_id) == name:
+                return
+            self.remove(row_id)
+            self._add_trigrams(row_id, name)
+            bisect.insort(self.sorted, (name.lower(), row_id))
+
+    def remove(self, row_id):
+        with self.lock:
+            name = self.names.pop(row_id, None)
+            if name is None:
+                return
+            for trigram in trigrams(name):
+                posting = self.postings[trigram]
+                posting.discard(row_id)
+                if not posting:
+                    del self.postings[trigram]
+            position = bisect.bisect_left(self.sorted, (name.lower(), row_id))
+            if position < len(self.sorted) and self.sorted[position] == (name.lower(), row_id):
+                del self.sorted[position]
+
+    # id в порядке релевантности. Похожие названия ищутся, только если совпадений с началом не хватило на страницу
+    def ranked(self, query):
+        prefixed = set()
+        for row_id in self.prefixed(query):
+            prefixed.add(row_id)
+            yield row_id
+        for _, _, row_id in self.similar(query, exclude=prefixed):
+            yield row_id
+
+    def prefixed(self, query):
+        query = query.lower()
+        key = (query,)
+        while True:
+            with self.lock:
+                position = bisect.bisect_right(self.sorted, key)
+                chunk = self.sorted[position:position + CHUNK_SIZE]
+            for name, row_id in chunk:
+                if not name.startswith(query):
+                    return
+                yield row_id
+            if len(chunk) < CHUNK_SIZE:
+                return
+            key = chunk[-1]
+
+    # Список (-сходство, название в нижнем регистре, id) по возрастанию
+    def similar(self, query, exclude=()):
+        query_trigrams = trigrams(query)
+        if not query_trigrams:
+            return []
+        required = math.ceil(SIMILARITY_THRESHOLD * len(query_trigrams) - 1e-9)
+        with self.lock:
+            rarest = sorted(query_trigrams, key=lambda trigram: len(self.postings.get(trigram, ())))
+            candidates = set()
+            for trigram in rarest[:len(query_trigrams) - required + 1]:
+                candidates.update(self.postings.get(trigram, ()))
+            names = [(row_id, self.names[row_id]) for row_id in candidates - set(exclude)]
+        result = []
+        for row_id, name in names:
+            value = similarity(query_trigrams, trigrams(name))
+            if value >= SIMILARITY_THRESHOLD:
+                result.append((-value, name.lower(), row_id))
+        result.sort()
+        return result
+
+
+# Таблица -> (время построения по time.monotonic, индекс)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+# Индекс названий таблицы table ('shop' или 'street'). Записи этого процесса попадают в индекс сразу
+# после коммита (index_names, remove_name из signals.py и bulk.py), поэтому индекс не перестраивается
+# после каждой записи. Записи других процессов сервера, QuerySet.update() и запись в обход ORM индекс
+# не видит, поэтому он строится заново, если старше settings.SEARCH_INDEX_MAX_AGE секунд.
+def get_index(table, queryset):
+    cached = _indexes.get(table)
+    if cached is not None and time.monotonic() - cached[0] < settings.SEARCH_INDEX_MAX_AGE:
+        return cached[1]
+    with _indexes_lock:
+        cached = _indexes.get(table)
+        if cached is None or time.monotonic() - cached[0] >= settings.SEARCH_INDEX_MAX_AGE:
+            built = time.monotonic()
+            index = NameIndex(queryset.values_list('id', 'name').iterator(chunk_size=10000))
+            _logger.debug("Search index for %s built with %s names", table, len(index))
+            cached = _indexes[table] = (built, index)
+    return cached[1]
+
+
+# Сбрасывает индексы таблиц tables (по умолчанию все), они построятся заново при следующем поиске
+def clear_indexes(*tables):
+    for table in tables or list(_indexes):
+        _indexes.pop(table, None)
+
+
+# Изменения применяются после коммита: откаченная запись в индекс не попадает.
+# Если индекс еще не построен (или БД - PostgreSQL, где он не нужен), делать нечего
+def index_names(table, rows):
+    rows = list(rows)
+    transaction.on_commit(lambda: _update(table, rows, ()))
+
+
+def remove_name(table, row_id):
+    transaction.on_commit(lambda: _update(table, (), (row_id,)))
+
+
+def _update(table, rows, removed):
+    cached = _indexes.get(table)
+    if cached is None:
+        return
+    index = cached[1]
+    for row_id, name in rows:
+        # bulk_create заполняет id не на всех БД, такие строки индекс увидит после перестройки
+        if row_id is not None:
+            index.add(row_id, name)
+    for row_id in removed:
+        index.remove(row_id)
+
+
+# Страница результатов поиска: строки reader из queryset, где название похоже на query.
+# Возвращает строки страницы и еще одну, если есть следующая страница.
+# table - имя индекса в памяти ('shop' или 'street'), source - queryset, из которого он строится
+def search_rows(queryset, reader, query, offset, limit, table, source):
+    if connection.vendor == 'postgresql':
+        return reader.tuples(_ranked_queryset(queryset, query)[offset:offset + limit + 1])
+    return _indexed_rows(queryset, reader, get_index(table, source).ranked(query), offset, limit)
+
+
+# Сходство - lookup trigram_similar (оператор %) и TrigramSimilarity из django.contrib.postgres
+def _ranked_queryset(queryset, query):
+    rank = Case(When(PrefixILike(F('name'), query), then=Value(PREFIX_RANK)),
+                default=TrigramSimilarity('name', query), output_field=FloatField())
+    return (queryset.filter(Q(PrefixILike(F('name'), query)) | Q(name__trigram_similar=query))
+            .annotate(rank=rank).order_by('-rank', Lower('name'), 'id'))
+
+
+# Найденные в индексе id проверяются в БД порциями по CHUNK_SIZE: остаются строки, подходящие под остальные
+# фильтры queryset, в порядке релевантности. Чтение останавливается, как только набралась страница
+def _indexed_rows(queryset, reader, ranked_ids, offset, limit):
+    id_position = reader.lookups.index('id')
+    rows = []
+    skipped = 0
+    while True:
+        chunk = list(itertools.islice(ranked_ids, CHUNK_SIZE))
+        if not chunk:
+            return rows
+        found = {row[id_position]: row for row in reader.tuples(queryset.filter(id__in=chunk))}
+        for row_id in chunk:
+            row = found.get(row_id)
+            if row is None:
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            rows.append(row)
+            if len(rows) > limit:
+                return rows
+
+
+# Проверка параметров q, limit и offset. Возвращает (q, offset, limit, None) или (None, None, None, ошибка)
+def search_params(params):
+    query = params.get('q', '').strip()
+    var_limit = params.get('limit', str(SEARCH_LIMIT))
+    var_offset = params.get('offset', '0')
+    if not query or len(query) > MAX_QUERY_LENGTH:
+        _logger.warning("Search query of length %s is not valid. 400 response is returned", len(query))
+        return None, None, None, f'q dolzhen byt ot 1 do {MAX_QUERY_LENGTH} simvolov'
+    limit = parse_number(var_limit)
+    if limit is None or not 0 < limit <= MAX_LIMIT:
+        _logger.warning("Parameter limit %s is not valid. 400 response is returned", var_limit)
+        return None, None, None, f'limit dolzhen byt ot 1 do {MAX_LIMIT}'
+    offset = parse_number(var_offset)
+    if offset is None or offset > MAX_OFFSET:
+        _logger.warning("Parameter offset %s is not valid. 400 response is returned", var_offset)
+        return None, None, None, f'offset dolzhen byt ot 0 do {MAX_OFFSET}'
+    return query, offset, limit, None
+
+
+# Ответ поиска в формате постраничной выдачи (pagination.py), next - offset следующей страницы.
+# Функция синхронная, асинхронные представления вызывают ее через sync_to_async
+def search_response(request, params, queryset, reader, table, source):
+    query, offset, limit, error = search_params(params)
+    if error is not None:
+        return json_response(error, status=status.HTTP_400_BAD_REQUEST)
+    _logger.debug("Search %r in %s, offset %s, limit %s", query, table, offset, limit)
+    rows = search_rows(queryset, reader, query, offset, limit, table, source)
+    next_offset = offset + limit if len(rows) > limit and offset + limit <= MAX_OFFSET else None
+    if wants_columnar(request):
+        return columnar_response({'results': reader.to_columns(rows[:limit]), 'next': next_offset})
+    return json_response({'results': reader.to_rows(rows[:limit]), 'next': next_offset})
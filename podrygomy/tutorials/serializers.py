@@ -1,11 +1,15 @@
-import datetime
-
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
-from rest_framework.generics import get_object_or_404
 
+from .lookups import get_or_create_city, get_or_create_street
 from .models import *
 import logging
 
+try:
+    import zoneinfo
+except ImportError:
+    from backports import zoneinfo
+
 _logger = logging.getLogger(__name__)
 
 
@@ -13,7 +17,15 @@ class CitySerializer(serializers.ModelSerializer):
     class Meta:
         model = City
         fields = ('id',
-                  'name',)
+                  'name',
+                  'timezone',)
+
+    def validate_timezone(self, value):
+        try:
+            zoneinfo.ZoneInfo(value)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise serializers.ValidationError('Unknown time zone "%s".' % value)
+        return value
 
 
 class StreetSerializer(serializers.ModelSerializer):
@@ -32,20 +44,40 @@ class StreetSerializer(serializers.ModelSerializer):
         city_data = validated_data.pop('city_id')
         _logger.debug("City data: %s", city_data)
 
-        # Ищем в базе по названию
-        city = City.objects.filter(name=city_data.get("name"))
+        # Ищем город в базе по названию, если такого нет - создаем
+        city = get_or_create_city(city_data.get("name"))
 
-        # Если в базе такого объекта нет - создаем
-        if not city:
-            _logger.debug("City by name %s not found in data base. Start creating", city_data.get("name"))
-            City.objects.get_or_create(**city_data)
+        # Пара (город, название) уникальна на уровне БД - повторную улицу не создаем
+        try:
+            with transaction.atomic():
+                street = Street.objects.create(city_id=city, **validated_data)
+        except IntegrityError:
+            _logger.warning("Street %s already exists in city %s", validated_data.get("name"), city.name)
+            raise serializers.ValidationError({'name': ['street with this name already exists in this city.']})
+        return street
 
-        # Получаем объект из базы
-        city = get_object_or_404(City, name=city_data.get("name"))
-        _logger.debug("Object data City from table: %s", city)
 
-        street = Street.objects.create(city_id=city, **validated_data)
-        return street
+# Время открытия или закрытия магазина: целый час от 0 до 24 (как раньше) или строка "ЧЧ:ММ".
+# Во внутреннем представлении - минуты от начала суток (от 0 до 1440).
+class OpeningTimeField(serializers.Field):
+    default_error_messages = {
+        'invalid': 'A valid hour from 0 to 24 or time in HH:MM format is required.',
+    }
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool) or not isinstance(data, (int, str)):
+            self.fail('invalid')
+        hours, separator, minutes = str(data).strip().partition(':')
+        if separator:
+            valid = hours.isdigit() and len(minutes) == 2 and minutes.isdigit() and int(minutes) < 60
+        else:
+            valid, minutes = hours.isdigit(), '0'
+        if not valid or int(hours) * 60 + int(minutes) > MINUTES_IN_DAY:
+            self.fail('invalid')
+        return int(hours) * 60 + int(minutes)
+
+    def to_representation(self, value):
+        return '%02d:%02d' % divmod(value, 60)
 
 
 class ShopsSerializer(serializers.ModelSerializer):
@@ -56,8 +88,8 @@ class ShopsSerializer(serializers.ModelSerializer):
     city_name = serializers.CharField(source='street_id.city_id.name', read_only=True)
     # Указываем поля только для записи (при получении json объекта они отображаться не должны)
     city = serializers.CharField(write_only=True)
-    open_time = serializers.IntegerField(write_only=True)
-    close_time = serializers.IntegerField(write_only=True)
+    open_time = OpeningTimeField(write_only=True)
+    close_time = OpeningTimeField(write_only=True)
 
     # Флаг открытия/закрытия магазина
     # Значение определяется в методе set_open
@@ -83,56 +115,43 @@ class ShopsSerializer(serializers.ModelSerializer):
             'open': {'read_only': True},
         }
 
+    # Время открытия и закрытия сохраняются окном работы в минутах, в том числе после полуночи
+    def validate(self, attrs):
+        attrs['open_minute'], attrs['close_minute'] = opening_window(attrs.pop('open_time'), attrs.pop('close_time'))
+        return attrs
+
+    # Магазин и его строка в витрине ShopListing (сигнал post_save, listing.py) записываются в одной транзакции:
+    # GET /api/shop читает только витрину, и магазин без строки в ней не попал бы в список
+    @transaction.atomic
     def create(self, validated_data):
         _logger.debug("Start creating Shop object")
 
         # Извлекаем полученные данные для города
         city_data = validated_data.pop('city')
         _logger.debug("City data: %s", city_data)
-        city_data = dict.fromkeys({'name'}, city_data)
-        _logger.debug("Added to dict: %s", city_data)
-
-        # Ищем в базе по названию
-        city = City.objects.filter(name=city_data.get("name"))
-
-        # Если в базе такого объекта нет - создаем
-        if not city:
-            _logger.debug("City by name %s not found in data base. Start creating", city_data.get("name"))
-            City.objects.get_or_create(**city_data)
 
-        # Получаем объект из базы
-        city = get_object_or_404(City, name=city_data.get("name"))
-        _logger.debug("Object data City from table: %s", city)
+        # Ищем город в базе по названию, если такого нет - создаем
+        city = get_or_create_city(city_data)
 
         # Извлекаем полученные данные для улицы
         street_data = validated_data.pop('street_id')
         _logger.debug("Street data: %s", street_data)
 
-        # Ищем в базе по названию и идентификатору города
-        street = Street.objects.filter(name=street_data.get("name"), city_id=city.id)
-        _logger.debug("Object data Street from table: %s", street)
-
-        # Если в базе такого объекта нет - создаем
-        if not street:
-            _logger.debug("Street by name %s and city_id %s not found in data base. Start creating. "
-                          + "\nStreet data before add city_id: %s",
-                          street_data.get("name"), str(city.id), street_data)
-            street_data['city_id'] = city
-            Street.objects.get_or_create(**street_data)
-
-        # Получаем объект из базы
-        street = get_object_or_404(Street, name=street_data.get("name"), city_id=city.id)
+        # Ищем улицу в базе по названию и городу, если такой нет - создаем
+        street = get_or_create_street(street_data.get("name"), city)
 
         shop = Shops.objects.create(street_id=street, **validated_data)
         return shop
 
     # # Метод определят значение для флага open
-    @staticmethod
-    def set_open(obj):
-        open_time = obj.open_time
-        close_time = obj.close_time
-        now = datetime.datetime.now().hour
-        if int(open_time) <= now < int(close_time):
-            return 1
-        else:
-            return 0
+    # В списках флаг уже посчитан в SQL (Shops.objects.annotate_open), здесь он только читается.
+    # Для только что созданных магазинов считается по минуте суток в часовом поясе города:
+    # из контекста ({часовой пояс: минута}) или по текущему времени.
+    def set_open(self, obj):
+        if hasattr(obj, 'is_open'):
+            return obj.is_open
+        timezone_name = obj.street_id.city_id.timezone
+        now = self.context.get('now', {}).get(timezone_name)
+        if now is None:
+            now = local_minute(timezone_name)
+        return 1 if obj.is_open_at(now) else 0
@@ -0,0 +1,83 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import listing, search
+from .caching import bump_version
+from .lookups import city_cache, street_cache
+from .models import *
+
+
+# Любая запись меняет версию таблицы для кэша ответов.
+# В кэше поиска новая запись быть не может, поэтому его сбрасываем только при изменении и удалении
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def forget_city(sender, instance, created=False, **kwargs):
+    bump_version('city')
+    if created:
+        return
+    city_cache.discard(lambda name, cached: cached[0] == instance.id)
+    street_cache.discard(lambda key, street_id: key[0] == instance.id)
+
+
+@receiver(post_save, sender=Street)
+@receiver(post_delete, sender=Street)
+def forget_street(sender, instance, created=False, **kwargs):
+    bump_version('street')
+    if created:
+        return
+    street_cache.discard(lambda key, street_id: street_id == instance.id)
+
+
+@receiver(post_save, sender=Shops)
+@receiver(post_delete, sender=Shops)
+def forget_shop(sender, instance, **kwargs):
+    bump_version('shop')
+
+
+# Витрина ShopListing (listing.py) обновляется при каждой записи магазинов, улиц и городов.
+# Новые улицы и города без магазинов в витрину не попадают, поэтому для них ничего не делаем.
+# Массовое создание магазинов (bulk.py) сигналов не отправляет и добавляет строки витрины само.
+# QuerySet.update(), bulk_update() и запись в базу в обход ORM сигналов тоже не отправляют, витрина после них
+# расходится с таблицами - ее нужно пересобрать командой rebuild_shop_listing (сверка - check_shop_listing).
+@receiver(post_save, sender=Shops)
+def save_shop_listing(sender, instance, created, **kwargs):
+    listing.save_shop(instance, created)
+
+
+@receiver(post_delete, sender=Shops)
+def delete_shop_listing(sender, instance, **kwargs):
+    listing.delete_shop(instance)
+
+
+@receiver(post_save, sender=Street)
+def save_street_listing(sender, instance, created, **kwargs):
+    if not created:
+        listing.update_street(instance)
+
+
+@receiver(post_save, sender=City)
+def save_city_listing(sender, instance, created, **kwargs):
+    if not created:
+        listing.update_city(instance)
+
+
+# Индекс поиска в памяти процесса (search.py) меняется по одному названию, без перестройки по всей таблице.
+# Изменения, которые прошли мимо сигналов, индекс увидит после перестройки по settings.SEARCH_INDEX_MAX_AGE
+@receiver(post_save, sender=Shops)
+def index_shop_name(sender, instance, **kwargs):
+    search.index_names('shop', [(instance.id, instance.name)])
+
+
+@receiver(post_save, sender=Street)
+def index_street_name(sender, instance, **kwargs):
+    search.index_names('street', [(instance.id, instance.name)])
+
+
+@receiver(post_delete, sender=Shops)
+def remove_shop_name(sender, instance, **kwargs):
+    search.remove_name('shop', instance.id)
+
+
+@receiver(post_delete, sender=Street)
+def remove_street_name(sender, instance, **kwargs):
+    search.remove_name('street', instance.id)
@@ -0,0 +1,43 @@
+from django.http.response import StreamingHttpResponse
+import logging
+
+from .metrics import serializing
+from .renderers import get_renderer
+
+_logger = logging.getLogger(__name__)
+
+# Сколько объектов читается из БД и сериализуется за один шаг
+CHUNK_SIZE = 2000
+
+
+# Отдает queryset JSON-массивом по частям.
+# Строки читаются через reader (см. readers.py) порциями по CHUNK_SIZE и сразу кодируются,
+# поэтому в памяти одновременно находится только одна порция, сколько бы строк ни было в таблице.
+# Результат совпадает байт в байт с json_response(reader.rows(queryset)) (см. renderers.py).
+def stream_json_array(queryset, reader):
+    return StreamingHttpResponse(_json_array_chunks(queryset, reader, CHUNK_SIZE),
+                                 content_type='application/json')
+
+
+def _json_array_chunks(queryset, reader, chunk_size):
+    _logger.debug("Start streaming %s objects by %s", queryset.model.__name__, chunk_size)
+    renderer = get_renderer()
+    yield b'['
+    separator = b''
+    chunk = []
+    for row in reader.iterator(queryset, chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield separator + _encode_chunk(renderer, chunk)
+            separator = renderer.separator
+            chunk = []
+    if chunk:
+        yield separator + _encode_chunk(renderer, chunk)
+    yield b']'
+
+
+# Порция кодируется целым списком, от которого отрезаются скобки, - элементы внутри разделены так же,
+# как в ответе без потоковой выдачи
+def _encode_chunk(renderer, chunk):
+    with serializing():
+        return renderer.dumps(chunk)[1:-1]
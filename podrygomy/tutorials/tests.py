@@ -1,7 +1,42 @@
-from unittest import mock
-
-from django.test import TestCase
-
+import asyncio
+import contextlib
+import decimal
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock, skipIf
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.postgres.lookups import TrigramSimilar
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgreSQLWrapper
+from django.db.models import Model, QuerySet
+from django.http.response import JsonResponse
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.translation import gettext_lazy
+
+from podrygomy import settings as project_settings
+
+from . import async_views, checks, listing, metrics, middleware, renderers, search
+from .log import QueueStreamHandler
+from .backends.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from .columnar import MEDIA_TYPE, decode_columns
+from .lookups import LRUCache, city_cache, clear_lookup_caches, get_or_create_city, get_or_create_street, street_cache
+from .readers import city_reader, shop_reader, street_reader
+from .renderers import json_response
 from .models import *
 from .views import *
 
@@ -9,6 +44,109 @@ from .views import *
 # Created by https://developer.mozilla.org/en-US/docs/Learn/Server-side/Django/Testing
 
 
+# Бюджет запросов к БД на один запрос к API: (метод, путь) -> наибольшее число запросов.
+# Бюджеты проверяет клиент ViewTestCase в каждом запросе каждого теста, превышение роняет тест.
+# Счет берется из заголовка Server-Timing (MetricsMiddleware), поэтому одинаково работает для Client и AsyncClient.
+# У потоковых ответов (stream=1) учитываются запросы до начала выдачи.
+# GET /api/shop: часовые пояса городов, границы часов работы (оба кэшируются) и список;
+# поиск q на БД без pg_trgm еще строит индекс названий в памяти (один раз после записи в таблицу, search.py);
+# POST /api/street и /api/shop: поиск и создание города и улицы (каждое в точке сохранения) и вставка,
+# у магазина - еще и строки витрины ShopListing, все в точке сохранения (транзакция ShopsSerializer.create
+# внутри транзакции теста);
+# POST /api/shop со списком - пачками, независимо от длины списка.
+# Отдельный тест может ужесточить бюджет через ViewTestCase.query_budget(), рост числа запросов
+# с количеством строк проверяет ViewTestCase.assertQueryScaling().
+QUERY_BUDGETS = {
+    ('GET', '/api/city'): 1,
+    ('POST', '/api/city'): 2,
+    ('GET', '/api/street'): 2,
+    ('POST', '/api/street'): 7,
+    ('GET', '/api/shop'): 4,
+    ('POST', '/api/shop'): 12,
+}
+
+_SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def response_queries(response):
+    match = _SERVER_TIMING_QUERIES.search(response.get('Server-Timing', ''))
+    return int(match.group(1)) if match else None
+
+
+class QueryBudgetMixin:
+    budgets = QUERY_BUDGETS
+    # Бюджет на все запросы вместо QUERY_BUDGETS, задается ViewTestCase.query_budget()
+    budget = None
+
+    # request - окружение WSGI (Client) или scope ASGI (AsyncClient)
+    def check_query_budget(self, request, response):
+        endpoint = (request.get('REQUEST_METHOD') or request['method'], request.get('PATH_INFO') or request['path'])
+        budget = self.budget
+        if budget is None:
+            budget = self.budgets.get(endpoint)
+        if budget is None:
+            return
+        queries = response_queries(response)
+        if queries is None:
+            raise AssertionError('%s %s: no query count in Server-Timing, is METRICS_ENABLED off?' % endpoint)
+        if queries > budget:
+            raise AssertionError('%s %s made %s queries, budget is %s' % (endpoint + (queries, budget)))
+
+
+class QueryBudgetClient(QueryBudgetMixin, Client):
+    def request(self, **request):
+        response = super().request(**request)
+        self.check_query_budget(request, response)
+        return response
+
+
+class AsyncQueryBudgetClient(QueryBudgetMixin, AsyncClient):
+    async def request(self, **request):
+        response = await super().request(**request)
+        self.check_query_budget(request, response)
+        return response
+
+
+class ViewTestCase(TestCase):
+    client_class = QueryBudgetClient
+    async_client_class = AsyncQueryBudgetClient
+
+    # Кэш ответов и индекс поиска в памяти переживают откат данных теста, поэтому перед каждым тестом очищаются
+    def setUp(self):
+        cache.clear()
+        search.clear_indexes()
+
+    @contextlib.contextmanager
+    def query_budget(self, budget):
+        self.client.budget = self.async_client.budget = budget
+        try:
+            yield
+        finally:
+            self.client.budget = self.async_client.budget = None
+
+    # Число запросов к БД на GET url или POST data в JSON. Кэш сбрасывается, чтобы сравниваемые запросы
+    # выполняли одинаковую работу
+    def count_queries(self, url, data=None, status=200):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            if data is None:
+                response = self.client.get(url)
+            else:
+                response = self.client.post(url, data, content_type='application/json')
+        self.assertEqual(response.status_code, status)
+        return len(context.captured_queries)
+
+    # Запросов к БД на каждую строку, добавленную add_rows(rows), не больше max_per_row (по умолчанию - ни одного).
+    # data_for(rows) - тело POST-запроса, если число строк задает сам запрос (массовое создание)
+    def assertQueryScaling(self, url, add_rows=None, rows=20, max_per_row=0, data_for=None, status=200):
+        few = self.count_queries(url, data_for(2) if data_for else None, status)
+        if add_rows is not None:
+            add_rows(rows)
+        many = self.count_queries(url, data_for(2 + rows) if data_for else None, status)
+        self.assertLessEqual(many - few, rows * max_per_row,
+                             '%s: %s queries for few rows, %s after adding %s rows' % (url, few, many, rows))
+
+
 class CityModelTest(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -40,7 +178,7 @@ class CityModelTest(TestCase):
         self.assertEqual(len(cities), 2)
 
 
-class CityViewTest(TestCase):
+class CityViewTest(ViewTestCase):
     @classmethod
     def setUpTestData(cls):
         number_of_cities = 10
@@ -102,7 +240,7 @@ class StreetModelTest(TestCase):
         self.assertEqual(len(streets), 2)
 
 
-class StreetViewTest(TestCase):
+class StreetViewTest(ViewTestCase):
     @classmethod
     def setUpTestData(cls):
         City.objects.create(name='Ulanovsk')
@@ -145,6 +283,12 @@ class StreetViewTest(TestCase):
         city = City.objects.all()
         self.assertEqual(len(city), 2)
 
+    def test_create_exist_street_expect_error(self):
+        response = self.client.post('/api/street', {'name': 'Street 1', 'city_id': 'Samara'})
+        self.assertEqual(response.status_code, 400)
+        city = City.objects.get(name='Samara')
+        self.assertEqual(Street.objects.filter(city_id=city).count(), 2)
+
     def test_create_new_street_with_not_exist_city(self):
         response = self.client.post('/api/street', {'name': 'New Street', 'city_id': 'New City'})
         self.assertEqual(response.status_code, 201)
@@ -164,32 +308,32 @@ class ShopsModelTest(TestCase):
         Street.objects.create(name='Street 1', city_id=city)
         Street.objects.create(name='Street 2', city_id=city)
         street = Street.objects.get(name='Street 1')
-        Shops.objects.create(name='Shop 1', street_id=street, house="1A", open_time=8, close_time=22)
-        Shops.objects.create(name='Shop 2', street_id=street, house="58", open_time=8, close_time=22)
+        Shops.objects.create(name='Shop 1', street_id=street, house="1A", open_minute=8 * 60, close_minute=22 * 60)
+        Shops.objects.create(name='Shop 2', street_id=street, house="58", open_minute=8 * 60, close_minute=22 * 60)
         street = Street.objects.get(name='Street 2')
-        Shops.objects.create(name='Shop 3', street_id=street, house="17", open_time=0, close_time=13)
+        Shops.objects.create(name='Shop 3', street_id=street, house="17", open_minute=0 * 60, close_minute=13 * 60)
         City.objects.create(name='Samara')
         city = City.objects.get(name='Samara')
         Street.objects.create(name='Street 3', city_id=city)
         Street.objects.create(name='Street 4', city_id=city)
         street = Street.objects.get(name='Street 3')
-        Shops.objects.create(name='Shop 4', street_id=street, house="5", open_time=9, close_time=23)
-        Shops.objects.create(name='Shop 5', street_id=street, house="63", open_time=7, close_time=20)
+        Shops.objects.create(name='Shop 4', street_id=street, house="5", open_minute=9 * 60, close_minute=23 * 60)
+        Shops.objects.create(name='Shop 5', street_id=street, house="63", open_minute=7 * 60, close_minute=20 * 60)
         street = Street.objects.get(name='Street 4')
-        Shops.objects.create(name='Shop 6', street_id=street, house="21", open_time=0, close_time=24)
+        Shops.objects.create(name='Shop 6', street_id=street, house="21", open_minute=0 * 60, close_minute=24 * 60)
 
     def test_name_label(self):
         shop = Shops.objects.get(name='Shop 1')
         field_label_name = shop._meta.get_field('name').verbose_name
         field_label_street_id = shop._meta.get_field('street_id').verbose_name
         field_label_house = shop._meta.get_field('house').verbose_name
-        field_label_open_time = shop._meta.get_field('open_time').verbose_name
-        field_label_close_time = shop._meta.get_field('close_time').verbose_name
+        field_label_open_minute = shop._meta.get_field('open_minute').verbose_name
+        field_label_close_minute = shop._meta.get_field('close_minute').verbose_name
         self.assertEqual(field_label_name, 'name')
         self.assertEqual(field_label_street_id, 'street id')
         self.assertEqual(field_label_house, 'house')
-        self.assertEqual(field_label_open_time, 'open time')
-        self.assertEqual(field_label_close_time, 'close time')
+        self.assertEqual(field_label_open_minute, 'open minute')
+        self.assertEqual(field_label_close_minute, 'close minute')
 
     def test_name_max_length(self):
         shop = Shops.objects.get(name='Shop 1')
@@ -211,7 +355,7 @@ class ShopsModelTest(TestCase):
 
 
 
-class ShopsViewTest(TestCase):
+class ShopsViewTest(ViewTestCase):
     @classmethod
     def setUpTestData(cls):
         City.objects.create(name='Ulanovsk')
@@ -219,19 +363,19 @@ class ShopsViewTest(TestCase):
         Street.objects.create(name='Street 1', city_id=city)
         Street.objects.create(name='Street 2', city_id=city)
         street = Street.objects.get(name='Street 1')
-        Shops.objects.create(name='Shop 1', street_id=street, house="1A", open_time=8, close_time=22)
-        Shops.objects.create(name='Shop 2', street_id=street, house="58", open_time=8, close_time=22)
+        Shops.objects.create(name='Shop 1', street_id=street, house="1A", open_minute=8 * 60, close_minute=22 * 60)
+        Shops.objects.create(name='Shop 2', street_id=street, house="58", open_minute=8 * 60, close_minute=22 * 60)
         street = Street.objects.get(name='Street 2')
-        Shops.objects.create(name='Shop 3', street_id=street, house="17", open_time=0, close_time=13)
+        Shops.objects.create(name='Shop 3', street_id=street, house="17", open_minute=0 * 60, close_minute=13 * 60)
         City.objects.create(name='Samara')
         city = City.objects.get(name='Samara')
         Street.objects.create(name='Street 3', city_id=city)
         Street.objects.create(name='Street 4', city_id=city)
         street = Street.objects.get(name='Street 3')
-        Shops.objects.create(name='Shop 4', street_id=street, house="5", open_time=9, close_time=23)
-        Shops.objects.create(name='Shop 5', street_id=street, house="63", open_time=7, close_time=20)
+        Shops.objects.create(name='Shop 4', street_id=street, house="5", open_minute=9 * 60, close_minute=23 * 60)
+        Shops.objects.create(name='Shop 5', street_id=street, house="63", open_minute=7 * 60, close_minute=20 * 60)
         street = Street.objects.get(name='Street 4')
-        Shops.objects.create(name='Shop 6', street_id=street, house="21", open_time=0, close_time=24)
+        Shops.objects.create(name='Shop 6', street_id=street, house="21", open_minute=0 * 60, close_minute=24 * 60)
 
     def test_view_url_expect_error(self):
         response = self.client.get('/api/shop')
@@ -363,3 +507,1597 @@ class ShopsViewTest(TestCase):
         self.assertEqual(len(city), 3)
         street = Street.objects.all()
         self.assertEqual(len(street), 5)
+
+
+class ListQueryCountTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Ulanovsk')
+
+    def add_shops(self, count):
+        for number in range(count):
+            street = Street.objects.create(name=f'Street {Street.objects.count()}', city_id=self.city)
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    def test_shops_query_count_does_not_grow_with_rows(self):
+        self.add_shops(2)
+        self.assertQueryScaling('/api/shop', self.add_shops)
+
+    def test_shops_by_city_query_count_does_not_grow_with_rows(self):
+        self.add_shops(2)
+        self.assertQueryScaling('/api/shop?city=' + str(self.city.id), self.add_shops)
+
+    def test_open_shops_query_count_does_not_grow_with_rows(self):
+        self.add_shops(2)
+        self.assertQueryScaling('/api/shop?open=1', self.add_shops)
+
+    def test_streets_query_count_does_not_grow_with_rows(self):
+        self.add_shops(2)
+        self.assertQueryScaling('/api/street?city_id=' + str(self.city.id), self.add_shops)
+
+    def test_cities_query_count_does_not_grow_with_rows(self):
+        self.assertQueryScaling('/api/city', lambda rows: City.objects.bulk_create(
+            City(name=f'City {number}') for number in range(rows)))
+
+    def test_bulk_create_query_count_does_not_grow_with_rows(self):
+        def shops(count):
+            return [{'name': f'Shop {number}', 'street_id': f'Street {number}', 'city': 'Ulanovsk', 'house': '1',
+                     'open_time': '8', 'close_time': '22'} for number in range(count)]
+
+        self.assertQueryScaling('/api/shop', data_for=shops, status=201)
+
+    def test_query_budget_is_enforced(self):
+        self.client.get('/api/city')
+        with self.query_budget(0):
+            with self.assertRaisesMessage(AssertionError, 'GET /api/city made 1 queries, budget is 0'):
+                self.client.get('/api/city?limit=1')
+
+
+class IndexUsageTest(TestCase):
+    # Имена индексов в плане запроса: SQLite называет индекс уникального ограничения сам
+    street_name_index = {
+        'sqlite': 'sqlite_autoindex_tutorials_street',
+        'postgresql': 'street_city_name_unique',
+    }
+    full_scan = {
+        'sqlite': 'SCAN tutorials_shops',
+        'postgresql': 'Seq Scan',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Ulanovsk')
+        for number in range(200):
+            street = Street.objects.create(name=f'Street {number}', city_id=cls.city)
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1',
+                                 open_minute=number % 24 * 60, close_minute=23 * 60)
+
+    def setUp(self):
+        if connection.vendor not in self.street_name_index:
+            self.skipTest('EXPLAIN output is checked for SQLite and PostgreSQL only')
+        if connection.vendor == 'postgresql':
+            # На маленькой таблице PostgreSQL предпочтет последовательное чтение
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def test_street_lookup_by_name_and_city_uses_unique_index(self):
+        plan = Street.objects.filter(name='Street 1', city_id=self.city.id).explain()
+        self.assertIn(self.street_name_index[connection.vendor], plan)
+
+    def test_shops_by_street_and_open_uses_street_minutes_index(self):
+        street = Street.objects.get(name='Street 1')
+        plan = Shops.objects.filter(street_id=street.id).filter_open(9 * 60, True).explain()
+        self.assertIn('shops_street_minutes_idx', plan)
+
+    def test_shops_by_open_uses_minutes_indexes(self):
+        for is_open in (True, False):
+            plan = Shops.objects.filter_open(9 * 60, is_open).explain()
+            # Каждая ветка OR должна идти по индексу окна работы, без полного чтения таблицы
+            self.assertTrue('shops_minutes_idx' in plan or 'shops_close_minute_idx' in plan, plan)
+            self.assertNotIn(self.full_scan[connection.vendor], plan)
+
+
+class PaginationViewTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for city_id in range(5):
+            city = City.objects.create(name=f'City {city_id}')
+            street = Street.objects.create(name='Street', city_id=city)
+            Shops.objects.create(name=f'Shop {city_id}', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    def walk(self, url):
+        names = []
+        after = ''
+        while True:
+            response = self.client.get(url + after)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            self.assertLessEqual(len(page['results']), 2)
+            names += [item['name'] for item in page['results']]
+            if page['next'] is None:
+                return names
+            after = '&after=' + str(page['next'])
+
+    def test_cities_pages_cover_all_cities(self):
+        names = self.walk('/api/city?limit=2')
+        self.assertEqual(names, [f'City {city_id}' for city_id in range(5)])
+
+    def test_shops_pages_cover_all_shops(self):
+        names = self.walk('/api/shop?limit=2')
+        self.assertEqual(names, [f'Shop {city_id}' for city_id in range(5)])
+
+    def test_shops_pages_with_filter(self):
+        city = City.objects.get(name='City 3')
+        names = self.walk('/api/shop?limit=2&city=' + str(city.id))
+        self.assertEqual(names, ['Shop 3'])
+
+    def test_streets_pages(self):
+        city = City.objects.get(name='City 1')
+        response = self.client.get('/api/street?limit=2&city_id=' + str(city.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'results': [{'id': city.street_set.get().id, 'name': 'Street',
+                                                        'city_id': 'City 1'}],
+                                           'next': None})
+
+    def test_last_full_page_has_no_next(self):
+        response = self.client.get('/api/city?limit=5')
+        self.assertEqual(len(response.json()['results']), 5)
+        self.assertIsNone(response.json()['next'])
+
+    def test_without_limit_returns_plain_list(self):
+        response = self.client.get('/api/city')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 5)
+
+    def test_invalid_limit_expect_error(self):
+        for limit in ('0', 'abc', '100000', '²', '٣'):
+            response = self.client.get('/api/city?limit=' + limit)
+            self.assertEqual(response.status_code, 400, limit)
+        self.assertEqual(self.client.get('/api/shop?limit=²').status_code, 400)
+
+    def test_invalid_after_expect_error(self):
+        for after in ('abc', '²'):
+            response = self.client.get('/api/shop?limit=2&after=' + after)
+            self.assertEqual(response.status_code, 400, after)
+
+    def test_page_query_count_does_not_depend_on_position(self):
+        # Границы часов работы считаются первым запросом после записи в таблицу магазинов
+        self.client.get('/api/shop?limit=1')
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get('/api/shop?limit=2')
+        with CaptureQueriesContext(connection) as last:
+            self.client.get('/api/shop?limit=2&after=' + str(response.json()['next']))
+        self.assertEqual(len(first.captured_queries), len(last.captured_queries))
+
+
+class StreamingViewTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Ulanovsk')
+        for number in range(7):
+            street = Street.objects.create(name=f'Street {number}', city_id=city)
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    def assertSameAsPlain(self, query):
+        plain = self.client.get('/api/shop' + query)
+        streamed = self.client.get('/api/shop' + (query + '&' if query else '?') + 'stream=1')
+        self.assertEqual(streamed.status_code, 200)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(b''.join(streamed.streaming_content), plain.content)
+
+    def test_stream_equals_plain_response(self):
+        self.assertSameAsPlain('')
+
+    @mock.patch('tutorials.streaming.CHUNK_SIZE', 3)
+    def test_stream_equals_plain_response_across_chunks(self):
+        self.assertSameAsPlain('')
+
+    @mock.patch('tutorials.streaming.CHUNK_SIZE', 7)
+    def test_stream_equals_plain_response_with_full_last_chunk(self):
+        self.assertSameAsPlain('')
+
+    def test_stream_of_empty_list(self):
+        self.assertSameAsPlain('?city=0')
+
+
+class ShopsBulkCreateViewTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Samara')
+        Street.objects.create(name='Street 1', city_id=city)
+
+    @staticmethod
+    def shop(number, street='Street 1', city='Samara'):
+        return {'name': f'Shop {number}', 'street_id': street, 'city': city,
+                'house': str(number), 'open_time': 8, 'close_time': 22}
+
+    def post(self, items):
+        return self.client.post('/api/shop', items, content_type='application/json')
+
+    def test_create_shops_with_exist_and_not_exist_city_and_street(self):
+        response = self.post([self.shop(1), self.shop(2, street='Street 2'),
+                              self.shop(3, street='Street 1', city='New City'), self.shop(4, street='Street 2')])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['name'] for item in response.json()], ['Shop 1', 'Shop 2', 'Shop 3', 'Shop 4'])
+        self.assertEqual(response.json()[2]['city_name'], 'New City')
+        self.assertEqual(City.objects.count(), 2)
+        self.assertEqual(Street.objects.count(), 3)
+        self.assertEqual(Shops.objects.count(), 4)
+        street = Street.objects.get(name='Street 2')
+        self.assertEqual(Shops.objects.filter(street_id=street).count(), 2)
+
+    def test_created_shops_are_listed(self):
+        response = self.post([self.shop(number) for number in range(3)])
+        created = response.json()
+        response = self.client.get('/api/shop')
+        self.assertEqual(response.json(), created)
+
+    def test_errors_are_reported_by_index_and_nothing_is_created(self):
+        invalid = self.shop(2)
+        del invalid['city']
+        response = self.post([self.shop(1), invalid, self.shop(3), {'name': 'Shop 4'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'1', '3'})
+        self.assertIn('city', response.json()['1'])
+        self.assertEqual(Shops.objects.count(), 0)
+
+    def test_empty_list_expect_error(self):
+        response = self.post([])
+        self.assertEqual(response.status_code, 400)
+
+    def test_query_count_does_not_grow_with_items(self):
+        with CaptureQueriesContext(connection) as few:
+            self.post([self.shop(number, street=f'Street {number}', city='Other City') for number in range(2)])
+        with CaptureQueriesContext(connection) as many:
+            self.post([self.shop(number, street=f'Street {number}', city='New City') for number in range(50)])
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+
+class NaturalKeyLookupTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Samara')
+        Street.objects.create(name='Street 1', city_id=cls.city)
+
+    def test_exist_city_is_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_or_create_city('Samara'), self.city)
+
+    def test_not_exist_city_is_one_read_and_one_write(self):
+        # SELECT, затем INSERT внутри точки сохранения (SAVEPOINT и RELEASE)
+        with self.assertNumQueries(4):
+            city = get_or_create_city('New City')
+        self.assertEqual(City.objects.get(name='New City'), city)
+
+    def test_exist_street_is_one_query_and_keeps_city(self):
+        with self.assertNumQueries(1):
+            street = get_or_create_street('Street 1', self.city)
+            self.assertEqual(street.city_id.name, 'Samara')
+
+    def test_create_shop_with_exist_city_and_street_queries(self):
+        # Город, улица, вставка магазина и строки витрины ShopListing; SAVEPOINT и RELEASE - транзакция
+        # ShopsSerializer.create внутри транзакции теста
+        with self.assertNumQueries(6):
+            response = self.client.post('/api/shop', {'name': 'Shop', 'street_id': 'Street 1', 'city': 'Samara',
+                                                      'house': '1', 'open_time': '8', 'close_time': '22'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_create_street_with_exist_city_queries(self):
+        # Город и вставка улицы внутри точки сохранения
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/street', {'name': 'Street 2', 'city_id': 'Samara'})
+        self.assertEqual(response.status_code, 201)
+
+
+class ConcurrentLookupTest(TransactionTestCase):
+    threads = 8
+
+    def tearDown(self):
+        # Таблицы очищаются без сигналов, id из кэша не должны перейти в следующий тест
+        clear_lookup_caches()
+
+    def run_concurrently(self, func):
+        if connection.vendor == 'sqlite':
+            self.skipTest('SQLite in-memory test database does not support concurrent writers')
+        barrier = threading.Barrier(self.threads)
+        results = []
+        errors = []
+
+        def worker():
+            try:
+                barrier.wait()
+                results.append(func())
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_concurrent_create_same_city(self):
+        cities = self.run_concurrently(lambda: get_or_create_city('New City'))
+        self.assertEqual(len({city.id for city in cities}), 1)
+        self.assertEqual(City.objects.filter(name='New City').count(), 1)
+
+    def test_concurrent_create_shops_in_same_new_street(self):
+        def post():
+            return self.client.post('/api/shop', {'name': 'Shop', 'street_id': 'New Street', 'city': 'New City',
+                                                  'house': '1', 'open_time': '8', 'close_time': '22'}).status_code
+
+        self.assertEqual(self.run_concurrently(post), [201] * self.threads)
+        self.assertEqual(City.objects.count(), 1)
+        self.assertEqual(Street.objects.count(), 1)
+        self.assertEqual(Shops.objects.count(), self.threads)
+
+
+class LookupCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Samara')
+        cls.street = Street.objects.create(name='Street 1', city_id=cls.city)
+
+    def setUp(self):
+        clear_lookup_caches()
+        self.addCleanup(clear_lookup_caches)
+
+    def warm_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            get_or_create_street('Street 1', get_or_create_city('Samara'))
+
+    def test_cached_lookups_do_not_query(self):
+        self.warm_up()
+        with self.assertNumQueries(0):
+            city = get_or_create_city('Samara')
+            street = get_or_create_street('Street 1', city)
+        self.assertEqual(city.id, self.city.id)
+        self.assertEqual(street.id, self.street.id)
+        self.assertEqual(city_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+        self.assertEqual(street_cache.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+    def test_create_shop_with_cached_city_and_street_makes_no_lookups(self):
+        self.warm_up()
+        # Вставка магазина и строки витрины ShopListing в транзакции (в тесте - SAVEPOINT и RELEASE)
+        with self.assertNumQueries(4):
+            response = self.client.post('/api/shop', {'name': 'Shop', 'street_id': 'Street 1', 'city': 'Samara',
+                                                      'house': '1', 'open_time': '8', 'close_time': '22'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['city_name'], 'Samara')
+
+    def test_not_committed_objects_are_not_cached(self):
+        get_or_create_city('New City')
+        self.assertEqual(city_cache.stats()['size'], 0)
+
+    def test_rename_city_invalidates_city_and_streets(self):
+        self.warm_up()
+        self.city.name = 'Samara 2'
+        self.city.save()
+        self.assertEqual(city_cache.stats()['size'], 0)
+        self.assertEqual(street_cache.stats()['size'], 0)
+
+    def test_delete_street_invalidates_street(self):
+        self.warm_up()
+        self.street.delete()
+        self.assertEqual(city_cache.stats()['size'], 1)
+        self.assertEqual(street_cache.stats()['size'], 0)
+
+    def test_new_objects_do_not_invalidate(self):
+        self.warm_up()
+        Street.objects.create(name='Street 2', city_id=self.city)
+        self.assertEqual(street_cache.stats()['size'], 1)
+
+    def test_least_recently_used_is_evicted(self):
+        cache = LRUCache(2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+    def test_zero_size_disables_cache(self):
+        cache = LRUCache(0)
+        cache.put('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class ResponseCacheTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Samara')
+        Street.objects.create(name='Street 1', city_id=cls.city)
+
+    def test_repeated_get_is_served_from_cache(self):
+        first = self.client.get('/api/city')
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/city')
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Content-Type'], 'application/json')
+
+    def test_query_params_are_cached_separately(self):
+        other = City.objects.create(name='Ulanovsk')
+        Street.objects.create(name='Street 2', city_id=other)
+        first = self.client.get('/api/street?city_id=' + str(self.city.id))
+        second = self.client.get('/api/street?city_id=' + str(other.id))
+        self.assertEqual(first.json()[0]['name'], 'Street 1')
+        self.assertEqual(second.json()[0]['name'], 'Street 2')
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_post_city_invalidates_cities(self):
+        first = self.client.get('/api/city')
+        self.client.post('/api/city', {'name': 'New City'})
+        second = self.client.get('/api/city')
+        self.assertEqual(len(second.json()), 2)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+    def test_rename_city_invalidates_streets(self):
+        self.client.get('/api/street?city_id=' + str(self.city.id))
+        self.city.name = 'Samara 2'
+        self.city.save()
+        response = self.client.get('/api/street?city_id=' + str(self.city.id))
+        self.assertEqual(response.json()[0]['city_id'], 'Samara 2')
+
+    def test_post_street_invalidates_streets(self):
+        self.client.get('/api/street?city_id=' + str(self.city.id))
+        self.client.post('/api/street', {'name': 'Street 2', 'city_id': 'Samara'})
+        response = self.client.get('/api/street?city_id=' + str(self.city.id))
+        self.assertEqual(len(response.json()), 2)
+
+    def test_if_none_match_returns_304_without_queries(self):
+        etag = self.client.get('/api/city')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/city', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_weak_if_none_match_returns_304(self):
+        etag = self.client.get('/api/city')['ETag']
+        response = self.client.get('/api/city', HTTP_IF_NONE_MATCH='W/' + etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_if_none_match_returns_body(self):
+        etag = self.client.get('/api/city')['ETag']
+        City.objects.create(name='New City')
+        response = self.client.get('/api/city', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    # Запись в другом процессе (здесь - UPDATE без сигналов) не меняет версии в локальном кэше этого процесса:
+    # старый ответ отдается, пока не истечет CACHE_TIMEOUT
+    def test_cached_responses_and_versions_expire(self):
+        self.client.get('/api/city')
+        City.objects.filter(id=self.city.id).update(name='Renamed')
+        self.assertEqual(self.client.get('/api/city').json()[0]['name'], 'Samara')
+        expired = mock.Mock(time=mock.Mock(return_value=time.time() + settings.CACHE_TIMEOUT + 1))
+        with mock.patch('django.core.cache.backends.locmem.time', expired):
+            self.assertEqual(self.client.get('/api/city').json()[0]['name'], 'Renamed')
+
+    def test_deploy_check_warns_about_local_cache(self):
+        self.assertEqual([warning.id for warning in checks.check_shared_cache(None)], ['tutorials.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+    def test_errors_are_not_cached(self):
+        Street.objects.all().delete()
+        City.objects.all().delete()
+        self.assertEqual(self.client.get('/api/city').status_code, 404)
+        City.objects.create(name='New City')
+        self.assertEqual(self.client.get('/api/city').status_code, 200)
+
+
+class ShopsResponseCacheTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Samara')
+        street = Street.objects.create(name='Street 1', city_id=city)
+        Shops.objects.create(name='Shop 1', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+        Shops.objects.create(name='Shop 2', street_id=street, house='2', open_minute=0 * 60, close_minute=13 * 60)
+
+    @mock.patch('datetime.datetime')
+    def test_same_hour_is_served_from_cache(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(9, 0, 0)
+        first = self.client.get('/api/shop?open=1')
+        mocked_datetime.now.return_value = datetime.time(9, 59, 0)
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/shop?open=1')
+        self.assertEqual(second.content, first.content)
+
+    @mock.patch('datetime.datetime')
+    def test_cache_rolls_over_at_hour_boundary(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(12, 59, 0)
+        response = self.client.get('/api/shop?open=1')
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual([shop['open'] for shop in self.client.get('/api/shop').json()], [1, 1])
+
+        mocked_datetime.now.return_value = datetime.time(13, 0, 0)
+        response = self.client.get('/api/shop?open=1')
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual([shop['open'] for shop in self.client.get('/api/shop').json()], [1, 0])
+
+    @mock.patch('datetime.datetime')
+    def test_etag_changes_at_hour_boundary(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(12, 0, 0)
+        etag = self.client.get('/api/shop')['ETag']
+        self.assertEqual(self.client.get('/api/shop', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        mocked_datetime.now.return_value = datetime.time(13, 0, 0)
+        self.assertEqual(self.client.get('/api/shop', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @mock.patch('datetime.datetime')
+    def test_post_shop_invalidates_shops(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(9, 0, 0)
+        self.client.get('/api/shop?open=1')
+        self.client.post('/api/shop', {'name': 'Shop 3', 'street_id': 'Street 1', 'city': 'Samara',
+                                        'house': '3', 'open_time': '8', 'close_time': '22'})
+        response = self.client.get('/api/shop?open=1')
+        self.assertEqual(len(response.json()), 3)
+
+    @mock.patch('datetime.datetime')
+    def test_bulk_post_invalidates_shops_and_cities(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(9, 0, 0)
+        self.client.get('/api/shop?open=1')
+        self.client.get('/api/city')
+        self.client.post('/api/shop', [{'name': 'Shop 3', 'street_id': 'Street 1', 'city': 'New City',
+                                        'house': '3', 'open_time': 8, 'close_time': 22}],
+                         content_type='application/json')
+        self.assertEqual(len(self.client.get('/api/shop?open=1').json()), 3)
+        self.assertEqual(len(self.client.get('/api/city').json()), 2)
+
+    def test_delete_shop_invalidates_shops(self):
+        self.client.get('/api/shop')
+        Shops.objects.get(name='Shop 1').delete()
+        self.assertEqual(len(self.client.get('/api/shop').json()), 1)
+
+
+class ShopsOpenFlagTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Samara')
+        street = Street.objects.create(name='Street 1', city_id=city)
+        windows = [(0, 24 * 60), (8 * 60, 22 * 60), (0, 13 * 60), (9 * 60, 9 * 60), (22 * 60, 2 * 60),
+                   (23 * 60 + 30, 24 * 60), (9 * 60 + 15, 9 * 60 + 45)]
+        for number, (open_time, close_time) in enumerate(windows):
+            open_minute, close_minute = opening_window(open_time, close_time)
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1',
+                                 open_minute=open_minute, close_minute=close_minute)
+
+    def test_annotated_flag_matches_python_rule(self):
+        for now in range(0, MINUTES_IN_DAY, 15):
+            for shop in Shops.objects.annotate_open(now):
+                self.assertEqual(shop.is_open, 1 if shop.is_open_at(now) else 0)
+
+    def test_open_filters_split_shops(self):
+        for now in range(0, MINUTES_IN_DAY, 15):
+            opened = set(Shops.objects.filter_open(now, True).values_list('id', flat=True))
+            closed = set(Shops.objects.filter_open(now, False).values_list('id', flat=True))
+            self.assertEqual(opened, {shop.id for shop in Shops.objects.annotate_open(now) if shop.is_open})
+            self.assertEqual(opened | closed, set(Shops.objects.values_list('id', flat=True)))
+            self.assertFalse(opened & closed)
+
+    def test_overnight_shop(self):
+        shop = Shops.objects.get(name='Shop 4')
+        self.assertEqual((shop.open_minute, shop.close_minute), (22 * 60, 26 * 60))
+        self.assertEqual([shop.is_open_at(hour * 60) for hour in (21, 22, 23, 0, 1, 2)],
+                         [False, True, True, True, True, False])
+
+    def test_opening_boundaries(self):
+        self.assertEqual(Shops.objects.opening_boundaries(),
+                         [0, 2 * 60, 8 * 60, 9 * 60, 9 * 60 + 15, 9 * 60 + 45, 13 * 60, 22 * 60, 23 * 60 + 30])
+
+    @mock.patch('datetime.datetime')
+    def test_now_is_taken_once_per_request(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(9, 0, 0)
+        response = self.client.get('/api/shop?open=1')
+        self.assertEqual(mocked_datetime.now.call_count, 1)
+        self.assertEqual([shop['open'] for shop in response.json()], [1, 1, 1])
+
+    @mock.patch('datetime.datetime')
+    def test_flag_of_created_shop(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(23, 0, 0)
+        response = self.client.post('/api/shop', {'name': 'New Shop', 'street_id': 'Street 1', 'city': 'Samara',
+                                                  'house': '1', 'open_time': '8', 'close_time': '22'})
+        self.assertEqual(response.json()['open'], 0)
+
+
+class OpeningHoursEquivalenceTest(TestCase):
+    # Для окон в целых часах без перехода через полночь результат совпадает с прежним правилом
+    # open_time <= час < close_time
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Samara')
+        street = Street.objects.create(name='Street 1', city_id=city)
+        cls.hours = {}
+        for open_time in range(25):
+            for close_time in range(open_time, 25):
+                open_minute, close_minute = opening_window(open_time * 60, close_time * 60)
+                shop = Shops.objects.create(name='Shop', street_id=street, house='1',
+                                            open_minute=open_minute, close_minute=close_minute)
+                cls.hours[shop.id] = (open_time, close_time)
+
+    def test_open_filter_matches_hour_rule(self):
+        for hour in range(24):
+            expected = {shop_id for shop_id, (open_time, close_time) in self.hours.items()
+                        if open_time <= hour < close_time}
+            opened = set(Shops.objects.filter_open(hour * 60, True).values_list('id', flat=True))
+            closed = set(Shops.objects.filter_open(hour * 60, False).values_list('id', flat=True))
+            self.assertEqual(opened, expected)
+            self.assertEqual(closed, set(self.hours) - expected)
+
+    def test_open_flag_matches_hour_rule(self):
+        for hour in range(24):
+            for shop in Shops.objects.annotate_open(hour * 60):
+                open_time, close_time = self.hours[shop.id]
+                self.assertEqual(shop.is_open, 1 if open_time <= hour < close_time else 0)
+
+
+class OpeningTimeViewTest(ViewTestCase):
+    def post(self, open_time, close_time):
+        return self.client.post('/api/shop', {'name': 'Shop', 'street_id': 'Street 1', 'city': 'Samara',
+                                              'house': '1', 'open_time': open_time, 'close_time': close_time},
+                                content_type='application/json')
+
+    def test_hours_and_minutes_are_accepted(self):
+        for open_time, close_time, window in ((8, 22, (480, 1320)), ('8', '24', (480, 1440)),
+                                              ('08:30', '21:45', (510, 1305)), ('22:30', '02:15', (1350, 1575)),
+                                              ('24:00', '06:00', (0, 360))):
+            response = self.post(open_time, close_time)
+            self.assertEqual(response.status_code, 201)
+            shop = Shops.objects.get(id=response.json()['id'])
+            self.assertEqual((shop.open_minute, shop.close_minute), window)
+
+    def test_invalid_time_expect_error(self):
+        for value in (25, -1, '24:30', '8:5', '08:60', 'abc', '', True, 8.5):
+            response = self.post(value, '22:00')
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('open_time', response.json())
+
+    @mock.patch('datetime.datetime')
+    def test_overnight_shop_is_open_after_midnight(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(12, 0)
+        self.post('22:30', '02:15')
+        for now, expected in ((datetime.time(22, 29), 0), (datetime.time(22, 30), 1), (datetime.time(1, 0), 1),
+                              (datetime.time(2, 14), 1), (datetime.time(2, 15), 0)):
+            mocked_datetime.now.return_value = now
+            self.assertEqual(len(self.client.get('/api/shop?open=1').json()), expected, now)
+            self.assertEqual(len(self.client.get('/api/shop?open=0').json()), 1 - expected, now)
+            self.assertEqual(self.client.get('/api/shop').json()[0]['open'], expected, now)
+
+
+class TimezoneOpenTest(ViewTestCase):
+    # 20:30 UTC: в Калининграде (UTC+2) 22:30, в Самаре (UTC+4) уже 00:30 следующих суток,
+    # во Владивостоке (UTC+10) 06:30
+    instant = datetime.datetime(2026, 3, 1, 20, 30, tzinfo=datetime.timezone.utc)
+
+    @classmethod
+    def setUpTestData(cls):
+        for name, timezone_name in (('Kaliningrad', 'Europe/Kaliningrad'), ('Samara', 'Europe/Samara'),
+                                    ('Vladivostok', 'Asia/Vladivostok')):
+            city = City.objects.create(name=name, timezone=timezone_name)
+            street = Street.objects.create(name='Street 1', city_id=city)
+            Shops.objects.create(name='Day', street_id=street, house='1', open_minute=8 * 60, close_minute=24 * 60)
+            Shops.objects.create(name='Night', street_id=street, house='2', open_minute=22 * 60, close_minute=26 * 60)
+
+    def freeze(self, mocked_datetime, instant):
+        mocked_datetime.now.side_effect = lambda tz=None: instant.astimezone(tz)
+
+    def shops(self, url):
+        return {(shop['city_name'], shop['name']) for shop in self.client.get(url).json()}
+
+    @mock.patch('datetime.datetime')
+    def test_open_filter_uses_city_time(self, mocked_datetime):
+        self.freeze(mocked_datetime, self.instant)
+        self.assertEqual(self.shops('/api/shop?open=1'),
+                         {('Kaliningrad', 'Day'), ('Kaliningrad', 'Night'), ('Samara', 'Night')})
+        self.assertEqual(self.shops('/api/shop?open=0'),
+                         {('Samara', 'Day'), ('Vladivostok', 'Day'), ('Vladivostok', 'Night')})
+
+    @mock.patch('datetime.datetime')
+    def test_open_flag_uses_city_time(self, mocked_datetime):
+        self.freeze(mocked_datetime, self.instant)
+        flags = {(shop['city_name'], shop['name']): shop['open'] for shop in self.client.get('/api/shop').json()}
+        self.assertEqual(flags, {('Kaliningrad', 'Day'): 1, ('Kaliningrad', 'Night'): 1, ('Samara', 'Day'): 0,
+                                 ('Samara', 'Night'): 1, ('Vladivostok', 'Day'): 0, ('Vladivostok', 'Night'): 0})
+
+    @mock.patch('datetime.datetime')
+    def test_all_cities_are_filtered_in_one_query(self, mocked_datetime):
+        self.freeze(mocked_datetime, self.instant)
+        self.client.get('/api/shop')
+        with self.assertNumQueries(1):
+            self.client.get('/api/shop?open=1')
+
+    @mock.patch('datetime.datetime')
+    def test_cached_response_follows_each_city_time(self, mocked_datetime):
+        self.freeze(mocked_datetime, self.instant)
+        self.client.get('/api/shop?open=1')
+        # Через два часа в Калининграде 00:30, в Самаре 02:30, во Владивостоке 08:30
+        self.freeze(mocked_datetime, self.instant + datetime.timedelta(hours=2))
+        self.assertEqual(self.shops('/api/shop?open=1'), {('Kaliningrad', 'Night'), ('Vladivostok', 'Day')})
+
+    @mock.patch('datetime.datetime')
+    def test_flag_of_created_shop_uses_city_time(self, mocked_datetime):
+        self.freeze(mocked_datetime, self.instant)
+        for city, expected in (('Kaliningrad', 1), ('Vladivostok', 0)):
+            response = self.client.post('/api/shop', {'name': 'New Shop', 'street_id': 'Street 1', 'city': city,
+                                                      'house': '3', 'open_time': '8', 'close_time': '24'})
+            self.assertEqual(response.json()['open'], expected, city)
+
+    @mock.patch('datetime.datetime')
+    def test_flag_of_bulk_created_shops_uses_city_time(self, mocked_datetime):
+        self.freeze(mocked_datetime, self.instant)
+        items = [{'name': 'New Shop', 'street_id': 'Street 1', 'city': city, 'house': '3',
+                  'open_time': '8', 'close_time': '24'} for city in ('Kaliningrad', 'Samara', 'Vladivostok')]
+        response = self.client.post('/api/shop', items, content_type='application/json')
+        self.assertEqual([shop['open'] for shop in response.json()], [1, 0, 0])
+
+    def test_city_timezone(self):
+        response = self.client.post('/api/city', {'name': 'Irkutsk', 'timezone': 'Asia/Irkutsk'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(City.objects.get(name='Irkutsk').timezone, 'Asia/Irkutsk')
+        response = self.client.post('/api/city', {'name': 'Penza'})
+        self.assertEqual(response.json()['timezone'], 'Europe/Samara')
+        for value in ('Mars/Olympus', '../etc/passwd'):
+            response = self.client.post('/api/city', {'name': 'Omsk', 'timezone': value})
+            self.assertEqual(response.status_code, 400, value)
+            self.assertIn('timezone', response.json())
+
+
+# Сравнение с JsonResponse байт в байт возможно только со стандартным json
+@override_settings(JSON_RENDERER='json')
+class ReadPathGoldenTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name, timezone_name in (('Самара', 'Europe/Samara'), ('Kaliningrad', 'Europe/Kaliningrad')):
+            city = City.objects.create(name=name, timezone=timezone_name)
+            for street_number in range(3):
+                street = Street.objects.create(name=f'Улица "{street_number}"', city_id=city)
+                for open_time, close_time in ((8, 22), (22, 2), (0, 24), (9, 9)):
+                    open_minute, close_minute = opening_window(open_time * 60, close_time * 60)
+                    Shops.objects.create(name=f'Shop {open_time}', street_id=street, house=f'{street_number}/1',
+                                         open_minute=open_minute, close_minute=close_minute)
+
+    # Ответ, который собрал бы сериализатор DRF для того же набора объектов
+    def expected(self, serializer_class, queryset):
+        return JsonResponse(serializer_class(queryset, many=True).data, safe=False).content
+
+    def shops(self, **filters):
+        now = {timezone_name: 23 * 60 for timezone_name in City.objects.values_list('timezone', flat=True)}
+        return Shops.objects.select_related('street_id__city_id').annotate_open(now).filter(**filters).order_by('id')
+
+    def test_cities(self):
+        self.assertEqual(self.client.get('/api/city').content, self.expected(CitySerializer, City.objects.all()))
+
+    def test_streets(self):
+        city = City.objects.get(name='Самара')
+        self.assertEqual(self.client.get(f'/api/street?city_id={city.id}').content,
+                         self.expected(StreetSerializer, Street.objects.filter(city_id=city)))
+
+    @mock.patch('datetime.datetime')
+    def test_shops(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(23, 0)
+        city = City.objects.get(name='Kaliningrad')
+        street = Street.objects.filter(city_id=city).first()
+        for url, queryset in (('/api/shop', self.shops()),
+                              ('/api/shop?open=1', self.shops(is_open=1)),
+                              ('/api/shop?open=0', self.shops(is_open=0)),
+                              (f'/api/shop?city={city.id}', self.shops(street_id__city_id=city)),
+                              (f'/api/shop?street={street.id}&open=1', self.shops(street_id=street, is_open=1))):
+            self.assertEqual(self.client.get(url).content, self.expected(ShopsSerializer, queryset), url)
+
+    @mock.patch('datetime.datetime')
+    def test_streamed_shops(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(23, 0)
+        response = self.client.get('/api/shop?stream=1')
+        self.assertEqual(b''.join(response.streaming_content), self.expected(ShopsSerializer, self.shops()))
+
+    @mock.patch('datetime.datetime')
+    def test_shops_page(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(23, 0)
+        shops = list(self.shops().order_by('id'))
+        expected = JsonResponse({'results': ShopsSerializer(shops[5:10], many=True).data, 'next': shops[9].id})
+        self.assertEqual(self.client.get(f'/api/shop?limit=5&after={shops[4].id}').content, expected.content)
+
+    def test_reader_keys_match_serializers(self):
+        for reader, serializer_class in ((city_reader, CitySerializer), (street_reader, StreetSerializer),
+                                         (shop_reader, ShopsSerializer)):
+            readable = [name for name, field in serializer_class().fields.items() if not field.write_only]
+            self.assertEqual(list(reader.keys), readable)
+
+
+class RendererTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Самара')
+        street = Street.objects.create(name='Улица "1"', city_id=city)
+        for number in range(5):
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    def test_stdlib_renderer_matches_json_response(self):
+        data = [{'id': 1, 'name': 'Самара "1"'}, {'id': 2, 'name': None}]
+        with self.settings(JSON_RENDERER='json'):
+            self.assertEqual(json_response(data).content, JsonResponse(data, safe=False).content)
+
+    @skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_renderers_give_same_values(self):
+        data = {'datetime': datetime.datetime(2023, 3, 1, 9, 30, 15, 123456, tzinfo=datetime.timezone.utc),
+                'date': datetime.date(2023, 3, 1), 'time': datetime.time(9, 30), 'duration': datetime.timedelta(hours=2),
+                'decimal': decimal.Decimal('10.50'), 'uuid': uuid.UUID(int=1), 'lazy': gettext_lazy('Name'),
+                'unicode': 'Улица "1"\n', 'keys': {1: 'one'}, 'list': [1, 2.5, True, None]}
+        self.assertEqual(json.loads(renderers.OrjsonRenderer().dumps(data)),
+                         json.loads(renderers.StdlibJSONRenderer().dumps(data)))
+
+    @skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_views_give_same_values_with_each_renderer(self):
+        responses = {}
+        for name in ('json', 'orjson'):
+            with self.settings(JSON_RENDERER=name), mock.patch('tutorials.streaming.CHUNK_SIZE', 2):
+                cache.clear()
+                plain = self.client.get('/api/shop')
+                streamed = self.client.get('/api/shop?stream=1')
+                self.assertEqual(b''.join(streamed.streaming_content), plain.content, name)
+                responses[name] = plain.json()
+        self.assertEqual(responses['json'], responses['orjson'])
+
+    def test_setting_selects_renderer(self):
+        for setting, name in (('json', 'json'), ('orjson', 'orjson'), ('auto', 'orjson')):
+            if renderers.orjson is None and name == 'orjson':
+                continue
+            with self.settings(JSON_RENDERER=setting):
+                self.assertEqual(renderers.get_renderer().name, name)
+        with mock.patch('tutorials.renderers.orjson', None), self.settings(JSON_RENDERER='auto'):
+            self.assertEqual(renderers.get_renderer().name, 'json')
+        with mock.patch('tutorials.renderers.orjson', None), self.settings(JSON_RENDERER='orjson'):
+            renderers._renderers.pop('orjson', None)
+            self.assertRaises(ImproperlyConfigured, renderers.get_renderer)
+        with self.settings(JSON_RENDERER='yaml'):
+            self.assertRaises(ImproperlyConfigured, renderers.get_renderer)
+
+
+class CompressionTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Samara')
+        street = Street.objects.create(name='Street 1', city_id=city)
+        for number in range(50):
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    def test_gzip(self):
+        plain = self.client.get('/api/shop')
+        response = self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+
+    def test_streamed_response_is_compressed(self):
+        plain = self.client.get('/api/shop')
+        response = self.client.get('/api/shop?stream=1', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain.content)
+
+    def test_small_response_is_not_compressed(self):
+        size = len(self.client.get('/api/shop').content)
+        with self.settings(COMPRESSION_MIN_SIZE=size + 1):
+            self.assertFalse(self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+        with self.settings(COMPRESSION_MIN_SIZE=size):
+            self.assertEqual(self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+
+    def test_not_accepted_encoding(self):
+        for header in ('', 'identity', 'gzip;q=0', 'deflate'):
+            response = self.client.get('/api/shop', HTTP_ACCEPT_ENCODING=header)
+            self.assertFalse(response.has_header('Content-Encoding'), header)
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_conditional_request_with_weak_etag(self):
+        response = self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        response = self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_only_api_is_compressed(self):
+        response = self.client.get('/admin/login/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertGreater(len(response.content), settings.COMPRESSION_MIN_SIZE)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    @mock.patch('tutorials.middleware.brotli', None)
+    def test_gzip_without_brotli(self):
+        self.assertFalse(self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='br').has_header('Content-Encoding'))
+        self.assertEqual(self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='br, gzip')['Content-Encoding'], 'gzip')
+
+    @skipIf(middleware.brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        plain = self.client.get('/api/shop')
+        response = self.client.get('/api/shop', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content), plain.content)
+        response = self.client.get('/api/shop?stream=1', HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(middleware.brotli.decompress(b''.join(response.streaming_content)), plain.content)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(middleware._accepted_encodings('gzip, br;q=0.8, identity;q=0, *;q=bad, Deflate ; q=1'),
+                         {'gzip', 'br', 'deflate'})
+
+
+class ColumnarFormatTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for city_name in ('Samara', 'Ulanovsk'):
+            city = City.objects.create(name=city_name)
+            for street_number in range(3):
+                street = Street.objects.create(name=f'Street {street_number}', city_id=city)
+                for number in range(4):
+                    Shops.objects.create(name=f'Shop {number}', street_id=street, house=str(number),
+                                         open_minute=number * 6 * 60, close_minute=(number * 6 + 12) * 60)
+        cls.city = City.objects.get(name='Samara')
+
+    def assertRoundTrip(self, url, **headers):
+        plain = self.client.get(url)
+        columnar = self.client.get(url + ('&' if '?' in url else '?') + 'format=columnar', **headers)
+        self.assertEqual(columnar.status_code, 200)
+        self.assertEqual(columnar['Content-Type'], MEDIA_TYPE)
+        self.assertEqual(decode_columns(columnar.json()), plain.json(), url)
+        return plain, columnar
+
+    @mock.patch('datetime.datetime')
+    def test_shops_round_trip(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(9, 0)
+        for url in ('/api/shop', '/api/shop?open=1', '/api/shop?open=0', f'/api/shop?city={self.city.id}'):
+            self.assertRoundTrip(url)
+
+    def test_streets_round_trip(self):
+        self.assertRoundTrip(f'/api/street?city_id={self.city.id}')
+
+    def test_names_are_sent_once(self):
+        plain, columnar = self.assertRoundTrip('/api/shop')
+        data = columnar.json()
+        self.assertEqual(data['count'], 24)
+        self.assertEqual(data['dictionaries'], {'street_id': ['Street 0', 'Street 1', 'Street 2'],
+                                                'city_name': ['Samara', 'Ulanovsk']})
+        self.assertEqual(data['columns']['city_name'], [0] * 12 + [1] * 12)
+        self.assertLess(len(columnar.content) * 2, len(plain.content))
+
+    def test_empty_list(self):
+        response = self.client.get('/api/shop?city=0&format=columnar')
+        self.assertEqual(response.json()['count'], 0)
+        self.assertEqual(list(response.json()['columns']), list(shop_reader.keys))
+        self.assertEqual(decode_columns(response.json()), [])
+
+    def test_page_round_trip(self):
+        plain = self.client.get('/api/shop?limit=5&after=3').json()
+        columnar = self.client.get('/api/shop?limit=5&after=3&format=columnar').json()
+        self.assertEqual(columnar['next'], plain['next'])
+        self.assertEqual(decode_columns(columnar['results']), plain['results'])
+
+    def test_accept_header(self):
+        url = f'/api/street?city_id={self.city.id}'
+        plain = self.client.get(url)
+        columnar = self.client.get(url, HTTP_ACCEPT=MEDIA_TYPE)
+        self.assertEqual(columnar['Content-Type'], MEDIA_TYPE)
+        self.assertEqual(decode_columns(columnar.json()), plain.json())
+        self.assertNotEqual(columnar['ETag'], plain['ETag'])
+        self.assertIn('Accept', columnar['Vary'])
+
+    def test_errors_are_plain_json(self):
+        response = self.client.get('/api/street?format=columnar')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), 'kakoi gorod to?')
+
+    def test_cities_have_no_columnar_format(self):
+        self.assertEqual(self.client.get('/api/city?format=columnar').status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='podrygomy.async_urls')
+class AsyncViewTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for city_name in ('Samara', 'Ulanovsk'):
+            city = City.objects.create(name=city_name)
+            for street_number in range(2):
+                street = Street.objects.create(name=f'Street {street_number}', city_id=city)
+                for open_time, close_time in ((8, 22), (22, 2), (0, 24)):
+                    open_minute, close_minute = opening_window(open_time * 60, close_time * 60)
+                    Shops.objects.create(name=f'Shop {open_time}', street_id=street, house='1',
+                                         open_minute=open_minute, close_minute=close_minute)
+        cls.city = City.objects.get(name='Samara')
+
+    # Ответ синхронного представления из views.py
+    def sync_get(self, url, **headers):
+        cache.clear()
+        with self.settings(ROOT_URLCONF='podrygomy.urls'):
+            response = self.client.get(url, **headers)
+        cache.clear()
+        return response
+
+    def test_views_are_async(self):
+        for view in (async_views.cities, async_views.streets_by_city_id, async_views.create_shop):
+            self.assertTrue(asyncio.iscoroutinefunction(view))
+
+    @mock.patch('datetime.datetime')
+    async def test_same_responses_as_sync_views(self, mocked_datetime):
+        mocked_datetime.now.return_value = datetime.time(23, 0)
+        for url in ('/api/city', '/api/city?limit=1', f'/api/street?city_id={self.city.id}',
+                    f'/api/street?city_id={self.city.id}&format=columnar', '/api/street', '/api/street?city_id=0',
+                    '/api/shop', '/api/shop?open=1', '/api/shop?open=0', f'/api/shop?city={self.city.id}&open=1',
+                    '/api/shop?limit=2&after=1', '/api/shop?limit=0', '/api/shop?format=columnar',
+                    '/api/shop?q=Shop%202&limit=2&offset=1', '/api/shop?q=', '/api/street?q=Stret'):
+            expected = await sync_to_async(self.sync_get)(url)
+            response = await self.async_client.get(url)
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content), url)
+            self.assertEqual(response['Content-Type'], expected['Content-Type'], url)
+
+    async def test_columnar_by_accept_header(self):
+        url = f'/api/street?city_id={self.city.id}'
+        expected = await sync_to_async(self.sync_get)(url, HTTP_ACCEPT=MEDIA_TYPE)
+        response = await self.async_client.get(url, ACCEPT=MEDIA_TYPE)
+        self.assertEqual(response['Content-Type'], MEDIA_TYPE)
+        self.assertEqual(response.content, expected.content)
+
+    # Поток под ASGI не поддерживается: вместо молчаливой выдачи всего списка - 400.
+    # С пагинацией, поиском и колоночным форматом stream, как и в views.py, не используется
+    async def test_stream_is_rejected(self):
+        expected = await sync_to_async(self.sync_get)('/api/shop?stream=1')
+        self.assertTrue(expected.streaming)
+        response = await self.async_client.get('/api/shop?stream=1')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), async_views.STREAM_NOT_SUPPORTED)
+        for url in ('/api/shop?stream=1&limit=2', '/api/shop?stream=1&format=columnar', '/api/shop?stream=1&q=Shop',
+                    '/api/city?stream=1', f'/api/street?city_id={self.city.id}&stream=1'):
+            expected = await sync_to_async(self.sync_get)(url)
+            response = await self.async_client.get(url)
+            self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content), url)
+
+    # Формат выбирается как в DRF: неизвестный format - 404, неподходящий Accept - 406, браузерный API - HTML
+    async def test_same_format_negotiation_as_sync_views(self):
+        for url, accept in (('/api/city?format=columnar', '*/*'), ('/api/city?format=xml', '*/*'),
+                            ('/api/shop?format=xml', '*/*'), ('/api/city?format=json', '*/*'),
+                            (f'/api/street?city_id={self.city.id}&format=json', '*/*'),
+                            ('/api/city', 'application/xml'), ('/api/shop', MEDIA_TYPE),
+                            ('/api/city', MEDIA_TYPE), ('/api/shop?format=api', '*/*'), ('/api/city', 'text/html')):
+            expected = await sync_to_async(self.sync_get)(url, HTTP_ACCEPT=accept)
+            response = await self.async_client.get(url, ACCEPT=accept)
+            self.assertEqual(response.status_code, expected.status_code, (url, accept))
+            self.assertEqual(response['Content-Type'], expected['Content-Type'], (url, accept))
+            if not expected['Content-Type'].startswith('text/html'):
+                self.assertEqual(response.content, expected.content, (url, accept))
+
+    async def test_response_cache_and_etag(self):
+        response = await self.async_client.get('/api/shop')
+        self.assertEqual((await self.async_client.get('/api/shop', IF_NONE_MATCH=response['ETag'])).status_code, 304)
+        await self.async_client.post('/api/city', {'name': 'Penza'}, content_type='application/json')
+        self.assertEqual((await self.async_client.get('/api/shop', IF_NONE_MATCH=response['ETag'])).status_code, 200)
+
+    # Тело отправляется JSON: multipart-тело AsyncClient в Django 4.1 не дочитывается парсером DRF
+    async def test_writes_go_through_sync_views(self):
+        response = await self.async_client.post('/api/shop', {'name': 'New Shop', 'street_id': 'New Street',
+                                                              'city': 'Penza', 'house': '1', 'open_time': '8',
+                                                              'close_time': '22'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['city_name'], 'Penza')
+        self.assertIn('Penza', [city['name'] for city in (await self.async_client.get('/api/city')).json()])
+        response = await self.async_client.post('/api/street', {'name': 'Street 0', 'city_id': 'Samara'},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((await self.async_client.put('/api/city')).status_code, 405)
+
+    async def test_no_cities(self):
+        await Shops.objects.all().adelete()
+        await Street.objects.all().adelete()
+        await City.objects.all().adelete()
+        response = await self.async_client.get('/api/city')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), 'NET GORODOV')
+
+
+class ConnectionSettingsTest(TestCase):
+    def conn_max_age(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            return project_settings.get_env_conn_max_age()
+
+    def test_persistent_connections_are_opt_in(self):
+        with mock.patch.dict(os.environ), mock.patch.object(project_settings, 'SQL_POOL_SIZE', 0):
+            os.environ.pop('SQL_CONN_MAX_AGE', None)
+            os.environ.pop('ASYNC_VIEWS', None)
+            self.assertEqual(self.conn_max_age(), 0)
+            self.assertEqual(self.conn_max_age(SQL_CONN_MAX_AGE='60'), 60)
+            self.assertIsNone(self.conn_max_age(SQL_CONN_MAX_AGE='none'))
+            # Под ASGI соединения не сохраняются между запросами
+            self.assertEqual(self.conn_max_age(SQL_CONN_MAX_AGE='60', ASYNC_VIEWS='1'), 0)
+        with mock.patch.object(project_settings, 'SQL_POOL_SIZE', 4):
+            self.assertEqual(self.conn_max_age(SQL_CONN_MAX_AGE='60'), 0)
+
+
+class PooledConnectionTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.name = os.path.join(directory.name, 'pool.sqlite3')
+
+    def wrapper(self, pool_size=2, health_checks=True):
+        settings_dict = dict(connection.settings_dict, ENGINE='tutorials.backends.sqlite3', NAME=self.name,
+                             CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=health_checks, POOL_SIZE=pool_size)
+        wrapper = PooledSQLiteWrapper(settings_dict, alias='pool')
+        self.addCleanup(lambda: wrapper.pool and wrapper.pool.close_all())
+        return wrapper
+
+    def test_connection_is_reused(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        self.assertIsNone(wrapper.connection)
+        self.assertEqual(len(wrapper.pool), 1)
+
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, raw)
+        self.assertEqual(len(wrapper.pool), 0)
+        wrapper.close()
+
+    def test_pool_keeps_at_most_pool_size_connections(self):
+        first, second = self.wrapper(pool_size=1), self.wrapper(pool_size=1)
+        first.ensure_connection()
+        second.ensure_connection()
+        raw = second.connection
+        first.close()
+        second.close()
+        self.assertEqual(len(first.pool), 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            raw.execute('SELECT 1')
+
+    def test_broken_connection_is_replaced(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        wrapper.close()
+        raw.close()
+
+        wrapper.ensure_connection()
+        self.assertIsNot(wrapper.connection, raw)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        wrapper.close()
+
+    def test_open_transaction_is_rolled_back(self):
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id integer)')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO item VALUES (1)')
+        wrapper.close()
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM item')
+            self.assertEqual(cursor.fetchone(), (0,))
+        wrapper.close()
+
+
+class MetricsTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        city = City.objects.create(name='Samara')
+        street = Street.objects.create(name='Street', city_id=city)
+        for number in range(3):
+            Shops.objects.create(name=f'Shop {number}', street_id=street, house='1',
+                                 open_minute=8 * 60, close_minute=22 * 60)
+
+    def setUp(self):
+        super().setUp()
+        metrics.clear()
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        return response, len(context.captured_queries)
+
+    def test_server_timing_header(self):
+        response, queries = self.get('/api/city')
+        self.assertGreater(queries, 0)
+        self.assertRegex(response['Server-Timing'],
+                         r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="%d queries", serialize;dur=[\d.]+$' % queries)
+
+    def test_requests_are_recorded_per_endpoint(self):
+        first, first_queries = self.get('/api/shop')
+        second, second_queries = self.get('/api/shop?open=1')
+        self.get('/api/city')
+
+        labels = ('api/shop', 'GET')
+        self.assertEqual(metrics.requests_total.get(labels + ('200',)), 2)
+        _, total, count = metrics.db_queries.get(labels)
+        self.assertEqual((total, count), (first_queries + second_queries, 2))
+        _, total, count = metrics.response_size.get(labels)
+        self.assertEqual((total, count), (len(first.content) + len(second.content), 2))
+        self.assertEqual(metrics.request_duration.get(labels)[2], 2)
+        self.assertGreater(metrics.serialize_duration.get(labels)[1], 0)
+        self.assertEqual(metrics.requests_total.get(('api/city', 'GET', '200')), 1)
+
+    def test_errors_and_writes_are_recorded(self):
+        self.client.get('/api/street?city_id=abc')
+        self.client.post('/api/city', {'name': 'Penza'})
+        self.assertEqual(metrics.requests_total.get(('api/street', 'GET', '400')), 1)
+        self.assertEqual(metrics.requests_total.get(('api/city', 'POST', '201')), 1)
+        self.assertGreater(metrics.serialize_duration.get(('api/city', 'POST'))[1], 0)
+
+    def test_unknown_methods_share_one_series(self):
+        for number in range(50):
+            response = self.client.generic(f'X{number}', '/api/city')
+            self.assertEqual(response.status_code, 405)
+        self.assertEqual(metrics.requests_total.get(('api/city', 'other', '405')), 50)
+        self.assertEqual(len(metrics.request_duration._series), 1)
+        self.assertEqual(metrics.render_prometheus().count('shops_requests_total{'), 1)
+
+    def test_unmatched_paths_are_not_recorded(self):
+        response = self.client.get('/api/unknown')
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('Server-Timing', response)
+        self.assertEqual(metrics.render_prometheus().count('shops_requests_total{'), 0)
+
+    def test_streaming_response_is_recorded_after_reading(self):
+        response, _ = self.get('/api/shop?stream=1')
+        labels = ('api/shop', 'GET')
+        self.assertIsNone(metrics.response_size.get(labels))
+        content = b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(metrics.response_size.get(labels)[1], len(content))
+        self.assertGreater(metrics.db_queries.get(labels)[1], 0)
+
+    @override_settings(ROOT_URLCONF='podrygomy.async_urls')
+    async def test_async_views_count_queries(self):
+        response = await self.async_client.get('/api/city')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response)
+        _, total, count = metrics.db_queries.get(('api/city', 'GET'))
+        self.assertEqual(count, 1)
+        self.assertGreater(total, 0)
+
+    def test_prometheus_endpoint(self):
+        self.client.get('/api/city')
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        lines = response.content.decode().splitlines()
+        self.assertIn('# TYPE shops_request_duration_seconds histogram', lines)
+        self.assertIn('shops_requests_total{endpoint="api/city",method="GET",status="200"} 1', lines)
+        self.assertIn('shops_db_queries_count{endpoint="api/city",method="GET"} 1', lines)
+        self.assertIn('shops_request_duration_seconds_bucket{endpoint="api/city",method="GET",le="+Inf"} 1', lines)
+
+    def test_prometheus_endpoint_is_internal_only(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='::1').status_code, 200)
+        with self.settings(METRICS_ALLOWED_NETWORKS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code, 200)
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test', 'Test', (1, 5), ('endpoint',))
+        for value in (0, 1, 3, 7):
+            histogram.observe(('a',), value)
+        self.assertEqual(list(histogram.samples()), [
+            ('_bucket', ('a', '1'), ('le',), 2),
+            ('_bucket', ('a', '5'), ('le',), 3),
+            ('_bucket', ('a', '+Inf'), ('le',), 4),
+            ('_sum', ('a',), (), 11),
+            ('_count', ('a',), (), 4),
+        ])
+
+
+class LoggingTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Samara')
+        street = Street.objects.create(name='Street', city_id=cls.city)
+        Shops.objects.create(name='Shop', street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    # Запросы к API на уровне логирования level: число запросов к БД и записи логов tutorials.
+    # Созданные объекты откатываются, кэши сбрасываются, чтобы каждый прогон выполнял одинаковую работу
+    def run_requests(self, level):
+        logger = logging.getLogger('tutorials')
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        old_level = logger.level
+        logger.setLevel(level)
+        logger.addHandler(handler)
+        try:
+            with CaptureQueriesContext(connection) as context, transaction.atomic():
+                statuses = [
+                    self.client.get('/api/city').status_code,
+                    self.client.get(f'/api/street?city_id={self.city.id}').status_code,
+                    self.client.get('/api/street?city_id=abc').status_code,
+                    self.client.get('/api/shop?open=1').status_code,
+                    self.client.get('/api/shop?limit=1').status_code,
+                    self.client.get('/api/shop').status_code,
+                    self.client.post('/api/city', {'name': 'Penza'}).status_code,
+                    self.client.post('/api/street', {'name': 'New Street', 'city_id': 'Penza'}).status_code,
+                    self.client.post('/api/shop', {'name': 'New Shop', 'street_id': 'Other Street', 'city': 'Tula',
+                                                   'house': '1', 'open_time': '8', 'close_time': '22'}).status_code,
+                    self.client.post('/api/shop', [{'name': 'Bulk Shop', 'street_id': 'Street', 'city': 'Samara',
+                                                    'house': '2', 'open_time': '8', 'close_time': '22'}],
+                                     content_type='application/json').status_code,
+                ]
+                b''.join(self.client.get('/api/shop?stream=1').streaming_content)
+                self.assertEqual(statuses, [200, 200, 400, 200, 200, 200, 201, 201, 201, 201])
+                transaction.set_rollback(True)
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(old_level)
+            cache.clear()
+            clear_lookup_caches()
+        return len(context.captured_queries), records
+
+    def test_query_count_does_not_depend_on_log_level(self):
+        debug_queries, debug_records = self.run_requests(logging.DEBUG)
+        warning_queries, warning_records = self.run_requests(logging.WARNING)
+        self.assertEqual(debug_queries, warning_queries)
+        self.assertGreater(len(debug_records), len(warning_records))
+
+    def test_log_arguments_are_not_evaluated_querysets(self):
+        _, records = self.run_requests(logging.DEBUG)
+        for record in records:
+            for arg in record.args or ():
+                self.assertNotIsInstance(arg, (QuerySet, Model), record.msg)
+
+    def test_queue_handler_writes_in_background(self):
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream)
+        handler.setFormatter(logging.Formatter('{levelname} {message}', style='{'))
+        logger = logging.Logger('queue-test')
+        logger.addHandler(handler)
+        try:
+            logger.warning("Shop %s created", 1)
+            logger.error("Shop %s failed", 2)
+            handler.flush()
+            self.assertEqual(stream.getvalue(), 'WARNING Shop 1 created\nERROR Shop 2 failed\n')
+            logger.warning("After flush")
+        finally:
+            handler.close()
+        self.assertTrue(stream.getvalue().endswith('WARNING After flush\n'))
+
+
+class ShopListingTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = City.objects.create(name='Samara', timezone='Europe/Samara')
+        cls.street = Street.objects.create(name='Street 1', city_id=cls.city)
+        cls.shop = Shops.objects.create(name='Shop', street_id=cls.street, house='1', open_minute=8 * 60,
+                                        close_minute=22 * 60)
+
+    def listing_names(self):
+        return list(ShopListing.objects.order_by('id').values_list('name', 'street_name', 'city_name', 'timezone'))
+
+    def assertConsistent(self):
+        self.assertEqual(listing.check(), {'missing': [], 'extra': [], 'different': []})
+
+    def test_shop_created_by_serializer_is_listed(self):
+        response = self.client.post('/api/shop', {'name': 'New', 'street_id': 'Street 2', 'city': 'Tula',
+                                                  'house': '2', 'open_time': '22', 'close_time': '2'})
+        self.assertEqual(response.status_code, 201)
+        row = ShopListing.objects.get(id=response.json()['id'])
+        self.assertEqual((row.street_name, row.city_name, row.open_minute, row.close_minute),
+                         ('Street 2', 'Tula', 22 * 60, 26 * 60))
+        self.assertConsistent()
+
+    def test_bulk_created_shops_are_listed(self):
+        response = self.client.post('/api/shop', [{'name': f'Bulk {number}', 'street_id': 'Street 1', 'city': 'Samara',
+                                                   'house': '1', 'open_time': '8', 'close_time': '22'}
+                                                  for number in range(3)], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(ShopListing.objects.count(), 4)
+        self.assertConsistent()
+
+    def test_renames_and_timezone_are_propagated(self):
+        self.city.name = 'Samara 2'
+        self.city.timezone = 'Europe/Moscow'
+        self.city.save()
+        self.street.name = 'Street 3'
+        self.street.save()
+        self.assertEqual(self.listing_names(), [('Shop', 'Street 3', 'Samara 2', 'Europe/Moscow')])
+        self.assertConsistent()
+
+    # Если строку витрины записать не удалось, магазин тоже не сохраняется
+    def test_shop_is_not_created_without_listing_row(self):
+        with mock.patch('tutorials.listing.save_shop', side_effect=DatabaseError('listing')):
+            with self.assertRaises(DatabaseError):
+                self.client.post('/api/shop', {'name': 'New', 'street_id': 'Street 1', 'city': 'Samara',
+                                               'house': '2', 'open_time': '8', 'close_time': '22'})
+        self.assertFalse(Shops.objects.filter(name='New').exists())
+        self.assertConsistent()
+
+    def test_shop_update_and_delete(self):
+        other = Street.objects.create(name='Street 2', city_id=City.objects.create(name='Tula'))
+        self.shop.name = 'Renamed'
+        self.shop.street_id = other
+        self.shop.save()
+        self.assertEqual(self.listing_names(), [('Renamed', 'Street 2', 'Tula', settings.TIME_ZONE)])
+        self.shop.delete()
+        self.assertFalse(ShopListing.objects.exists())
+
+    def test_get_reads_only_the_listing(self):
+        self.client.get('/api/shop')
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/shop?city={self.city.id}&n=1')
+        self.assertEqual([shop['city_name'] for shop in response.json()], ['Samara'])
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('JOIN', context.captured_queries[0]['sql'])
+
+    def test_check_reports_differences(self):
+        ShopListing.objects.filter(id=self.shop.id).update(city_name='Wrong')
+        ShopListing.objects.create(id=self.shop.id + 100, name='Extra', house='1', street_id=self.street.id,
+                                   street_name='Street 1', city_id=self.city.id, city_name='Samara',
+                                   timezone='Europe/Samara', open_minute=0, close_minute=60)
+        missing = Shops.objects.create(name='Missing', street_id=self.street, house='1', open_minute=0, close_minute=60)
+        ShopListing.objects.filter(id=missing.id).delete()
+        self.assertEqual(listing.check(), {'missing': [missing.id], 'extra': [self.shop.id + 100],
+                                           'different': [self.shop.id]})
+
+    def test_commands_rebuild_and_check(self):
+        ShopListing.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('check_shop_listing', stdout=io.StringIO(), stderr=io.StringIO())
+        stdout = io.StringIO()
+        call_command('rebuild_shop_listing', stdout=stdout)
+        self.assertIn('1 shops', stdout.getvalue())
+        call_command('check_shop_listing', stdout=stdout)
+        self.assertConsistent()
+
+
+class SearchTest(ViewTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.samara = City.objects.create(name='Samara')
+        cls.tula = City.objects.create(name='Tula')
+        for city, street_name, shop_names in ((cls.samara, 'Lenina', ('Magnit', 'Magnit 2', 'Magnat', 'Pyaterochka')),
+                                              (cls.tula, 'Lesnaya', ('Magnit', 'Dixy'))):
+            street = Street.objects.create(name=street_name, city_id=city)
+            for name in shop_names:
+                Shops.objects.create(name=name, street_id=street, house='1', open_minute=8 * 60, close_minute=22 * 60)
+
+    def found(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row['name'], row.get('city_name')) for row in response.json()['results']]
+
+    def test_trigrams_match_pg_trgm(self):
+        # show_trgm('cat') и similarity('word', 'two words') из документации pg_trgm
+        self.assertEqual(search.trigrams('Cat'), {'  c', ' ca', 'cat', 'at '})
+        self.assertAlmostEqual(search.similarity(search.trigrams('word'), search.trigrams('two words')), 4 / 11)
+
+    def test_prefix_matches_come_first_then_similar(self):
+        self.assertEqual(self.found('/api/shop?q=magnit'),
+                         [('Magnit', 'Samara'), ('Magnit', 'Tula'), ('Magnit 2', 'Samara'), ('Magnat', 'Samara')])
+
+    def test_typo_finds_similar_names(self):
+        self.assertEqual({name for name, _ in self.found('/api/shop?q=Magnet')}, {'Magnit', 'Magnit 2', 'Magnat'})
+        self.assertEqual(self.found('/api/shop?q=Pyatyorochka'), [('Pyaterochka', 'Samara')])
+        self.assertEqual(self.found('/api/shop?q=zzz'), [])
+
+    def test_search_keeps_filters(self):
+        self.assertEqual(self.found(f'/api/shop?q=Magnit&city={self.tula.id}'), [('Magnit', 'Tula')])
+
+    # Найденные id проверяются в БД по два, страница с фильтром может потребовать нескольких запросов
+    @mock.patch('tutorials.search.CHUNK_SIZE', 2)
+    def test_pages(self):
+        with self.query_budget(10):
+            response = self.client.get('/api/shop?q=magn&limit=2')
+            self.assertEqual([row['name'] for row in response.json()['results']], ['Magnat', 'Magnit'])
+            self.assertEqual(response.json()['next'], 2)
+            response = self.client.get(f'/api/shop?q=magn&limit=2&offset=2&city={self.samara.id}')
+            self.assertEqual([row['name'] for row in response.json()['results']], ['Magnit 2'])
+            self.assertIsNone(response.json()['next'])
+            response = self.client.get(f'/api/shop?q=magn&limit=1&offset=1&city={self.samara.id}')
+            self.assertEqual([row['name'] for row in response.json()['results']], ['Magnit'])
+            self.assertEqual(response.json()['next'], 2)
+
+    def test_streets_without_city(self):
+        self.assertEqual(self.client.get('/api/street?q=Le&limit=5').json()['results'],
+                         [{'id': Street.objects.get(name='Lenina').id, 'name': 'Lenina', 'city_id': 'Samara'},
+                          {'id': Street.objects.get(name='Lesnaya').id, 'name': 'Lesnaya', 'city_id': 'Tula'}])
+        self.assertEqual([row['name'] for row in self.client.get(
+            f'/api/street?q=Lesnya&city_id={self.tula.id}').json()['results']], ['Lesnaya'])
+        self.assertEqual(self.client.get('/api/street').status_code, 400)
+
+    def test_invalid_parameters(self):
+        for url in ('/api/shop?q=', '/api/shop?q=%20', '/api/shop?q=' + 'a' * 31, '/api/shop?q=a&limit=0',
+                    '/api/shop?q=a&offset=-1', '/api/street?q=a&city_id=abc', '/api/shop?q=caf&limit=²',
+                    '/api/shop?q=caf&offset=²', f'/api/shop?q=a&offset={search.MAX_OFFSET + 1}'):
+            self.assertEqual(self.client.get(url).status_code, 400, url)
+
+    @mock.patch('tutorials.search.MAX_OFFSET', 2)
+    def test_pages_end_at_max_offset(self):
+        self.assertEqual(self.client.get('/api/shop?q=magn&limit=1&offset=1').json()['next'], 2)
+        response = self.client.get('/api/shop?q=magn&limit=1&offset=2')
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertIsNone(response.json()['next'])
+        self.assertEqual(self.client.get('/api/shop?q=magn&offset=3').status_code, 400)
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.found('/api/shop?q=Auchan'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/shop', {'name': 'Auchan', 'street_id': 'Lenina', 'city': 'Samara', 'house': '2',
+                                           'open_time': '8', 'close_time': '22'})
+        self.assertEqual(self.found('/api/shop?q=Auchan'), [('Auchan', 'Samara')])
+        with self.captureOnCommitCallbacks(execute=True):
+            Shops.objects.filter(name='Auchan').get().delete()
+        self.assertEqual(self.found('/api/shop?q=Auchan'), [])
+
+    # Индекс в памяти меняется после коммита записи и не перестраивается по всей таблице
+    def test_index_is_updated_without_rebuild(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL searches in SQL without the in-memory index')
+        self.found('/api/shop?q=Magnit')
+        self.found('/api/street?q=Lenina')
+        indexes = dict(search._indexes)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/shop', {'name': 'Auchan', 'street_id': 'Lenina', 'city': 'Samara',
+                                           'house': '2', 'open_time': '8', 'close_time': '22'})
+            self.client.post('/api/shop', [{'name': 'Lenta', 'street_id': 'Kirova', 'city': 'Tula', 'house': '3',
+                                            'open_time': 9, 'close_time': 21}], content_type='application/json')
+        self.assertEqual(self.found('/api/shop?q=Auchan'), [('Auchan', 'Samara')])
+        self.assertEqual(self.found('/api/shop?q=Lenta'), [('Lenta', 'Tula')])
+        self.assertEqual([row['name'] for row in self.client.get('/api/street?q=Kirova').json()['results']],
+                         ['Kirova'])
+        # Откаченная запись в индекс не попадает
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            Shops.objects.filter(name='Dixy').get().delete()
+            transaction.set_rollback(True)
+        self.assertEqual(self.found('/api/shop?q=Dixy'), [('Dixy', 'Tula')])
+        self.assertEqual(search._indexes, indexes)
+
+    # Запись в обход сигналов индекс видит после перестройки, не позже SEARCH_INDEX_MAX_AGE секунд
+    @override_settings(SEARCH_INDEX_MAX_AGE=60)
+    def test_index_is_rebuilt_after_max_age(self):
+        if connection.vendor == 'postgresql':
+            self.skipTest('PostgreSQL searches in SQL without the in-memory index')
+        with mock.patch('tutorials.search.time.monotonic', return_value=1000):
+            self.assertEqual(self.found('/api/shop?q=Dixy'), [('Dixy', 'Tula')])
+            ShopListing.objects.filter(name='Dixy').update(name='Perekrestok')
+            self.assertEqual(self.found('/api/shop?q=Perekrestok'), [])
+        # update() не меняет и версию таблицы для кэша ответов
+        cache.clear()
+        with mock.patch('tutorials.search.time.monotonic', return_value=1060):
+            self.assertEqual(self.found('/api/shop?q=Perekrestok'), [('Perekrestok', 'Tula')])
+
+    def test_index_add_and_remove(self):
+        index = search.NameIndex([(1, 'Magnit'), (2, 'Dixy')])
+        index.add(3, 'Magnat')
+        index.add(2, 'Magnit 2')
+        index.remove(1)
+        index.remove(4)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(list(index.prefixed('magn')), [3, 2])
+        self.assertEqual([row_id for _, _, row_id in index.similar('Dixy')], [])
+        self.assertEqual(index.sorted, sorted(index.sorted))
+        self.assertEqual(index.postings, search.NameIndex([(3, 'Magnat'), (2, 'Magnit 2')]).postings)
+
+    # Запрос для PostgreSQL только компилируется: соединение с сервером для этого не нужно
+    def test_postgresql_query(self):
+        postgresql = PostgreSQLWrapper(dict(connection.settings_dict, ENGINE='django.db.backends.postgresql'),
+                                       alias='postgresql')
+        queryset = search._ranked_queryset(ShopListing.objects.all(), 'caf_%')
+        sql, params = queryset.query.get_compiler(connection=postgresql).as_sql()
+        self.assertIn('WHERE ("tutorials_shoplisting"."name" ILIKE %s OR "tutorials_shoplisting"."name" %% %s)', sql)
+        self.assertIn('ELSE SIMILARITY("tutorials_shoplisting"."name", %s)', sql)
+        self.assertEqual(params, ('caf\\_\\%%', search.PREFIX_RANK, 'caf_%', 'caf\\_\\%%', 'caf_%'))
+        self.assertIsNone(postgresql.connection)
+
+    # Поиск не регистрирует своих lookup, trigram_similar - из django.contrib.postgres
+    def test_trigram_lookup_is_django_one(self):
+        field = ShopListing._meta.get_field('name')
+        self.assertIs(field.get_lookup('trigram_similar'), TrigramSimilar)
+        self.assertIsNone(field.get_lookup('trigram_prefix'))
+
+    def test_similar_candidates_are_exact(self):
+        names = [f'{word}{number}' for word in ('Magnit', 'Magnat', 'Dixy', 'Lenta', 'Okey') for number in range(30)]
+        index = search.NameIndex(enumerate(names))
+        for query in ('Magnit1', 'Lentq 2', 'dixy 29', 'ok', 'x'):
+            query_trigrams = search.trigrams(query)
+            expected = sorted((-search.similarity(query_trigrams, search.trigrams(name)), name.lower(), row_id)
+                              for row_id, name in enumerate(names)
+                              if search.similarity(query_trigrams, search.trigrams(name)) >= search.SIMILARITY_THRESHOLD)
+            self.assertEqual(index.similar(query), expected, query)
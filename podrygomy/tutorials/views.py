@@ -1,29 +1,40 @@
-from django.db.models import Q
 from rest_framework import status
 from rest_framework.response import Response
 
+from .bulk import create_shops
+from .caching import cached_response
+from .columnar import RENDERER_CLASSES, columnar_response, wants_columnar
+from .filters import current_minutes, opening_bucket, shops_queryset, streets_queryset
+from .pagination import paginate
+from .readers import city_reader, shop_reader, street_reader
+from .renderers import json_response
+from .search import search_response
 from .serializers import *
-from rest_framework.decorators import api_view
-from django.http.response import JsonResponse
-import datetime
+from .streaming import stream_json_array
+from rest_framework.decorators import api_view, renderer_classes
 import logging
 
 
 _logger = logging.getLogger(__name__)
 
 
+@cached_response('city')
 @api_view(['GET', 'POST'])
 def cities(request):
     _logger.debug("Rest request %s /api/city received", request.method)
     if request.method == 'GET':
         var_cities = City.objects.all()
-        if not var_cities:
+        page = paginate(request, var_cities, city_reader)
+        if page is not None:
+            return page
+
+        rows = city_reader.rows(var_cities)
+        if not rows:
             _logger.warning("No cities were found in the database. 404 response is returned")
             return Response('NET GORODOV', status=status.HTTP_404_NOT_FOUND)
 
-        _logger.debug("Found %s cities", len(var_cities))
-        var_cities_serializer = CitySerializer(var_cities, many=True)
-        return JsonResponse(var_cities_serializer.data, safe=False)
+        _logger.debug("Found %s cities", len(rows))
+        return json_response(rows)
 
     elif request.method == 'POST':
         var_cities_serializer = CitySerializer(data=request.data)
@@ -35,18 +46,27 @@ def cities(request):
         return Response(var_cities_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@cached_response('street', 'city')
 @api_view(['GET', 'POST'])
+@renderer_classes(RENDERER_CLASSES)
 def streets_by_city_id(request):
     _logger.debug("Rest request %s /api/street received", request.method)
     if request.method == 'GET':
         var_city_id = request.query_params.get('city_id')
         _logger.debug("Parameter city_id %s received", var_city_id)
-        if var_city_id is None or not var_city_id.isdigit():
+        streets, error = streets_queryset(request.query_params)
+        if error is not None:
             _logger.warning("Parameter city_id %s not number. 400 response is returned", var_city_id)
-            return Response('kakoi gorod to?', status=status.HTTP_400_BAD_REQUEST)
-        streets = Street.objects.filter(city_id=var_city_id)
-        streets_serializer = StreetSerializer(streets, many=True)
-        return JsonResponse(streets_serializer.data, safe=False)
+            return Response(error, status=status.HTTP_400_BAD_REQUEST)
+        if 'q' in request.query_params:
+            return search_response(request, request.query_params, streets, street_reader, 'street', Street.objects.all())
+        page = paginate(request, streets, street_reader)
+        if page is not None:
+            return page
+
+        if wants_columnar(request):
+            return columnar_response(street_reader.columns(streets))
+        return json_response(street_reader.rows(streets))
 
     elif request.method == 'POST':
         street_serializer = StreetSerializer(data=request.data)
@@ -58,10 +78,23 @@ def streets_by_city_id(request):
         return Response(street_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@cached_response('shop', 'street', 'city', bucket=opening_bucket)
 @api_view(['GET', 'POST'])
+@renderer_classes(RENDERER_CLASSES)
 def create_shop(request):
     _logger.debug("Rest request %s /api/shop received", request.method)
-    if request.method == 'POST':
+    if request.method == 'POST' and isinstance(request.data, list):
+        _logger.debug("Bulk request with %s shops", len(request.data))
+        if not request.data:
+            return Response('pustoi spisok magazinov', status=status.HTTP_400_BAD_REQUEST)
+        shops, errors = create_shops(request.data)
+        if errors:
+            _logger.warning("The received data is not valid. 400 response is returned")
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        shops_serializer = ShopsSerializer(shops, many=True, context={'now': current_minutes(request)})
+        return Response(shops_serializer.data, status=status.HTTP_201_CREATED)
+
+    elif request.method == 'POST':
         shop_serializer = ShopsSerializer(data=request.data)
         if shop_serializer.is_valid():
             _logger.debug("The received data is valid. The shop start saving")
@@ -71,31 +104,21 @@ def create_shop(request):
         return Response(shop_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     elif request.method == 'GET':
-        _logger.info("Get shop request with parameters:")
-        var_street_id = request.query_params.get('street')
-        var_city_id = request.query_params.get('city')
-        var_open = request.query_params.get('open')
-        all_shops = Shops.objects.all()
-        if var_city_id is not None and var_city_id.isdigit():
-            _logger.info("Set city_id: %s", var_city_id)
-            streets = Street.objects.filter(city_id=var_city_id)
-            streets_id_list = [streets.id for streets in streets]
-            all_shops = all_shops.filter(street_id__in=streets_id_list)
-
-        if var_street_id is not None and var_street_id.isdigit():
-            _logger.info("Set street_id: %s", var_street_id)
-            all_shops = all_shops.filter(street_id=var_street_id)
-
-        if var_open is not None and var_open.isdigit():
-            _logger.info("Set open: %s", var_open)
-            now = datetime.datetime.now().hour
-            _logger.info("Time now: %s h", now)
-            # Описание __lt __gt
-            # https://stackoverflow.com/questions/64309821/difference-between-the-lte-and-gte-in-django
-            if int(var_open) == 0:
-                all_shops = all_shops.filter(Q(open_time__gt=now) | Q(close_time__lte=now))
-            elif int(var_open) == 1:
-                all_shops = all_shops.filter(open_time__lte=now, close_time__gt=now)
-
-        shops_s = ShopsSerializer(all_shops, many=True)
-        return JsonResponse(shops_s.data, safe=False)
+        now = current_minutes(request)
+        all_shops = shops_queryset(request.query_params, now)
+        if 'q' in request.query_params:
+            return search_response(request, request.query_params, all_shops, shop_reader, 'shop',
+                                   ShopListing.objects.all())
+        page = paginate(request, all_shops, shop_reader)
+        if page is not None:
+            return page
+
+        # Колоночный ответ компактный и собирается целиком, параметр stream для него не используется
+        if wants_columnar(request):
+            return columnar_response(shop_reader.columns(all_shops))
+
+        if request.query_params.get('stream') == '1':
+            _logger.debug("Streaming shops response")
+            return stream_json_array(all_shops, shop_reader)
+
+        return json_response(shop_reader.rows(all_shops))